@@ -0,0 +1,86 @@
+"""
+Memory benchmark of the in-memory postings of indexer.py.
+
+The documents of the CACM collection are tokenized the same way the indexer
+does, then the whole collection is loaded in a single in-memory block twice:
+once with the former Term objects (class level defaults and one dictionary of
+docid -> tf per term) and once with the compact Term of indexer.py (__slots__
+and a single array('I') of docid, tf pairs). The memory allocated by each
+block is measured with tracemalloc. The term strings are created before the
+measure, so only the dictionary of terms, the Term objects and their postings
+are counted. Both blocks must hold the same postings, the script stops if they
+do not.
+
+Usage: python benchmark_memory.py [folder]
+"""
+
+import sys
+import gc
+import tracemalloc
+import indexer
+import tokenizer
+from porterstemmer import stemword
+
+# the former Term object, with a dictionary of docid -> tf per term
+class DictTerm():
+    termid = 0
+    termfreq = 0
+    docs = 0
+    docids = {}
+
+def dictblock(documents):
+    database = {}
+    for docid, stream in documents:
+        for term in stream:
+            if not (term in database):
+                database[term] = DictTerm()
+                database[term].docids = dict()
+                database[term].docs = 0
+            docids = database[term].docids
+            if not (docid in docids):
+                database[term].docs += 1
+                docids[docid] = 0
+            docids[docid] += 1
+    return database
+
+def arrayblock(documents):
+    indexer.database = {}
+    indexer.postings = 0
+    for docid, stream in documents:
+        indexer.addterms(tokenizer.postings(docid, stream))
+    return indexer.database
+
+# memory allocated while build(documents) runs and kept by its result
+def measure(build, documents):
+    gc.collect()
+    tracemalloc.start()
+    block = build(documents)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return block, size
+
+if __name__ == '__main__':
+    folder = sys.argv[1] if len(sys.argv) > 1 else 'cacm'
+
+    # the whole collection goes in a single block
+    indexer.maxTerms = sys.maxsize
+    indexer.maxMemory = sys.maxsize
+
+    documents = []
+    for docid, filename in enumerate(indexer.listfiles(folder), 1):
+        documents.append((docid, list(tokenizer.terms(tokenizer.readlines(filename), tokenizer.enStopwords, 3, stemword))))
+
+    before, dictsize = measure(dictblock, documents)
+    after, arraysize = measure(arrayblock, documents)
+
+    postings = sum(len(term.docids) for term in before.values())
+    for token, term in before.items():
+        pairs = after[token].postings
+        if sorted(term.docids.items()) != sorted(zip(pairs[0::2], pairs[1::2])):
+            sys.exit('the blocks do not hold the same postings')
+
+    print('Documents %i, terms %i, postings %i' % (len(documents), len(before), postings))
+    for name, size in (('dict', dictsize), ('array', arraysize)):
+        print('%-6s %10i bytes %8.1f bytes/posting %8.1f bytes/term' % (name, size, float(size) / postings, float(size) / len(before)))
+    print('Memory saved %.1f%%' % (100.0 * (dictsize - arraysize) / dictsize))
@@ -0,0 +1,52 @@
+"""
+==================================================================================================
+
+BM25 weighting shared by the index writer (unit 4 and unit 7) and the search
+engine (unit 5).
+
+The BM25 score of a document for a query is the sum over the query terms of
+
+    idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / averagelength))
+
+where tf is the frequency of the term in the document, length the number of
+indexed terms of the document and averagelength the average over the
+collection. k1 sets how fast the score saturates with tf, b how much the long
+documents are penalized. The idf is the one of Lucene, which is never negative:
+
+    idf(t) = ln(1 + (N - df + 0.5) / (df + 0.5))
+
+The index writer can precompute the score of every posting (its impact) and
+quantize it to an integer between 1 and impactlevels: the impacts are divided
+by a single scale, the largest impact of the index over impactlevels. A search
+then only adds integers, and multiplies the totals by the scale at the end.
+
+Usage:
+
+    weight = idf(570, 12) * termweight(3, 120, 95.5, 1.2, 0.75)
+    impact = quantize(weight, scale)
+==================================================================================================
+"""
+
+import math
+
+# the usual values of the parameters
+defaultk1 = 1.2
+defaultb = 0.75
+
+# the impacts are quantized to 8 bits
+impactlevels = 255
+
+def idf(documents, docfreq):
+    """idf(documents, docfreq) returns the BM25 idf of a term found in docfreq of the documents."""
+    return math.log(1.0 + (documents - docfreq + 0.5) / (docfreq + 0.5))
+
+def termweight(tf, length, averagelength, k1=defaultk1, b=defaultb):
+    """termweight(tf, length, averagelength, k1, b) returns the BM25 weight of a
+    term found tf times in a document of length terms, before the idf.
+    """
+    ratio = float(length) / averagelength if averagelength > 0 else 1.0
+    return tf * (k1 + 1) / (tf + k1 * (1 - b + b * ratio))
+
+def quantize(score, scale):
+    """quantize(score, scale) returns the impact of a posting: its score in steps of scale, at least 1."""
+    return max(1, min(impactlevels, int(round(score / scale))))
@@ -21,19 +21,30 @@ Finally your indexer must implement the data model outlined as part of the assig
 """
 
 import sys, os, re
+import argparse
 import math
 import sqlite3
 import time
 import io
-from porterstemmer import PorterStemmer
+import hashlib
+import heapq
+import itertools
+import shutil
+import tempfile
+from array import array
+from joblib import Parallel, delayed
+from stemcache import CachedStemmer
+import tokenizer
+from tokenizer import enStopwords
+from indexwriter import IndexWriter
+import bm25
+from postingcodec import encodepostings, encodepositions
 
-enStopwords = {'and', 'ours', 'as', 'am', "mightn't", 'about', 'why', 'most', "you've", 'doing', 'under', 'didn', 'weren', "she's", 'yourselves', "mustn't", 'just', 'won', 'such', 'hadn', 'are', "you'd", 'mustn', "weren't", 'our', 'if', "don't", 'm', 'so', 'here', 'then', 'shan', 'during', 'it', 'were', 'the', 'with', "wasn't", 'yourself', 'off', 'been', 'or', 'for', 'own', 'too', 'nor', 'be', 'y', 'my', "you'll", 'from', 't', 'will', 'll', 'above', 'i', 'o', 'other', 'in', 'how', 'than', 'they', 'has', 'further', 'she', 'having', 'each', 'is', 'me', 'was', 'you', 're', 'until', 'on', 'we', 'by', 'between', 's', 'which', "haven't", 'at', 'ourselves', 'no', 'theirs', "shan't", 'out', 'his', 'this', 'of', 'ma', 'her', "didn't", 'their', 'can', "should've", 'couldn', 'myself', 'more', "that'll", 'there', 'them', 'your', 'ain', "needn't", 'against', 'a', 'wouldn', 'through', 'now', 'him', "isn't", 'whom', 'being', 'did', 'once', "hasn't", 'don', 'herself', 'only', 've', 'all', 'into', 'not', 'while', 'to', 'isn', 'when', "shouldn't", 'very', 'shouldn', 'because', 'needn', 'mightn', 'those', "wouldn't", 'both', 'an', 'below', 'again', "aren't", 'doesn', 'have', 'but', 'do', "won't", 'its', 'themselves', 'that', 'these', 'haven', 'before', 'does', 'hers', 'where', "couldn't", "hadn't", 'he', 'd', 'over', 'up', "doesn't", 'who', 'hasn', 'down', 'any', 'aren', "it's", "you're", 'same', 'himself', 'what', 'few', 'wasn', 'after', 'had', 'should', 'yours', 'some', 'itself'}
 # the database is a simple dictionnary
 database = {}
 
 # regular expression for: extract words, extract ID from path, check for hexa value
 chars = re.compile(r'\W+')
-atLeast3Chars = re.compile(r'\w{3,}')
 notDigit = re.compile(r'\D*')
 pattid = re.compile(r'(\d{3})/(\d{3})/(\d{3})')
 
@@ -42,16 +53,60 @@ tokens = 0
 documents = 0
 terms = 0
 stopWordsFound = 0
-stemmer = PorterStemmer()
+# the stems of the most frequent words are cached in front of the porter stemmer
+stemmer = CachedStemmer()
+
+# The code added:
+# ===================================================================
+# Blocking (SPIMI). The in-memory index is written to disk as a sorted run
+# whenever it holds maxTerms terms or its estimated size reaches maxMemory
+# bytes. The runs are merged into the database at the end of the indexing.
+# ===================================================================
+maxTerms = 50000
+maxMemory = 64 * 1024 * 1024
+# rough cost in bytes of a Term object with its empty arrays and dictionary entry, and of a
+# single posting (see benchmark_memory.py)
+termBytes = 170
+postingBytes = 10
+positionBytes = 4
+# number of postings and of positions currently held in memory
+postings = 0
+occurrences = 0
+# directory that holds the runs, the prefix of their file names and the list of runs written so far
+runFolder = None
+runPrefix = 'run'
+runs = []
+
+# The code added:
+# ===================================================================
+# Positional index. With --positions the position of every occurrence of a
+# term is kept too, and written to PostingPositions for the phrase and
+# proximity queries of the search engine.
+# ===================================================================
+positional = False
 
 #
 # We will create a term object for each unique instance of a term
 #
+# The code added:
+# ===================================================================
+# The postings of a term are kept in a growable array of unsigned ints
+# holding docid, tf, docid, tf, ... instead of a dictionary, and __slots__
+# removes the dictionary of the object itself. A document is tokenized in
+# full before the next one, so a posting is either the last one of the
+# array or a new one appended at the end. The positions of a positional
+# index are appended to a second array in the same order: the tf of a
+# posting tells how many of them belong to it.
+# ===================================================================
 class Term():
-    termid = 0
-    termfreq = 0
-    docs = 0
-    docids = {}
+    __slots__ = ('termid', 'termfreq', 'docs', 'postings', 'positions')
+
+    def __init__(self):
+        self.termid = 0
+        self.termfreq = 0
+        self.docs = 0
+        self.postings = array('I')
+        self.positions = array('I') if positional else None
 
     # The code added:
     # ===================================================================
@@ -67,98 +122,230 @@ def splitchars(line):
 
 # process the tokens of the source code
 def parsetoken(line):
-    global documents
+    return parselines((line,))
+
+# The code added:
+# ===================================================================
+# The lines go through the tokenizer pipeline in a single pass: split into
+# tokens, convert to lower case, ignore stop words, terms of 2 characters
+# or less and numbers, then stem the terms. The stemmer remembers the stems
+# of the words it has seen recently.
+# ===================================================================
+def parselines(lines):
     global tokens
-    global terms
     global stopWordsFound
-    global stemmer
 
-    # this replaces any tab characters with a space character in the line
-    # read from the file
-    line = line.replace('\t', ' ')
-    line = line.strip()
+    counts = tokenizer.TokenCounts()
+    if positional:
+        addpositionalterms(documents, tokenizer.positionalterms(lines, enStopwords, 3, stemmer.stem, counts))
+    else:
+        stream = tokenizer.terms(lines, enStopwords, 3, stemmer.stem, counts)
+        addterms(tokenizer.postings(documents, stream))
 
     #
-    # This routine splits the contents of the line into tokens
-    l = splitchars(line)
-
-    # for each token in the line process
-    for elmt in l:
-        # This statement removes the newline character if found
-        elmt = elmt.replace('\n', '')
-
-        # This statement converts all letters to lower case
-        lowerElmt = elmt.lower().strip()
-        
+    # Increment the counter of the number of tokens processed. This value will
+    # provide the total size of the corpus in terms of the number of terms in the
+    # entire collection
+    #
+    tokens += counts.terms
+    stopWordsFound += counts.stopwords
+    return True
 
-        isAlphaNumeric = chars.match(lowerElmt) is None
-        isAtLeast3chars = atLeast3Chars.match(lowerElmt) is not None
-        isAstopWord = elmt in enStopwords
-        if isAstopWord:
-            stopWordsFound += 1
+# add a stream of (term, docid) to the in-memory block
+def addterms(stream):
+    global postings
+
+    for token, docid in stream:
+        # if the term doesn't currently exist in the term dictionary
+        # then add the term. The TermId is assigned when the runs are merged.
+        term = database.get(token)
+        if term is None:
+            term = database[token] = Term()
+
+        # if the document is not currently in the postings
+        # list for the term then add it, else increment the counter
+        # that tracks the term frequency
+        #
+        pairs = term.postings
+        if pairs and pairs[-2] == docid:
+            pairs[-1] += 1
+        else:
+            pairs.append(docid)
+            pairs.append(1)
+            term.docs += 1
+            postings += 1
 
         # The code added:
         # ===================================================================
-        # The following condition implements requirement from the assignment:
-        # Ignore any term that begins with a punctionary character
-        # Ignore any term that is a number
-        # Ignore any term that is 2 characters or shorter in length
-        # Ignore stopword
+        # Write the block to disk once the term or memory budget is reached
         # ===================================================================
-        if isAtLeast3chars and isAlphaNumeric and not lowerElmt.isdigit() and not isAstopWord:
-            # The code added:
-            # ===================================================================
-            # Implement a porter stemmer to stem the tokens processed by your indexer routine. 
-            # ===================================================================
-            lowerElmt = stemmer.stem(lowerElmt, 0, len(lowerElmt) - 1)
-
-            #
-            # Increment the counter of the number of tokens processed. This value will
-            # provide the total size of the corpus in terms of the number of terms in the
-            # entire collection
-            #
-            tokens += 1
-
-            # if the term doesn't currently exist in the term dictionary
-            # then add the term
-            if not (lowerElmt in database.keys()):
-                terms += 1
-                database[lowerElmt] = Term()
-                database[lowerElmt].termid = terms
-                database[lowerElmt].docids = dict()
-                database[lowerElmt].docs = 0
-
-            # if the document is not currently in the postings
-            # list for the term then add it
-            #
-            if not (documents in database[lowerElmt].docids.keys()):
-                database[lowerElmt].docs += 1
-                database[lowerElmt].docids[documents] = 0
-
-            # Increment the counter that tracks the term frequency
-            database[lowerElmt].docids[documents] += 1
-
-    return l
+        if len(database) >= maxTerms or memoryused() >= maxMemory:
+            flushblock()
+
+# add the (term, position) stream of document docid to the in-memory block of a positional index
+def addpositionalterms(docid, stream):
+    global postings
+    global occurrences
+
+    for token, position in stream:
+        term = database.get(token)
+        if term is None:
+            term = database[token] = Term()
+
+        pairs = term.postings
+        if pairs and pairs[-2] == docid:
+            pairs[-1] += 1
+        else:
+            pairs.append(docid)
+            pairs.append(1)
+            term.docs += 1
+            postings += 1
+        term.positions.append(position)
+        occurrences += 1
+
+        if len(database) >= maxTerms or memoryused() >= maxMemory:
+            flushblock()
+
+# The code added:
+# ===================================================================
+# Estimate the number of bytes held by the in-memory block
+# ===================================================================
+def memoryused():
+    return len(database) * termBytes + postings * postingBytes + occurrences * positionBytes
+
+# The code added:
+# ===================================================================
+# Write the in-memory block to disk as a run sorted by term and empty it.
+# Each line of a run holds a term followed by its docid:tf pairs, in the
+# order the documents were indexed. A positional index writes
+# docid:tf:position,position,... instead.
+# ===================================================================
+def flushblock():
+    global database
+    global postings
+    global occurrences
+    global runFolder
+
+    if len(database) == 0:
+        return None
+
+    if runFolder is None:
+        runFolder = tempfile.mkdtemp(prefix='runs')
+
+    filename = os.path.join(runFolder, '%s%05d.txt' % (runPrefix, len(runs)))
+    with io.open(filename, 'w', encoding='utf-8') as run:
+        for token in sorted(database.keys()):
+            pairs = database[token].postings
+            if positional:
+                run.write(token + '\t' + ' '.join(positionalpostings(pairs, database[token].positions)) + '\n')
+            else:
+                run.write(token + '\t' + ' '.join('%d:%d' % pair for pair in zip(pairs[0::2], pairs[1::2])) + '\n')
+    runs.append(filename)
+
+    database = {}
+    postings = 0
+    occurrences = 0
+    return filename
+
+# the docid:tf:positions entries of a run for the postings and positions of a term
+def positionalpostings(pairs, positions):
+    start = 0
+    for docid, tf in zip(pairs[0::2], pairs[1::2]):
+        yield '%d:%d:%s' % (docid, tf, ','.join(map(str, positions[start:start + tf])))
+        start += tf
+
+# read a run back as a stream of (term, postings) tuples in term order
+def readrun(filename):
+    with io.open(filename, 'r', encoding='utf-8') as run:
+        for line in run:
+            token, _, docids = line.rstrip('\n').partition('\t')
+            yield token, docids
+
+# The code added:
+# ===================================================================
+# k-way merge of the runs. Only the postings of the current term are held
+# in memory while the runs are streamed into TermDictionary and Posting.
+# A posting split over two runs (the block was flushed in the middle of a
+# document) has its term frequencies added back together, and its positions.
+# termids maps the terms already stored in the index to their TermId, new
+# terms are numbered after the higher TermId (terms).
+# The statistics of every document (norm of its tf-idf vector, length and
+# number of unique terms) are accumulated along the way and written at the end.
+# ===================================================================
+def mergeruns(writer, termids=None):
+    global terms
+    global runFolder
+
+    flushblock()
+
+    if termids is None:
+        termids = {}
+    # docid -> [sum of the squared tf-idf weights, length, unique terms]
+    statistics = {}
+    count = len(runs)
+    stream = heapq.merge(*[readrun(f) for f in runs])
+    for token, group in itertools.groupby(stream, key=lambda entry: entry[0]):
+        docids = {}
+        positions = {}
+        for _, line in group:
+            for pair in line.split(' '):
+                fields = pair.split(':')
+                docid = int(fields[0])
+                docids[docid] = docids.get(docid, 0) + int(fields[1])
+                if len(fields) == 3:
+                    positions.setdefault(docid, []).extend(map(int, fields[2].split(',')))
+
+        term = Term()
+        term.termid = termids.get(token, 0)
+        if term.termid == 0:
+            terms += 1
+            term.termid = terms
+            writer.addterm(token, terms)
+        term.docs = len(docids)
+        idf = term.idf(documents)
+
+        for docid, termfreq in docids.items():
+            stats = statistics.get(docid)
+            if stats is None:
+                stats = statistics[docid] = [0.0, 0, 0]
+            stats[0] += (termfreq * idf) ** 2
+            stats[1] += termfreq
+            stats[2] += 1
+
+        if writer.positional:
+            for docid in sorted(positions):
+                writer.addpositions(term.termid, docid, encodepositions(sorted(positions[docid])))
+
+        if writer.compressed:
+            writer.addpostinglist(term.termid, term.docs, idf, encodepostings(sorted(docids.items())))
+            continue
+        for docid in sorted(docids):
+            termfreq = docids[docid]
+            writer.addposting(term.termid, docid, termfreq * idf, term.docs, termfreq)
+
+    for docid in sorted(statistics):
+        squares, length, unique = statistics[docid]
+        writer.adddocumentstatistics(docid, math.sqrt(squares), length, unique)
+
+    if runFolder is not None:
+        shutil.rmtree(runFolder, ignore_errors=True)
+        runFolder = None
+    del runs[:]
+    return count
 
 #
 # Open and read the file line by line, parsing for tokens and processing. All of the tokenizing
 
-# is done in the parsetoken() function. You should design your indexer program keeping the tokenizing
+# is done in the parsetoken() function. The file is streamed, only one line is held in memory. You should design your indexer program keeping the tokenizing
 # as a separate function that will process a string as you will be able to reuse code for
 # future assignments
 #
 def process(filename):
     try:
-        file = open(filename, 'r')
+        return parselines(tokenizer.readlines(filename))
     except IOError:
-        print
-        "Error in file %s" % filename
+        print("Error in file %s" % filename)
         return False
-    else:
-        with io.open(file.name, 'r', encoding='windows-1252') as unicode_file:
-            for l in unicode_file.readlines():
-                parsetoken(l)
-    file.close()
 
 #
 # This function will scan through the specified directory structure selecting
@@ -166,19 +353,244 @@ def process(filename):
 # Notices how this is a recursive function in that it calls itself to process
 # sub-directories.
 #
-def walkdir(cur, dirname):
-    global documents
-
+def listfiles(dirname):
     all = {}
     all = [f for f in os.listdir(dirname) if os.path.isdir(os.path.join(dirname, f)) or os.path.isfile(os.path.join(dirname, f))]
     for f in all:
         if os.path.isdir(dirname + '/' + f):
-            walkdir(cur, dirname + '/' + f)
+            yield from listfiles(dirname + '/' + f)
+        else:
+            yield dirname + '/' + f
+
+def walkdir(writer, dirname):
+    global documents
+
+    for filename in listfiles(dirname):
+        documents += 1
+        writer.adddocument(filename, documents)
+        fingerprints.append((documents,) + fingerprint(filename))
+        process(filename)
+
+    return True
+
+# The code added:
+# ===================================================================
+# Parallel indexing. The DocIds are assigned up front in the same order as
+# walkdir() would assign them, then the files are split into shards that
+# worker processes index into their own runs. The TermIds are assigned when
+# all the runs are merged, so both ids are consistent across the workers.
+# Every worker keeps its own block, so the memory budget applies per worker.
+# ===================================================================
+def indexshard(shard, files, folder, positions=False):
+    global database
+    global postings
+    global occurrences
+    global positional
+    global runs
+    global runFolder
+    global runPrefix
+    global documents
+    global tokens
+    global stopWordsFound
+
+    database = {}
+    postings = 0
+    occurrences = 0
+    positional = positions
+    runs = []
+    runFolder = folder
+    runPrefix = 'shard%05d-run' % shard
+    tokens = 0
+    stopWordsFound = 0
+    stemmer.hits = stemmer.misses = stemmer.evictions = 0
+
+    for docid, filename in files:
+        documents = docid
+        process(filename)
+    flushblock()
+
+    return runs, tokens, stopWordsFound, (stemmer.hits, stemmer.misses, stemmer.evictions)
+
+def walkdirparallel(writer, dirname, jobs):
+    global documents
+
+    files = []
+    for filename in listfiles(dirname):
+        documents += 1
+        writer.adddocument(filename, documents)
+        fingerprints.append((documents,) + fingerprint(filename))
+        files.append((documents, filename))
+
+    return indexfiles(files, jobs)
+
+# index the (docid, filename) pairs into runs, in this process when jobs is 1. jobs -1 (or 0)
+# uses every core; with a single core the files are indexed in this process too, as indexshard()
+# would otherwise reset the globals of this process and its runs would be merged twice
+def indexfiles(files, jobs):
+    global documents
+    global tokens
+    global stopWordsFound
+    global runFolder
+
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    if jobs == 1:
+        for docid, filename in files:
+            documents = docid
+            process(filename)
+        return True
+
+    if runFolder is None:
+        runFolder = tempfile.mkdtemp(prefix='runs')
+
+    # a few shards per worker so that a slow shard does not keep the others idle
+    size = max(1, math.ceil(len(files) / (jobs * 4)))
+    shards = [files[i:i + size] for i in range(0, len(files), size)]
+    results = Parallel(n_jobs=jobs)(delayed(indexshard)(n, shard, runFolder, positional) for n, shard in enumerate(shards))
+
+    for shardRuns, shardTokens, shardStopWords, shardStems in results:
+        runs.extend(shardRuns)
+        tokens += shardTokens
+        stopWordsFound += shardStopWords
+        stemmer.hits += shardStems[0]
+        stemmer.misses += shardStems[1]
+        stemmer.evictions += shardStems[2]
+
+    return True
+
+# The code added:
+# ===================================================================
+# Incremental indexing. A fingerprint (mtime, size and content hash) is kept
+# for every document. On a later run only the new, changed and deleted
+# documents are tokenized again: their old postings are removed, the new
+# ones are merged in, and df and tf-idf are fixed up for the terms they touch
+# (for every term when the number of documents changed, as idf depends on it).
+# ===================================================================
+fingerprints = []
+
+def fingerprint(filename):
+    stat = os.stat(filename)
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return stat.st_mtime_ns, stat.st_size, digest.hexdigest()
+
+def createfingerprints(cur):
+    cur.execute("drop table if exists DocumentFingerprint")
+    cur.execute("create table DocumentFingerprint (DocId integer primary key, mtime int, size int, hash text)")
+
+def writefingerprints(cur):
+    cur.executemany("insert or replace into DocumentFingerprint values (?, ?, ?, ?)", fingerprints)
+    del fingerprints[:]
+
+def indexexists(cur):
+    cur.execute("select count(*) from sqlite_master where type = 'table' and name in ('DocumentDictionary', 'TermDictionary', 'Posting', 'DocumentFingerprint')")
+    return cur.fetchone()[0] == 4
+
+def positionalindex(cur):
+    cur.execute("select count(*) from sqlite_master where type = 'table' and name = 'PostingPositions'")
+    return cur.fetchone()[0] == 1
+
+def impactindex(cur):
+    cur.execute("select count(*) from sqlite_master where type = 'table' and name = 'PostingImpact'")
+    return cur.fetchone()[0] == 1
+
+def reindex(writer, dirname, jobs):
+    global documents
+    global terms
+
+    cur = writer.cur
+    writer.open()
+
+    known = {}
+    cur.execute("select d.DocumentName, d.DocId, f.mtime, f.size, f.hash from DocumentDictionary d left join DocumentFingerprint f on f.DocId = d.DocId")
+    for name, docid, mtime, size, digest in cur.fetchall():
+        known[name] = (docid, mtime, size, digest)
+    cur.execute("select max(DocId) from DocumentDictionary")
+    lastDocId = cur.fetchone()[0] or 0
+    cur.execute("select max(TermId) from TermDictionary")
+    terms = cur.fetchone()[0] or 0
+    # an index built before DocumentStatistics existed has its statistics computed from scratch
+    cur.execute("select count(*) from DocumentStatistics")
+    nostatistics = cur.fetchone()[0] == 0
+
+    # sort the documents into unchanged, touched (only the fingerprint changed), changed and new
+    files = []
+    stale = []
+    added = []
+    seen = set()
+    for filename in listfiles(dirname):
+        seen.add(filename)
+        old = known.get(filename)
+        stat = os.stat(filename)
+        if old is not None and old[1] == stat.st_mtime_ns and old[2] == stat.st_size:
+            continue
+        mtime, size, digest = fingerprint(filename)
+        if old is not None and old[3] == digest:
+            fingerprints.append((old[0], mtime, size, digest))
+            continue
+        if old is None:
+            lastDocId += 1
+            docid = lastDocId
+            writer.adddocument(filename, docid)
+            added.append(docid)
         else:
-            documents += 1
-            cur.execute("insert into DocumentDictionary values (?, ?)", (dirname + '/' + f, documents))
-            process(dirname + '/' + f)
+            docid = old[0]
+            stale.append(docid)
+        fingerprints.append((docid, mtime, size, digest))
+        files.append((docid, filename))
+    deleted = [known[name][0] for name in known if name not in seen]
+
+    # drop the postings of the changed and deleted documents, remembering their terms
+    cur.execute("create temp table if not exists Reindexed (DocId integer primary key)")
+    cur.execute("create temp table if not exists Affected (TermId integer primary key)")
+    cur.execute("delete from temp.Reindexed")
+    cur.execute("delete from temp.Affected")
+    cur.executemany("insert into temp.Reindexed values (?)", [(d,) for d in stale + deleted])
+    cur.execute("insert or ignore into temp.Affected select TermId from Posting where DocId in (select DocId from temp.Reindexed)")
+    cur.execute("delete from Posting where DocId in (select DocId from temp.Reindexed)")
+    if writer.positional:
+        cur.execute("delete from PostingPositions where DocId in (select DocId from temp.Reindexed)")
+    cur.executemany("delete from DocumentDictionary where DocId = ?", [(d,) for d in deleted])
+    cur.executemany("delete from DocumentFingerprint where DocId = ?", [(d,) for d in deleted])
+
+    # tokenize the new and changed documents and merge their postings in
+    termids = {}
+    cur.execute("select Term, TermId from TermDictionary")
+    for token, termid in cur:
+        termids[token] = termid
+    indexfiles(files, jobs)
+    documents = len(known) + len(added) - len(deleted)
+    print("Runs merged %i" % mergeruns(writer, termids))
+    writer.flush()
+    writefingerprints(cur)
+
+    # fix up df, tf-idf and the dictionary for the affected terms
+    con = writer.con
+    con.create_function("log10", 1, math.log10)
+    cur.executemany("insert or ignore into temp.Reindexed values (?)", [(d,) for d in added])
+    cur.execute("insert or ignore into temp.Affected select TermId from Posting where DocId in (select DocId from temp.Reindexed)")
+    cur.execute("update Posting set docfreq = (select count(*) from Posting p where p.TermId = Posting.TermId) where TermId in (select TermId from temp.Affected)")
+    cur.execute("delete from TermDictionary where TermId in (select TermId from temp.Affected) and TermId not in (select TermId from Posting)")
+    if documents != len(known):
+        cur.execute("update Posting set tfidf = termfreq * log10(? * 1.0 / docfreq)", (documents,))
+    else:
+        cur.execute("update Posting set tfidf = termfreq * log10(? * 1.0 / docfreq) where TermId in (select TermId from temp.Affected)", (documents,))
+
+    # the norm of every document holding one of the affected terms changed with their tf-idf
+    con.create_function("sqrt", 1, math.sqrt)
+    if documents != len(known) or nostatistics:
+        cur.execute("delete from DocumentStatistics")
+        cur.execute("insert into DocumentStatistics select DocId, sqrt(sum(tfidf * tfidf)), sum(termfreq), count(*) from Posting group by DocId")
+    else:
+        cur.execute("insert or ignore into temp.Reindexed select DocId from Posting where TermId in (select TermId from temp.Affected)")
+        cur.execute("delete from DocumentStatistics where DocId in (select DocId from temp.Reindexed)")
+        cur.execute("insert into DocumentStatistics select DocId, sqrt(sum(tfidf * tfidf)), sum(termfreq), count(*) from Posting where DocId in (select DocId from temp.Reindexed) group by DocId")
 
+    print("Documents added %i, changed %i, deleted %i" % (len(added), len(stale), len(deleted)))
+    cur.execute("select count(*) from TermDictionary")
+    terms = cur.fetchone()[0]
     return True
 
 
@@ -191,6 +603,21 @@ This section is the 'main' or starting point of the indexer program. The python
 
 """
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the inverted index of a corpus into cacm.db')
+    parser.add_argument('folder', nargs='?', default='cacm', help='directory holding the corpus')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes, -1 uses every core')
+    parser.add_argument('--incremental', action='store_true', help='only index the new, changed and deleted documents')
+    parser.add_argument('--compressed', action='store_true', help='store each posting list as one compressed blob (PostingList table)')
+    parser.add_argument('--positions', action='store_true', help='also store the positions of the terms (PostingPositions table) for phrase and proximity queries; '
+                        'an incremental update keeps them when the index has them')
+    parser.add_argument('--impacts', action='store_true', help='also store the quantized BM25 score of every posting (PostingImpact table); '
+                        'an incremental update computes them again when the index has them')
+    parser.add_argument('--k1', type=float, default=bm25.defaultk1, help='BM25 k1 of the impacts (default %(default)s)')
+    parser.add_argument('--b', type=float, default=bm25.defaultb, help='BM25 b of the impacts (default %(default)s)')
+    args = parser.parse_args()
+    if args.incremental and args.compressed:
+        parser.error('--incremental only supports the Posting table format')
+
     #
     # Capture the start time of the routine so that we can determine the total running
     # time required to process the corpus
@@ -203,71 +630,69 @@ if __name__ == "__main__":
     # directory or another directory that you choose. If you use another directory make sure that
     # you point folder to the appropriate directory.
     #
-    folder = "cacm"
+    folder = args.folder
 
     #
-    # Create a sqlite database to hold the inverted index. The isolation_level statment turns
-
-    # on autocommit which means that changes made in the database are committed automatically
+    # Create a sqlite database to hold the inverted index. The index writer loads the whole
+    # index in a single transaction with batched inserts
     #
     con = sqlite3.connect("cacm.db")
-    con.isolation_level = None
-    cursor = con.cursor()
-
-    #
-    # In the following section three tables and their associated indexes will be created.
-    # Before we create the table or index we will attempt to drop any existing tables in
-    # case they exist
-    #
-
-    # Document Dictionary Table
-    cursor.execute("drop table if exists DocumentDictionary")
-    cursor.execute("drop index if exists idxDocumentDictionary")
-    cursor.execute("create table if not exists DocumentDictionary (DocumentName text, DocId int)")
-    cursor.execute("create index if not exists idxDocumentDictionary on DocumentDictionary (DocId)")
-
-    # Term Dictionary Table
-    cursor.execute("drop table if exists TermDictionary")
-    cursor.execute("drop index if exists idxTermDictionary")
-    cursor.execute("create table if not exists TermDictionary (Term text, TermId int)")
-    cursor.execute("create index if not exists idxTermDictionary on TermDictionary (TermId)")
-
-    # Postings Table
-    cursor.execute("drop table if exists Posting")
-    cursor.execute("drop index if exists idxPosting1")
-    cursor.execute("drop index if exists idxPosting2")
-    cursor.execute("create table if not exists Posting (TermId int, DocId int, tfidf real, docfreq int, termfreq int)")
-    cursor.execute("create index if not exists idxPosting1 on Posting (TermId)")
-    cursor.execute("create index if not exists idxPosting2 on Posting (Docid)")
-
-    #
-    # The walkdir method essentially executes the indexer. The walkdir method will
-    # read the corpus directory, Scan all files, parse tokens, and create the inverted index.
-    #
-    walkdir(cursor, folder)
-
-    t2 = time.localtime()
-    print('Indexing Complete, write to disk: %.2d:%.2d' % (t2.tm_hour, t2.tm_min))
-
-    #
-    # Create the inverted index tables.
-    #
-    # Insert a row into the TermDictionary for each unique term along with a termid which is
-    # a integer assigned to each term by incrementing an integer
-    #
-    # Insert a row into the posting table for each unique combination of Docid and termid
-    #
-    #
-    for token, term in database.items():
-        termid = term.termid
-        cursor.execute("insert into TermDictionary values (?, ?)", (token, termid))
-        for documentId, docFrequency in term.docids.items():
-            cursor.execute("insert into Posting values (?, ?, ?, ?, ?)", (termid, documentId, term.idf(documents), docFrequency, term.termfreq))
+    incremental = args.incremental and indexexists(con.cursor())
+    positional = args.positions
+    impacts = args.impacts
+    if incremental:
+        impacts = impacts or impactindex(con.cursor())
+        # the positions of the documents that are not indexed again cannot be added afterwards
+        positional = positionalindex(con.cursor())
+        if args.positions and not positional:
+            parser.error('the index has no positions, build it again without --incremental to add them')
+    writer = IndexWriter(con, compressed=args.compressed, positional=positional, impacts=impacts, k1=args.k1, b=args.b)
+
+    if incremental:
+        #
+        # Update the existing index with the documents that were added, changed or deleted
+        # since the last run
+        #
+        reindex(writer, folder, args.jobs)
+    else:
+        #
+        # The tables (DocumentDictionary, TermDictionary, Posting and DocumentStatistics) are dropped if they
+        # exist and created again. Their indexes are only created once the rows are loaded
+        #
+        writer.create()
+        createfingerprints(writer.cur)
+
+        #
+        # The walkdir method essentially executes the indexer. The walkdir method will
+        # read the corpus directory, Scan all files, parse tokens, and create the inverted index.
+        #
+        if args.jobs == 1:
+            walkdir(writer, folder)
+        else:
+            walkdirparallel(writer, folder, args.jobs)
+
+        t2 = time.localtime()
+        print('Indexing Complete, write to disk: %.2d:%.2d' % (t2.tm_hour, t2.tm_min))
+
+        #
+        # Create the inverted index tables.
+        #
+        # The runs written during the indexing are merged term by term. Insert a row into the
+        # TermDictionary for each unique term along with a termid which is a integer assigned
+        # to each term by incrementing an integer in term order
+        #
+        # Insert a row into the posting table for each unique combination of Docid and termid
+        #
+        # Insert a row into the DocumentStatistics table for each document with the norm of
+        # its tf-idf vector, its length and its number of unique terms
+        #
+        print("Runs merged %i" % mergeruns(writer))
+        writefingerprints(writer.cur)
 
     #
-    # Commit changes to the database and close the connection
+    # Build the indexes, commit changes to the database and close the connection
     #
-    con.commit()
+    writer.close()
     con.close()
 
     #
@@ -277,5 +702,6 @@ if __name__ == "__main__":
     print("Terms %i" % terms)
     print("Tokens %i" % tokens)
     print("Stop Words Found %i" % stopWordsFound)
+    print(stemmer.stats())
     t2 = time.localtime()
     print('End Time: %.2d:%.2d' % (t2.tm_hour, t2.tm_min))
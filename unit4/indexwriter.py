@@ -0,0 +1,399 @@
+"""
+==================================================================================================
+
+Bulk index writer shared by the indexer (unit 4) and the web crawler (unit 7).
+
+Writing the inverted index one row at a time in autocommit mode makes sqlite
+sync the file to disk after every single insert, and maintaining the secondary
+indexes while the rows are loaded updates the B-trees on every insert too.
+
+This writer instead
+  - tunes the connection for a bulk load (journal mode, synchronous, cache size),
+    except the journal and the syncs of an update in place (open()), which
+    cannot be built again from scratch when it fails half way,
+  - wraps the whole load in one explicit transaction,
+  - buffers the rows and inserts them in batches with executemany(),
+  - creates the secondary indexes once all of the rows are loaded.
+
+Every document also gets a row in DocumentStatistics with the euclidean norm
+of its tf-idf vector, its length (number of indexed terms, counting repeats)
+and its number of unique terms, so that a search engine can normalize the
+scores of a document with a single lookup.
+
+Once the postings are loaded, TermStatistics gets the largest weight of every
+term over the documents, tf-idf divided by the norm of the document: an upper
+bound of what the term can add to the cosine similarity of any document, used
+to skip documents during a search (dynamic pruning).
+
+CollectionStatistics keeps the figures of the whole collection that the
+scorers of the search engine need: the number of documents and their average
+length for BM25 (see bm25.py). With impacts=True the BM25 score of every
+posting, computed with the k1 and b given to the writer and quantized to 8
+bits, is also stored in PostingImpact (one blob of docid, impact pairs per
+term, see postingcodec.py), together with k1, b and the scale of the impacts
+in CollectionStatistics. The impacts depend on the whole collection, so they
+are computed again for every generation of the index.
+
+Every index committed by close() is a new generation of the index: the
+user_version of the database is incremented, so that the caches of the
+search engine can tell that their results are stale. The terms of the new
+generation are also saved in a term dictionary file next to the database (see
+mmapdictionary.py).
+
+With compressed=True the postings of each term are written as a single blob
+in the PostingList table (see postingcodec.py) instead of the Posting table,
+with the skip pointers of the blob.
+
+With positional=True the index also keeps where the terms occur: the
+PostingPositions table holds the gap encoded token positions of every posting
+(see postingcodec.py), read by the phrase and proximity queries of the search
+engine. It is kept apart from the postings, so the queries without a phrase
+never read it, and it works with both formats.
+
+With simhashes=True the near-duplicate detection of the web crawler (unit 7)
+keeps the SimHash of every document in DocumentSimHash, and the URLs of the
+pages found to be near-duplicates of a document, which are not indexed, in
+DocumentDuplicate (see nearduplicates.py in unit 7). These tables are not the
+DocumentFingerprint table of the incremental indexer (unit 4), which keeps the
+modification time, size and hash of the files and is left alone.
+
+Usage:
+
+    writer = IndexWriter(con)
+    writer.create()
+    writer.adddocument('cacm/CACM-0001.html', 1)
+    writer.addterm('algebra', 1)
+    writer.addposting(1, 1, 0.45, 3, 2)
+    writer.adddocumentstatistics(1, 0.45, 2, 1)
+    writer.addpositions(1, 1, encodepositions([4, 17]))   # IndexWriter(con, positional=True)
+    writer.addsimhash(1, simhash(tokens))                # IndexWriter(con, simhashes=True)
+    writer.close()
+==================================================================================================
+"""
+
+import itertools
+import bm25
+from postingcodec import decodepostings, encodepostings, encodeskips
+from mmapdictionary import dictionaryfile, writedictionary
+
+class IndexWriter:
+
+    # The tables of the inverted index. The secondary indexes are listed apart
+    # because they are only built at the end of the load.
+    tables = [
+        ("DocumentDictionary", "create table if not exists DocumentDictionary (DocumentName text, DocId int)"),
+        ("TermDictionary", "create table if not exists TermDictionary (Term text, TermId int)"),
+        ("Posting", "create table if not exists Posting (TermId int, DocId int, tfidf real, docfreq int, termfreq int)"),
+        ("DocumentStatistics", "create table if not exists DocumentStatistics (DocId integer primary key, norm real, length int, terms int)"),
+        ("TermStatistics", "create table if not exists TermStatistics (TermId integer primary key, maxweight real)"),
+        ("CollectionStatistics", "create table if not exists CollectionStatistics (Name text primary key, value real)"),
+    ]
+    indexes = [
+        ("idxDocumentDictionary", "create index if not exists idxDocumentDictionary on DocumentDictionary (DocId)"),
+        ("idxTermDictionary", "create index if not exists idxTermDictionary on TermDictionary (TermId)"),
+        ("idxTermDictionary2", "create index if not exists idxTermDictionary2 on TermDictionary (Term)"),
+        ("idxPosting1", "create index if not exists idxPosting1 on Posting (TermId)"),
+        ("idxPosting2", "create index if not exists idxPosting2 on Posting (Docid)"),
+    ]
+    # The compressed format replaces Posting (and its indexes) by PostingList
+    compressedtables = [
+        ("PostingList", "create table if not exists PostingList (TermId integer primary key, docfreq int, idf real, postings blob, skips blob)"),
+    ]
+    # The positional index adds the positions of the postings to either format
+    positionaltables = [
+        ("PostingPositions", "create table if not exists PostingPositions (TermId int, DocId int, positions blob)"),
+    ]
+    positionalindexes = [
+        ("idxPostingPositions", "create index if not exists idxPostingPositions on PostingPositions (TermId, DocId)"),
+    ]
+    # The precomputed BM25 impacts of the postings
+    impacttables = [
+        ("PostingImpact", "create table if not exists PostingImpact (TermId integer primary key, impacts blob)"),
+    ]
+
+    # The SimHash of the documents and the near-duplicate pages
+    simhashtables = [
+        ("DocumentSimHash", "create table if not exists DocumentSimHash (DocId integer primary key, simhash int)"),
+        ("DocumentDuplicate", "create table if not exists DocumentDuplicate (DocumentName text, DocId int)"),
+    ]
+
+    def __init__(self, con, batchsize=10000, cachesize=64 * 1024, compressed=False, positional=False,
+                 impacts=False, k1=bm25.defaultk1, b=bm25.defaultb, simhashes=False):
+        """con is an open sqlite3 connection. Rows are sent to sqlite every
+        batchsize rows, cachesize is the page cache given to sqlite in KiB.
+        compressed selects the PostingList format for the postings, positional
+        adds the PostingPositions table and impacts the PostingImpact table,
+        computed with the BM25 parameters k1 and b. simhashes adds the
+        DocumentSimHash and DocumentDuplicate tables.
+        """
+        self.con = con
+        self.batchsize = batchsize
+        self.cachesize = cachesize
+        self.compressed = compressed
+        self.positional = positional
+        self.impacts = impacts
+        self.simhashes = simhashes
+        self.k1 = k1
+        self.b = b
+        self.cur = con.cursor()
+        self.documents = []
+        self.terms = []
+        self.postings = []
+        self.postinglists = []
+        self.statistics = []
+        self.positions = []
+        self.simhashrows = []
+        self.duplicates = []
+        self.intransaction = False
+        if compressed:
+            self.tables = IndexWriter.tables[:2] + IndexWriter.tables[3:] + IndexWriter.compressedtables
+            self.indexes = IndexWriter.indexes[:3]
+        if positional:
+            self.tables = self.tables + IndexWriter.positionaltables
+            self.indexes = self.indexes + IndexWriter.positionalindexes
+        if impacts:
+            self.tables = self.tables + IndexWriter.impacttables
+        if simhashes:
+            self.tables = self.tables + IndexWriter.simhashtables
+
+    def begin(self, durable=False):
+        """begin(durable) tunes the connection and opens the load transaction.
+        A new index (create()) is loaded with the journal in memory and no
+        syncs: a crash can corrupt the file, but the index is then built again.
+        With durable, for an update of the index in place (open()), the
+        rollback journal and the syncs are kept, so that a crash leaves the
+        previous index whole.
+        """
+        if self.intransaction:
+            return
+        # the transaction is managed explicitly below
+        self.con.isolation_level = None
+        if not durable:
+            self.cur.execute("pragma journal_mode = MEMORY")
+            self.cur.execute("pragma synchronous = OFF")
+        self.cur.execute("pragma cache_size = -%d" % self.cachesize)
+        self.cur.execute("pragma temp_store = MEMORY")
+        self.cur.execute("begin")
+        self.intransaction = True
+
+    def create(self):
+        """create() drops any existing index and creates empty tables, without
+        their secondary indexes, inside the load transaction.
+        """
+        self.begin()
+        for name, _ in IndexWriter.indexes + IndexWriter.positionalindexes:
+            self.cur.execute("drop index if exists %s" % name)
+        # the postings of the other format are dropped too so that they do not go stale
+        for name, _ in IndexWriter.tables + IndexWriter.compressedtables + IndexWriter.positionaltables + IndexWriter.impacttables + IndexWriter.simhashtables:
+            self.cur.execute("drop table if exists %s" % name)
+        for _, sql in self.tables:
+            self.cur.execute(sql)
+
+    def open(self):
+        """open() keeps the existing index, for an incremental update, and
+        creates any missing table or index inside the load transaction.
+        """
+        self.begin(durable=True)
+        for _, sql in self.tables + self.indexes:
+            self.cur.execute(sql)
+
+    def adddocument(self, name, docid):
+        self.documents.append((name, docid))
+        if len(self.documents) >= self.batchsize:
+            self.flushdocuments()
+
+    def addterm(self, term, termid):
+        self.terms.append((term, termid))
+        if len(self.terms) >= self.batchsize:
+            self.flushterms()
+
+    def addposting(self, termid, docid, tfidf, docfreq, termfreq):
+        self.postings.append((termid, docid, tfidf, docfreq, termfreq))
+        if len(self.postings) >= self.batchsize:
+            self.flushpostings()
+
+    def addpostinglist(self, termid, docfreq, idf, blob):
+        self.postinglists.append((termid, docfreq, idf, blob, encodeskips(blob)))
+        if len(self.postinglists) >= self.batchsize:
+            self.flushpostinglists()
+
+    def adddocumentstatistics(self, docid, norm, length, terms):
+        self.statistics.append((docid, norm, length, terms))
+        if len(self.statistics) >= self.batchsize:
+            self.flushdocumentstatistics()
+
+    def addpositions(self, termid, docid, blob):
+        self.positions.append((termid, docid, blob))
+        if len(self.positions) >= self.batchsize:
+            self.flushpositions()
+
+    def addsimhash(self, docid, simhash):
+        # sqlite integers are signed: a 64 bits SimHash is stored in two's complement
+        self.simhashrows.append((docid, simhash - (1 << 64) if simhash >= 1 << 63 else simhash))
+        if len(self.simhashrows) >= self.batchsize:
+            self.flushsimhashes()
+
+    def addduplicate(self, name, docid):
+        self.duplicates.append((name, docid))
+        if len(self.duplicates) >= self.batchsize:
+            self.flushduplicates()
+
+    def flushdocuments(self):
+        self.begin()
+        self.cur.executemany("insert into DocumentDictionary values (?, ?)", self.documents)
+        self.documents = []
+
+    def flushterms(self):
+        self.begin()
+        self.cur.executemany("insert into TermDictionary values (?, ?)", self.terms)
+        self.terms = []
+
+    def flushpostings(self):
+        self.begin()
+        self.cur.executemany("insert into Posting values (?, ?, ?, ?, ?)", self.postings)
+        self.postings = []
+
+    def flushpostinglists(self):
+        self.begin()
+        self.cur.executemany("insert into PostingList values (?, ?, ?, ?, ?)", self.postinglists)
+        self.postinglists = []
+
+    def flushdocumentstatistics(self):
+        self.begin()
+        # a document indexed again replaces its previous statistics
+        self.cur.executemany("insert or replace into DocumentStatistics values (?, ?, ?, ?)", self.statistics)
+        self.statistics = []
+
+    def flushpositions(self):
+        self.begin()
+        self.cur.executemany("insert into PostingPositions values (?, ?, ?)", self.positions)
+        self.positions = []
+
+    def flushsimhashes(self):
+        self.begin()
+        self.cur.executemany("insert or replace into DocumentSimHash values (?, ?)", self.simhashrows)
+        self.simhashrows = []
+
+    def flushduplicates(self):
+        self.begin()
+        self.cur.executemany("insert into DocumentDuplicate values (?, ?)", self.duplicates)
+        self.duplicates = []
+
+    def flush(self):
+        """flush() sends every buffered row to sqlite."""
+        self.flushdocuments()
+        self.flushterms()
+        self.flushdocumentstatistics()
+        if self.positional:
+            self.flushpositions()
+        if self.simhashes:
+            self.flushsimhashes()
+            self.flushduplicates()
+        if self.compressed:
+            self.flushpostinglists()
+        else:
+            self.flushpostings()
+
+    def writetermstatistics(self):
+        """writetermstatistics() computes the TermStatistics of every term from
+        the postings and the document norms already loaded.
+        """
+        self.begin()
+        self.cur.execute("delete from TermStatistics")
+        if not self.compressed:
+            self.cur.execute("insert into TermStatistics select p.TermId, max(p.tfidf / s.norm) from Posting p join DocumentStatistics s on s.DocId = p.DocId where s.norm > 0 group by p.TermId")
+            return
+        self.cur.execute("select DocId, norm from DocumentStatistics where norm > 0")
+        norms = dict(self.cur.fetchall())
+        bounds = []
+        for termid, idf, blob in self.con.execute("select TermId, idf, postings from PostingList"):
+            weights = [tf * idf / norms[docid] for docid, tf in decodepostings(blob) if docid in norms]
+            if weights:
+                bounds.append((termid, max(weights)))
+        self.cur.executemany("insert into TermStatistics values (?, ?)", bounds)
+
+    def writecollectionstatistics(self):
+        """writecollectionstatistics() computes the CollectionStatistics from the
+        documents and their statistics already loaded, then the PostingImpact
+        table when the writer has impacts.
+        """
+        self.begin()
+        self.cur.execute("delete from CollectionStatistics")
+        self.cur.execute("insert into CollectionStatistics select 'documents', count(*) from DocumentDictionary")
+        self.cur.execute("insert into CollectionStatistics select 'averagelength', coalesce(avg(length), 0) from DocumentStatistics")
+        if self.impacts:
+            self.writeimpacts()
+
+    def readpostinglists(self):
+        """readpostinglists() yields the TermId, docfreq and list of (docid, tf) of
+        every term already loaded, in either format.
+        """
+        if self.compressed:
+            for termid, docfreq, blob in self.con.execute("select TermId, docfreq, postings from PostingList"):
+                yield termid, docfreq, decodepostings(blob)
+            return
+        postings = self.con.execute("select TermId, DocId, docfreq, termfreq from Posting order by TermId, DocId")
+        for termid, group in itertools.groupby(postings, key=lambda row: row[0]):
+            rows = list(group)
+            yield termid, rows[0][2], [(row[1], row[3]) for row in rows]
+
+    def bm25postings(self):
+        """bm25postings() yields the TermId of every term with the list of the
+        (docid, BM25 score) of its postings, in DocId order.
+        """
+        self.cur.execute("select value from CollectionStatistics where Name = 'documents'")
+        documents = self.cur.fetchone()[0]
+        self.cur.execute("select value from CollectionStatistics where Name = 'averagelength'")
+        averagelength = self.cur.fetchone()[0]
+        self.cur.execute("select DocId, length from DocumentStatistics")
+        lengths = dict(self.cur.fetchall())
+        for termid, docfreq, pairs in self.readpostinglists():
+            idf = bm25.idf(documents, docfreq)
+            yield termid, [(docid, idf * bm25.termweight(tf, lengths.get(docid, 0), averagelength, self.k1, self.b)) for docid, tf in pairs]
+
+    def writeimpacts(self):
+        """writeimpacts() computes the PostingImpact table and the scale of the
+        impacts. The postings are read twice: once for the largest score, that
+        sets the scale, then to quantize and store the scores.
+        """
+        self.cur.execute("delete from PostingImpact")
+        largest = max([max(score for _, score in scores) for _, scores in self.bm25postings()] or [0.0])
+        scale = largest / bm25.impactlevels if largest > 0 else 1.0
+        impacts = []
+        for termid, scores in self.bm25postings():
+            impacts.append((termid, encodepostings((docid, bm25.quantize(score, scale)) for docid, score in scores)))
+            if len(impacts) >= self.batchsize:
+                self.cur.executemany("insert into PostingImpact values (?, ?)", impacts)
+                impacts = []
+        self.cur.executemany("insert into PostingImpact values (?, ?)", impacts)
+        self.cur.executemany("insert into CollectionStatistics values (?, ?)", [('k1', self.k1), ('b', self.b), ('impactscale', scale)])
+
+    def close(self):
+        """close() loads the remaining rows, computes the TermStatistics and the
+        CollectionStatistics, builds the secondary indexes, increments the index
+        generation, commits the transaction and writes the term dictionary file.
+        The connection itself is left open.
+        """
+        self.flush()
+        self.writetermstatistics()
+        self.writecollectionstatistics()
+        for _, sql in self.indexes:
+            self.cur.execute(sql)
+        self.cur.execute("pragma user_version")
+        generation = self.cur.fetchone()[0] + 1
+        self.cur.execute("pragma user_version = %d" % generation)
+        self.cur.execute("commit")
+        self.intransaction = False
+        self.cur.execute("pragma synchronous = FULL")
+        self.writedictionary(generation)
+
+    def writedictionary(self, generation):
+        """writedictionary(generation) saves the TermDictionary table in the term
+        dictionary file of the database, unless the database is in memory.
+        """
+        self.cur.execute("pragma database_list")
+        database = [row[2] for row in self.cur.fetchall() if row[1] == 'main'][0]
+        if database == '':
+            return
+        self.cur.execute("select Term, TermId from TermDictionary")
+        writedictionary(dictionaryfile(database), self.cur.fetchall(), generation)
@@ -0,0 +1,174 @@
+"""
+==================================================================================================
+
+Term dictionary file shared by the indexer (unit 4), the search engine (unit 5)
+and the web crawler (unit 7).
+
+The index writer saves the TermDictionary table of the index as a compact file
+next to the database (cacm.db -> cacm.dict). The search engine maps the file
+in memory with mmap and looks the terms up by binary search, without any SQL.
+The file is only read, so the processes that map it share its pages.
+
+The terms are sorted and cut into blocks of blocksize terms. The first term of
+a block is stored in full, the next ones are front coded: the length of the
+prefix they share with the previous term, then the rest of the term. Every term
+is followed by its TermId, the key of its postings. All numbers are varints
+(see postingcodec.py), the terms are UTF-8.
+
+    header      magic 'TDF1', then the index generation, the number of terms, blocksize
+                and the number of blocks (unsigned 32 bit little endian integers)
+    offsets     file offset of every block (unsigned 32 bit little endian integers)
+    blocks      first term:  length, bytes, TermId
+                next terms:  shared prefix length, suffix length, suffix bytes, TermId
+
+The first terms of the blocks are read in memory when the file is mapped. A
+lookup binary searches them, then decodes at most one block. The index
+generation of the file tells whether it matches the database (see
+indexwriter.py).
+
+Usage:
+
+    writedictionary('cacm.dict', [('algebra', 1), ('algorithm', 2)], 3)
+    dictionary = MappedDictionary('cacm.dict')
+    dictionary.get('algorithm')   # 2
+    dictionary.close()
+==================================================================================================
+"""
+
+import bisect
+import mmap
+import os
+import struct
+from postingcodec import encodevarint, decodevarint
+
+magic = b'TDF1'
+header = struct.Struct('<4sIIII')
+
+# the name of the dictionary file of a database: cacm.db -> cacm.dict
+def dictionaryfile(database):
+    return os.path.splitext(database)[0] + '.dict'
+
+def writedictionary(filename, terms, generation, blocksize=8):
+    """writedictionary(filename, terms, generation) writes the (term, TermId)
+    pairs of terms to filename. The file is written aside and renamed, so a
+    reader never sees half of it.
+    """
+    entries = sorted((term.encode('utf-8'), termid) for term, termid in terms)
+    data = bytearray()
+    offsets = []
+    start = header.size + 4 * ((len(entries) + blocksize - 1) // blocksize)
+    previous = b''
+    for n, (term, termid) in enumerate(entries):
+        if n % blocksize == 0:
+            offsets.append(start + len(data))
+            encodevarint(len(term), data)
+            data += term
+        else:
+            shared = 0
+            limit = min(len(term), len(previous))
+            while shared < limit and term[shared] == previous[shared]:
+                shared += 1
+            encodevarint(shared, data)
+            encodevarint(len(term) - shared, data)
+            data += term[shared:]
+        encodevarint(termid, data)
+        previous = term
+
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(header.pack(magic, generation, len(entries), blocksize, len(offsets)))
+        f.write(struct.pack('<%dI' % len(offsets), *offsets))
+        f.write(data)
+    os.replace(temporary, filename)
+
+class MappedDictionary:
+
+    def __init__(self, filename):
+        """filename is a file written by writedictionary()."""
+        with open(filename, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        tag, self.generation, self.count, self.blocksize, self.blocks = header.unpack_from(self.map, 0)
+        if tag != magic:
+            self.map.close()
+            raise ValueError('%s is not a term dictionary file' % filename)
+        self.offsets = struct.unpack_from('<%dI' % self.blocks, self.map, header.size)
+        # the first term of every block, binary searched in memory (one term out of blocksize)
+        self.heads = [self.firstterm(block) for block in range(self.blocks)]
+
+    def firstterm(self, block):
+        """firstterm(block) returns the first term of a block, as UTF-8 bytes."""
+        length, i = decodevarint(self.map, self.offsets[block])
+        return self.map[i:i + length]
+
+    def decodeblock(self, block):
+        """decodeblock(block) yields the (term as UTF-8 bytes, TermId) pairs of a block."""
+        length, i = decodevarint(self.map, self.offsets[block])
+        term = self.map[i:i + length]
+        i += length
+        for n in range(min(self.blocksize, self.count - block * self.blocksize)):
+            if n > 0:
+                shared, i = decodevarint(self.map, i)
+                length, i = decodevarint(self.map, i)
+                term = term[:shared] + self.map[i:i + length]
+                i += length
+            termid, i = decodevarint(self.map, i)
+            yield term, termid
+
+    def get(self, term, default=None):
+        """get(term) returns the TermId of term, or default when it is not in the dictionary."""
+        key = term.encode('utf-8')
+        # the last block whose first term is not greater than the term
+        block = bisect.bisect_right(self.heads, key) - 1
+        if block < 0:
+            return default
+
+        # scan the block. The lengths are nearly always a single byte, decodevarint() is only
+        # called for the longer ones
+        m = self.map
+        current = self.heads[block]
+        i = self.offsets[block]
+        length = m[i]
+        i = i + 1 if length < 0x80 else decodevarint(m, i)[1]
+        i += len(current)
+        for n in range(min(self.blocksize, self.count - block * self.blocksize)):
+            if n > 0:
+                shared = m[i]
+                if shared < 0x80:
+                    i += 1
+                else:
+                    shared, i = decodevarint(m, i)
+                length = m[i]
+                if length < 0x80:
+                    i += 1
+                else:
+                    length, i = decodevarint(m, i)
+                current = current[:shared] + m[i:i + length]
+                i += length
+            if current == key:
+                return decodevarint(m, i)[0]
+            if current > key:
+                return default
+            # skip the TermId
+            while m[i] >= 0x80:
+                i += 1
+            i += 1
+        return default
+
+    def __getitem__(self, term):
+        termid = self.get(term)
+        if termid is None:
+            raise KeyError(term)
+        return termid
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def __len__(self):
+        return self.count
+
+    def items(self):
+        """items() returns every (term, TermId) pair in term order."""
+        return [(term.decode('utf-8'), termid) for block in range(self.blocks) for term, termid in self.decodeblock(block)]
+
+    def close(self):
+        self.map.close()
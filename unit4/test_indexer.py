@@ -0,0 +1,72 @@
+"""
+Tests of the parallel indexing of indexer.py: the index built with --jobs -1
+(every core, which is a single worker in this process on a one core host) must
+be the same as the index built with --jobs 1, for a full build and for an
+incremental update.
+
+The indexer writes cacm.db in its working directory, so every build runs
+indexer.py in a temporary copy of the scripts and the corpus.
+
+Usage: python -m unittest test_indexer
+"""
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+class ParallelIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='indexer')
+        for name in os.listdir(here):
+            if name.endswith('.py'):
+                shutil.copy(os.path.join(here, name), self.folder)
+        shutil.copytree(os.path.join(here, 'cacm'), os.path.join(self.folder, 'cacm'))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def index(self, *args):
+        subprocess.run([sys.executable, '-W', 'ignore', 'indexer.py'] + list(args), cwd=self.folder, check=True,
+                       stdout=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+        con = sqlite3.connect(os.path.join(self.folder, 'cacm.db'))
+        try:
+            return {table: con.execute("select * from %s order by 1, 2" % table).fetchall()
+                    for table in ('DocumentDictionary', 'TermDictionary', 'Posting', 'DocumentStatistics')}
+        finally:
+            con.close()
+
+    # the tables are compared row for row, without the diff of assertEqual (slow on thousands of rows)
+    def assertSameIndex(self, index, expected):
+        for table in expected:
+            with self.subTest(table=table):
+                self.assertEqual(len(index[table]), len(expected[table]))
+                self.assertTrue(index[table] == expected[table], '%s differs' % table)
+
+    def test_every_core_same_as_serial(self):
+        self.assertSameIndex(self.index('--jobs', '-1'), self.index('--jobs', '1'))
+
+    def test_incremental_every_core_same_as_serial(self):
+        self.index('--jobs', '1')
+        backup = os.path.join(self.folder, 'cacm.db.orig')
+        shutil.copy(os.path.join(self.folder, 'cacm.db'), backup)
+        # one document changed, one deleted and one added
+        corpus = os.path.join(self.folder, 'cacm')
+        files = sorted(os.listdir(corpus))
+        with open(os.path.join(corpus, files[0]), 'a') as f:
+            f.write('\nincremental parallel update\n')
+        os.remove(os.path.join(corpus, files[1]))
+        shutil.copy(os.path.join(corpus, files[2]), os.path.join(corpus, 'added.html'))
+
+        serial = self.index('--incremental', '--jobs', '1')
+        shutil.copy(backup, os.path.join(self.folder, 'cacm.db'))
+        self.assertSameIndex(self.index('--incremental', '--jobs', '-1'), serial)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+"""
+==================================================================================================
+
+Boolean queries for the search engine (searchEngine.py).
+
+A Boolean query combines words with AND, OR and NOT (upper case) and
+parentheses. Two words without an operator between them are ANDed, NOT binds
+tighter than AND and AND tighter than OR:
+
+    (sorting OR searching) AND algorithm NOT parallel
+
+parse() turns a query into a tree, evaluate() returns the sorted DocIds of the
+documents that satisfy it. A conjunction is evaluated rarest first: the DocIds
+of its shortest operand are the candidates, and every other operand is only
+asked whether it holds each candidate, by advancing a cursor over its posting
+list. PostingCursor (postingcodec.py) jumps over the compressed posting lists
+with their skip pointers, ListCursor gallops over a list of DocIds. The negated
+operands of a conjunction remove the candidates they hold the same way. Only
+the operands of OR, and a NOT with nothing to AND it with, are read in full.
+
+Usage:
+
+    tree = parse('(sorting OR searching) AND NOT parallel', searchEngine.queryterms)
+    docids = evaluate(tree, postings, universe)   # postings(term) returns a new cursor or None,
+                                                  # universe() the DocIds of every document
+    text = ' '.join(words(tree))                  # the words that are not negated, for the ranking
+==================================================================================================
+"""
+
+import bisect
+import re
+
+# a part of a query: a parenthesis, or a word or operator up to the next space or parenthesis
+queryparts = re.compile(r'[()]|[^\s()]+')
+
+class ListCursor:
+
+    def __init__(self, docids):
+        """docids is a sorted list of DocIds."""
+        self.list = docids
+        self.count = len(docids)
+        self.index = 0
+
+    def advance(self, target):
+        """advance(target) moves to the first DocId not smaller than target and
+        returns it, or None when there is none. The cursor only moves forward:
+        the step doubles until it passes target (galloping), then the last step
+        is binary searched, so a jump costs the log of its length.
+        """
+        docids = self.list
+        i = self.index
+        if i >= self.count:
+            return None
+        if docids[i] >= target:
+            return docids[i]
+        step = 1
+        while i + step < self.count and docids[i + step] < target:
+            i += step
+            step *= 2
+        self.index = bisect.bisect_left(docids, target, i + 1, min(self.count, i + step + 1))
+        return docids[self.index] if self.index < self.count else None
+
+    def docids(self):
+        return self.list
+
+# a tree of kind with the given children: the missing children (words that are only stop words)
+# are dropped and the children of the same kind are merged, (a AND b) AND c is a AND b AND c
+def combine(kind, children):
+    flat = []
+    for child in children:
+        if child is None:
+            continue
+        if child[0] == kind:
+            flat.extend(child[1])
+        else:
+            flat.append(child)
+    if len(flat) == 0:
+        return None
+    if len(flat) == 1:
+        return flat[0]
+    return (kind, flat)
+
+def parse(line, normalize):
+    """parse(line, normalize) returns the tree of a Boolean query, or None when
+    it has no term. normalize(word) returns the terms of a word (see
+    searchEngine.queryterms()). The nodes of the tree are ('word', word, terms),
+    ('and', children), ('or', children) and ('not', child). A misplaced
+    operator or parenthesis is ignored rather than rejected.
+    """
+    parts = queryparts.findall(line)
+    node, i = parseor(parts, 0, normalize)
+    # a closing parenthesis without an opening one: the rest of the query is ANDed
+    while i < len(parts):
+        rest, i = parseor(parts, i + 1, normalize)
+        node = combine('and', [node, rest])
+    return node
+
+def parseor(parts, i, normalize):
+    node, i = parseand(parts, i, normalize)
+    children = [node]
+    while i < len(parts) and parts[i] == 'OR':
+        node, i = parseand(parts, i + 1, normalize)
+        children.append(node)
+    return combine('or', children), i
+
+def parseand(parts, i, normalize):
+    children = []
+    while i < len(parts) and parts[i] not in ('OR', ')'):
+        if parts[i] == 'AND':
+            i += 1
+            continue
+        node, i = parseunary(parts, i, normalize)
+        children.append(node)
+    return combine('and', children), i
+
+def parseunary(parts, i, normalize):
+    if parts[i] == 'NOT':
+        if i + 1 >= len(parts) or parts[i + 1] in ('OR', ')'):
+            return None, i + 1
+        node, i = parseunary(parts, i + 1, normalize)
+        return (('not', node) if node is not None else None), i
+    if parts[i] == '(':
+        node, i = parseor(parts, i + 1, normalize)
+        if i < len(parts) and parts[i] == ')':
+            i += 1
+        return node, i
+    terms = tuple(normalize(parts[i]))
+    return (('word', parts[i], terms) if terms else None), i + 1
+
+def terms(node):
+    """terms(node) returns the set of the terms of a tree, negated or not."""
+    if node is None:
+        return set()
+    if node[0] == 'word':
+        return set(node[2])
+    if node[0] == 'not':
+        return terms(node[1])
+    return set().union(*[terms(child) for child in node[1]])
+
+def words(node):
+    """words(node) returns the words of a tree that are not under a NOT."""
+    if node is None or node[0] == 'not':
+        return []
+    if node[0] == 'word':
+        return [node[1]]
+    return [word for child in node[1] for word in words(child)]
+
+# the cursor over the DocIds of a node: the posting list of a single term, else the evaluated node
+def operand(node, postings, universe):
+    if node[0] == 'word' and len(node[2]) == 1:
+        cursor = postings(node[2][0])
+        return cursor if cursor is not None else ListCursor([])
+    return ListCursor(evaluate(node, postings, universe))
+
+def evaluate(node, postings, universe):
+    """evaluate(node, postings, universe) returns the sorted DocIds of the
+    documents that satisfy the tree node. postings(term) returns a new cursor
+    over the posting list of term (PostingCursor or ListCursor, with a count
+    of postings), or None when the term is not in the index. universe()
+    returns the sorted DocIds of every document.
+    """
+    if node is None:
+        return []
+    kind = node[0]
+    if kind == 'word':
+        if len(node[2]) == 1:
+            return operand(node, postings, universe).docids()
+        # a word made of several terms (time-sharing) needs all of them
+        return evaluate(('and', [('word', node[1], (term,)) for term in node[2]]), postings, universe)
+    if kind == 'or':
+        docids = set()
+        for child in node[1]:
+            docids.update(evaluate(child, postings, universe))
+        return sorted(docids)
+    if kind == 'not':
+        held = operand(node[1], postings, universe)
+        return [docid for docid in universe() if held.advance(docid) != docid]
+
+    # and: the candidates come from the shortest operand, the others are only advanced to them
+    operands = sorted((operand(child, postings, universe) for child in node[1] if child[0] != 'not'), key=lambda cursor: cursor.count)
+    candidates = operands[0].docids() if operands else universe()
+    for cursor in operands[1:]:
+        candidates = [docid for docid in candidates if cursor.advance(docid) == docid]
+        if not candidates:
+            return []
+    for child in node[1]:
+        if child[0] == 'not':
+            held = operand(child[1], postings, universe)
+            candidates = [docid for docid in candidates if held.advance(docid) != docid]
+    return candidates
@@ -0,0 +1,202 @@
+"""
+==================================================================================================
+
+Posting list codec shared by the indexer (unit 4), the search engine (unit 5)
+and the web crawler (unit 7).
+
+In the compressed index format every term has a single row in the PostingList
+table, and all of its postings are stored in one blob instead of one row per
+(TermId, DocId) with idf copied in every row. The blob is built like this:
+
+  - the postings are sorted by DocId, and each DocId is replaced by the gap
+    from the previous one (the first gap is the DocId itself),
+  - each gap is followed by the term frequency,
+  - every number is written as a variable length integer (varint): 7 bits per
+    byte, with the high bit set on every byte except the last one.
+
+Small numbers take a single byte. Gaps are small for frequent terms, and term
+frequencies are nearly always small, so most postings take two bytes.
+
+A long posting list also gets skip pointers, stored next to its blob: for
+every skipinterval postings, the DocId of the posting just before the block
+and the offset of the block in the blob (both gap encoded varints).
+PostingCursor uses them to jump to the block that may hold a DocId and only
+decodes that block, so intersecting a short list with a long one does not
+decode the whole long list.
+
+The positions of a term in a document (positional index) are stored the same
+way: sorted, gap encoded and written as varints.
+
+Usage:
+
+    blob = encodepostings([(3, 1), (7, 2), (8, 1)])
+    decodepostings(blob)   # [(3, 1), (7, 2), (8, 1)]
+    cursor = PostingCursor(blob, encodeskips(blob))
+    cursor.advance(5)      # 7, the first DocId not smaller than 5
+    decodepositions(encodepositions([4, 9, 30]))   # [4, 9, 30]
+==================================================================================================
+"""
+
+import bisect
+
+def encodevarint(n, out):
+    """encodevarint(n, out) appends the varint of the non negative integer n to the bytearray out."""
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def decodevarint(blob, i):
+    """decodevarint(blob, i) reads the varint starting at blob[i] and returns (value, next offset)."""
+    n = 0
+    shift = 0
+    while True:
+        byte = blob[i]
+        i += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, i
+        shift += 7
+
+def encodevarints(numbers):
+    """encodevarints(numbers) returns the varints of a sequence of integers as bytes."""
+    out = bytearray()
+    for n in numbers:
+        encodevarint(n, out)
+    return bytes(out)
+
+def decodevarints(blob):
+    """decodevarints(blob) returns the list of integers encoded in blob."""
+    numbers = []
+    n = 0
+    shift = 0
+    for byte in blob:
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            numbers.append(n)
+            n = 0
+            shift = 0
+        else:
+            shift += 7
+    return numbers
+
+def encodepostings(postings):
+    """encodepostings(postings) turns a list of (docid, tf) pairs sorted by
+    docid into a blob of gap encoded docids and term frequencies.
+    """
+    out = bytearray()
+    last = 0
+    for docid, tf in postings:
+        encodevarint(docid - last, out)
+        encodevarint(tf, out)
+        last = docid
+    return bytes(out)
+
+def decodepostings(blob):
+    """decodepostings(blob) returns the list of (docid, tf) pairs stored in blob."""
+    numbers = decodevarints(blob)
+    postings = []
+    docid = 0
+    for i in range(0, len(numbers), 2):
+        docid += numbers[i]
+        postings.append((docid, numbers[i + 1]))
+    return postings
+
+# number of postings between two skip pointers
+skipinterval = 64
+
+def encodeskips(blob, interval=skipinterval):
+    """encodeskips(blob) returns the skip pointers of a posting list blob, or
+    an empty blob when the list is too short to need any.
+    """
+    out = bytearray()
+    docid = 0
+    lastdocid = 0
+    lastoffset = 0
+    i = 0
+    n = 0
+    while i < len(blob):
+        if n > 0 and n % interval == 0:
+            encodevarint(docid - lastdocid, out)
+            encodevarint(i - lastoffset, out)
+            lastdocid = docid
+            lastoffset = i
+        gap, i = decodevarint(blob, i)
+        docid += gap
+        _, i = decodevarint(blob, i)
+        n += 1
+    return bytes(out)
+
+def decodeskips(skips):
+    """decodeskips(skips) returns the lists of the DocIds before the blocks and
+    of the offsets of the blocks, the first block (DocId 0, offset 0) included.
+    """
+    numbers = decodevarints(skips or b'')
+    docids = [0]
+    offsets = [0]
+    for i in range(0, len(numbers), 2):
+        docids.append(docids[-1] + numbers[i])
+        offsets.append(offsets[-1] + numbers[i + 1])
+    return docids, offsets
+
+class PostingCursor:
+
+    def __init__(self, blob, skips=None, count=None):
+        """blob is a posting list written by encodepostings(), skips its skip
+        pointers (encodeskips()) and count its number of postings when known.
+        """
+        self.blob = blob
+        self.count = count
+        self.skipdocids, self.skipoffsets = decodeskips(skips)
+        self.offset = 0
+        self.docid = 0
+        self.tf = 0
+
+    def next(self):
+        """next() moves to the next posting and returns its DocId, or None at the end of the list."""
+        if self.offset >= len(self.blob):
+            self.docid = None
+            return None
+        gap, self.offset = decodevarint(self.blob, self.offset)
+        self.tf, self.offset = decodevarint(self.blob, self.offset)
+        self.docid += gap
+        return self.docid
+
+    def advance(self, target):
+        """advance(target) moves to the first posting whose DocId is not smaller
+        than target and returns its DocId, or None when there is none. The
+        cursor only moves forward.
+        """
+        if self.docid is None or (self.offset > 0 and self.docid >= target):
+            return self.docid
+        # the last block that starts before target, when it is ahead of the cursor
+        block = bisect.bisect_left(self.skipdocids, target) - 1
+        if self.skipoffsets[block] > self.offset:
+            self.offset = self.skipoffsets[block]
+            self.docid = self.skipdocids[block]
+        while True:
+            docid = self.next()
+            if docid is None or docid >= target:
+                return docid
+
+    def docids(self):
+        """docids() returns the DocIds of the whole list."""
+        return [docid for docid, _ in decodepostings(self.blob)]
+
+def encodepositions(positions):
+    """encodepositions(positions) turns a sorted list of token positions into a
+    blob of gap encoded positions.
+    """
+    out = bytearray()
+    last = 0
+    for position in positions:
+        encodevarint(position - last, out)
+        last = position
+    return bytes(out)
+
+def decodepositions(blob):
+    """decodepositions(blob) returns the list of positions stored in blob."""
+    positions = decodevarints(blob)
+    for i in range(1, len(positions)):
+        positions[i] += positions[i - 1]
+    return positions
@@ -0,0 +1,107 @@
+"""
+==================================================================================================
+
+Cache of query results for the search engine (searchEngine.py) and the search
+server (searchServer.py).
+
+Query traffic is skewed: the most frequent queries come back again and again.
+QueryCache remembers the results of the most recently used queries in a
+bounded cache with least recently used (LRU) eviction, and optionally forgets
+results older than ttl seconds. It counts the hits, misses, evictions and
+expirations of the cache.
+
+The results are only valid for the index they were computed on. Every time the
+index writer commits an index it increments the index generation (the
+user_version of the database, see indexwriter.py); validate() empties the cache
+when it is given a generation different from the one of its entries.
+
+Usage:
+
+    cache = QueryCache(10000, ttl=600)
+    cache.validate(searchEngine.indexgeneration(cur))
+    key = searchEngine.querykey('sorting algorithms', 20, False)
+    results = cache.get(key)
+    if results is None:
+        results = ...
+        cache.put(key, results)
+    print(cache.stats())
+==================================================================================================
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+class QueryCache:
+
+    def __init__(self, capacity=10000, ttl=None):
+        """capacity is the maximum number of queries kept in the cache, ttl the
+        number of seconds a result is kept (None keeps it until it is evicted).
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.cache = OrderedDict()
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # the search server shares the cache between its threads
+        self.lock = threading.Lock()
+
+    def validate(self, generation):
+        """validate(generation) empties the cache if its results were computed
+        on another generation of the index.
+        """
+        with self.lock:
+            if generation == self.generation:
+                return
+            if self.generation is not None:
+                self.invalidations += 1
+            self.cache.clear()
+            self.generation = generation
+
+    def get(self, key):
+        """get(key) returns the results cached for key, or None."""
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            results, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self.cache[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return results
+
+    def put(self, key, results, generation=None):
+        """put(key, results, generation) caches the results of key. The results
+        are dropped when they were computed on another generation of the index
+        than the current one of the cache.
+        """
+        if self.capacity <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.cache[key] = (results, expires)
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)
+                self.evictions += 1
+
+    def hitrate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def stats(self):
+        return "Query cache: %i hits, %i misses, %i evictions, %i expirations, %i invalidations, hit rate %.1f%%" % (
+            self.hits, self.misses, self.evictions, self.expirations, self.invalidations, 100 * self.hitrate())
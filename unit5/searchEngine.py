@@ -7,41 +7,658 @@ import sys,os,re
 import math
 import sqlite3
 import time
-import json
-# use simple dictionnary data structures in Python to maintain lists with hash keys
-docs = {}
-resultslist = {}
-term = {}
+import heapq
+import bisect
+import itertools
+import argparse
+from joblib import Parallel, delayed
+from querycache import QueryCache
+from mmapdictionary import MappedDictionary, dictionaryfile
+from postingcodec import decodepostings, decodepositions, PostingCursor
+import bm25
+import booleanquery
+from porterstemmer import stemword
+import tokenizer
 # regular expression for: extract words, extract ID from path, check for hexa value
 chars = re.compile(r'\W+')
 pattid= re.compile(r'(\d{3})/(\d{3})/(\d{3})')
+# the parts of a query: a "quoted phrase" or a word, and the NEAR/k proximity operator
+queryparts = re.compile(r'"([^"]*)"?|(\S+)')
+nearoperator = re.compile(r'NEAR/(\d+)$')
+# split on any chars
+def splitchars(line) :
+    return chars.split(line)
+# check whether the index was written in the compressed format (PostingList table)
+def compressedindex(cur):
+    cur.execute("select count(*) from sqlite_master where type = 'table' and name = 'PostingList'")
+    return cur.fetchone()[0] == 1
+# check whether the index was written by the current indexer: an index of the first version of
+# indexer.py (DocumentDictionary, TermDictionary and Posting only) has no DocumentStatistics and
+# its Posting columns do not mean what the search engine reads in them
+def currentindex(cur):
+    cur.execute("select count(*) from sqlite_master where type = 'table' and name = 'DocumentStatistics'")
+    return cur.fetchone()[0] == 1
+# the message of an index that is not from the current indexer
+staleindex = '%s is not an index of the current indexer (no DocumentStatistics table): rebuild it with indexer.py (unit 4)'
+# split a list of values into batches that each fit in a single parameterized "in (?, ...)" query,
+# sqlite allows 999 parameters per statement
+def batches(values, size=500):
+    values = list(values)
+    for i in range(0, len(values), size):
+        batch = values[i:i + size]
+        yield batch, ','.join('?' * len(batch))
+# return the postings of several terms, read with one query, as a dictionary TermId -> list
+# of (DocId, tfidf, docfreq, termfreq, TermId) rows sorted by DocId, decoding the posting list
+# blobs when the index is compressed. The terms without postings are left out
+def termpostingslists(cur, termIds, compressed):
+    lists = {}
+    for batch, params in batches(termIds):
+        if compressed:
+            cur.execute("select TermId, docfreq, idf, postings from PostingList where TermId in (%s)" % params, batch)
+            for termId, docfreq, idf, blob in cur.fetchall():
+                lists[termId] = [(docid, tf * idf, docfreq, tf, termId) for docid, tf in decodepostings(blob)]
+            continue
+        cur.execute("select DocId, tfidf, docfreq, termfreq, TermId from Posting where TermId in (%s) order by TermId, DocId" % params, batch)
+        for row in cur.fetchall():
+            rows = lists.get(row[4])
+            if rows is None:
+                rows = lists[row[4]] = []
+            rows.append(row)
+    return lists
+# return the postings of a term as (DocId, tfidf, docfreq, termfreq, TermId) rows
+def termpostings(cur, termId, compressed):
+    return termpostingslists(cur, [termId], compressed).get(termId, [])
+# return the statistics stored at index time for the given documents as a dictionary
+# docid -> (norm, length, terms): the euclidean norm of the tf-idf vector of the document,
+# its length in indexed terms and its number of unique terms. Documents without any
+# indexed term have no statistics.
+def documentstatistics(cur, docids):
+    statistics = {}
+    for batch, params in batches(docids):
+        cur.execute("select DocId, norm, length, terms from DocumentStatistics where DocId in (%s)" % params, batch)
+        for docid, norm, length, terms in cur.fetchall():
+            statistics[docid] = (norm, length, terms)
+    return statistics
+# The query goes through the same pipeline as the documents (lower case, no stop words, short
+# terms or numbers, stemmed) so that its terms match the terms of the dictionary
+def queryterms(line):
+    return list(tokenizer.terms((line,), tokenizer.enStopwords, 3, stemword))
 #
-# Docs class: Used to store infromation about each unit document. In this is the Term object which stores each
-# unique instance of termid for a docid.
+# Split a query into the text that is scored and its phrase and proximity constraints. A "quoted
+# phrase" matches the documents where its terms follow each other as in the query, the stop words
+# between them included, and "a NEAR/k b" the documents where a and b are at most k tokens apart,
+# in any order. Returns the text without the quotes and operators, and the list of constraints:
+# ('phrase', ((term, offset from the first term), ...)) and ('near', term, term, k)
 #
-class Docs():
-    terms = {}
-    
-    def __str__(self):
-        return json.dumps(self.terms, indent = 2)
+def parsequery(line):
+    parts = []
+    for phrase, word in queryparts.findall(line):
+        if word:
+            parts.append((word, False))
+        else:
+            parts.append((phrase, True))
 
+    text = []
+    constraints = []
+    for i, (part, quoted) in enumerate(parts):
+        near = None if quoted else nearoperator.match(part)
+        if near is None:
+            text.append(part)
+            if quoted:
+                terms = list(tokenizer.positionalterms((part,), tokenizer.enStopwords, 3, stemword))
+                if terms:
+                    constraints.append(('phrase', tuple((term, position - terms[0][1]) for term, position in terms)))
+            continue
+        # the operator binds the last term before it and the first term after it
+        before = queryterms(parts[i - 1][0]) if i > 0 else []
+        after = queryterms(parts[i + 1][0]) if i + 1 < len(parts) else []
+        if before and after:
+            constraints.append(('near', before[-1], after[0], int(near.group(1))))
+    return ' '.join(text), constraints
+# the key of a query in a query cache: the stemmed query terms in term order (their order in the
+# query does not change the scores), its phrase and proximity constraints, k, whether pruning is
+# used and the scorer. The structure of a Boolean query matters, its words are kept in order
+def querykey(line, k, pruning, scorer='cosine', boolean=False):
+    if boolean:
+        return ('boolean', ' '.join(line.split()), k, pruning, scorer)
+    text, constraints = parsequery(line)
+    return (tuple(sorted(queryterms(text))), tuple(constraints), k, pruning, scorer)
+# return the generation of the index, incremented by the index writer every time it commits an index
+def indexgeneration(cur):
+    cur.execute("pragma user_version")
+    return cur.fetchone()[0]
+# return the TermId of a term, or None when the term is not in the dictionary
+def termid(cur, term):
+    cur.execute("select TermId from TermDictionary where Term = ?", (term,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return row[0]
+# return the TermIds of several terms, looked up with one query, as a dictionary term -> TermId.
+# The terms that are not in the dictionary are left out
+def termids(cur, terms):
+    found = {}
+    for batch, params in batches(terms):
+        cur.execute("select Term, TermId from TermDictionary where Term in (%s)" % params, batch)
+        found.update(cur.fetchall())
+    return found
+# return the whole term dictionary as a dictionary term -> TermId, for a process that
+# answers many queries
+def termdictionary(cur):
+    cur.execute("select Term, TermId from TermDictionary")
+    return dict(cur.fetchall())
+# map the term dictionary file written by the index writer next to the database. Returns None
+# when there is no such file or when it was written for another generation of the index, the
+# terms are then looked up in the TermDictionary table
+def mappeddictionary(cur, database):
+    try:
+        dictionary = MappedDictionary(dictionaryfile(database))
+    except (OSError, ValueError):
+        return None
+    if dictionary.generation != indexgeneration(cur):
+        dictionary.close()
+        return None
+    return dictionary
+# return the frequency of every term of a query as a dictionary term -> tf, and the TermIds of the
+# terms found in the index as a dictionary term -> TermId. The terms are looked up in dictionary
+# (see termdictionary() and mappeddictionary()) when it is given, else in the TermDictionary table
+# with a single query
+def querytermids(cur, line, dictionary=None):
+    querytf = {}
+    for term in queryterms(line):
+        querytf[term] = querytf.get(term, 0) + 1
+    return querytf, lookuptermids(cur, querytf.keys(), dictionary)
+# return the TermIds of several terms found in dictionary, or in the TermDictionary table when it is
+# None, as a dictionary term -> TermId
+def lookuptermids(cur, terms, dictionary=None):
+    if dictionary is None:
+        return termids(cur, terms)
+    found = {}
+    for term in terms:
+        termId = dictionary.get(term)
+        if termId is not None:
+            found[term] = termId
+    return found
 #
-# Term class: used to store information for each unique termid
+# Weight the terms of a query: the weight of a query term is its frequency in the query times its
+# idf. Returns the list of (TermId, weight, postings) of the query terms found in the index, and the
+# euclidean length of the query. The postings of all of the query terms are read with a single query
 #
-class Term():
-    docfreq = 0
-    termfreq = 0
-    idf = 0.0
-    tfidf = 0.0
-# split on any chars
-def splitchars(line) :
-    return chars.split(line)
-# this small routine is used to accumulate query idf values
-def elenQ(elen, a):
-    return(float(math.pow(a.idf,2))+float(elen))
-# this small routine is used to accumulate document tfidf values
-def elenD(elen, a):
-    return(float(math.pow(a.tfidf,2))+float(elen))
+def queryweights(cur, line, documents, compressed, dictionary=None):
+    querytf, found = querytermids(cur, line, dictionary)
+    lists = termpostingslists(cur, found.values(), compressed)
+
+    weights = []
+    elenQ = 0.0
+    for term, tf in querytf.items():
+        rows = lists.get(found.get(term), [])
+        if len(rows) == 0:
+            continue
+        termId = found[term]
+        # a term found in every document has an idf of 0 and does not change any score
+        weight = tf * math.log10(float(documents) / rows[0][2])
+        if weight == 0:
+            continue
+        elenQ += weight * weight
+        weights.append((termId, weight, rows))
+    return weights, math.sqrt(elenQ)
+# select the k best (docid, score) pairs by decreasing score, and by increasing docid for equal
+# scores. The heap never holds more than k entries: a candidate only goes in when it beats the
+# smallest score kept so far, so the cost grows with log(k) and not with the number of candidates
+def topk(scores, k):
+    heap = []
+    for docid, score in scores:
+        entry = (score, -docid)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+    return [(-negdocid, score) for score, negdocid in sorted(heap, reverse=True)]
+#
+# Term at a time cosine similarity. The postings of the query terms are read one term after the
+# other, and the product of the query weight and the document weight (tf-idf) of the term is added
+# to the score accumulator of every document of the posting list. The accumulators are then divided
+# by the euclidean length of the query and of the document, the latter computed by the indexer.
+# The norms of the documents are read from norms (see documentnorms()) when it is given, and only
+# the documents of restrict are scored when it is given (see phrasedocuments()).
+# search() returns the k best (docid, score) pairs and the number of candidate documents
+#
+def search(cur, line, k, documents, compressed, dictionary=None, norms=None, restrict=None):
+    weights, elenQ = queryweights(cur, line, documents, compressed, dictionary)
+    if elenQ == 0:
+        return [], 0
+    if restrict is not None:
+        weights = [(termId, weight, [row for row in rows if row[0] in restrict]) for termId, weight, rows in weights]
+
+    accumulators = {}
+    for termId, weight, rows in weights:
+        for row in rows:
+            docid = row[0]
+            accumulators[docid] = accumulators.get(docid, 0.0) + weight * row[1]
+
+    if norms is None:
+        norms = dict((docid, statistics[0]) for docid, statistics in documentstatistics(cur, accumulators.keys()).items())
+    scores = ((docid, score / (elenQ * norms[docid])) for docid, score in accumulators.items() if norms.get(docid, 0) > 0)
+    return topk(scores, k), len(accumulators)
+# check whether the index holds the score bounds of the terms (TermStatistics table)
+def boundedindex(cur):
+    cur.execute("select count(*) from sqlite_master where type = 'table' and name = 'TermStatistics'")
+    return cur.fetchone()[0] == 1
+# return the largest weight of several terms in any document (tf-idf divided by the norm of the
+# document), computed by the indexer, as a dictionary TermId -> weight
+def termbounds(cur, termIds):
+    bounds = {}
+    for batch, params in batches(termIds):
+        cur.execute("select TermId, maxweight from TermStatistics where TermId in (%s)" % params, batch)
+        bounds.update(cur.fetchall())
+    return bounds
+# return the norm of the tf-idf vector of every document as a dictionary docid -> norm
+def documentnorms(cur):
+    cur.execute("select DocId, norm from DocumentStatistics")
+    return dict(cur.fetchall())
+#
+# Document at a time cosine similarity with MaxScore dynamic pruning. Every query term has an
+# upper bound of what it can add to the score of a document: its query weight times its largest
+# weight in any document. The terms are sorted by increasing bound. Once the heap holds k documents,
+# the terms whose bounds added together cannot beat the k-th best score are non essential: the
+# documents that only contain non essential terms are never looked at. The other documents are
+# taken in DocId order from the posting lists of the essential terms, and the non essential terms
+# are only looked up (binary search) while the document can still beat the k-th best score.
+# The results are the same as search(), norms is the dictionary returned by documentnorms().
+# searchmaxscore() returns the k best (docid, score) pairs and the number of documents scored
+#
+def searchmaxscore(cur, line, k, documents, compressed, norms, dictionary=None, restrict=None):
+    weights, elenQ = queryweights(cur, line, documents, compressed, dictionary)
+    if elenQ == 0:
+        return [], 0
+    if restrict is not None:
+        # the bounds of the terms are still upper bounds of the scores of the remaining documents
+        weights = [(termId, weight, [row for row in rows if row[0] in restrict]) for termId, weight, rows in weights]
+
+    # (bound, query weight, docids, tf-idf) of every query term
+    lists = []
+    maxweights = termbounds(cur, [termId for termId, _, _ in weights])
+    for termId, weight, rows in weights:
+        lists.append((weight * maxweights.get(termId, 0.0), weight, [row[0] for row in rows], [row[1] for row in rows]))
+
+    # bounds[i] is the largest score the terms 0 .. i can give together. It is rounded up a
+    # little so that a rounding error in the scores never prunes a document that should be kept
+    lists.sort(key=lambda entry: entry[0])
+    bounds = [bound * (1 + 1e-9) for bound in itertools.accumulate(entry[0] for entry in lists)]
+    cursors = [0] * len(lists)
+    heap = []
+    threshold = 0.0
+    first = 0
+    scored = 0
+    while True:
+        # the terms before first are non essential
+        while first < len(lists) and bounds[first] <= threshold:
+            first += 1
+        if first == len(lists):
+            break
+
+        # the next document is the smallest DocId under the cursors of the essential terms
+        docid = None
+        for i in range(first, len(lists)):
+            docids = lists[i][2]
+            if cursors[i] < len(docids) and (docid is None or docids[cursors[i]] < docid):
+                docid = docids[cursors[i]]
+        if docid is None:
+            break
+
+        norm = norms.get(docid, 0.0)
+        score = 0.0
+        for i in range(first, len(lists)):
+            docids = lists[i][2]
+            if cursors[i] < len(docids) and docids[cursors[i]] == docid:
+                score += lists[i][1] * lists[i][3][cursors[i]] / norm
+                cursors[i] += 1
+        scored += 1
+
+        # add the non essential terms, largest bound first, while the document can still make it
+        for i in range(first - 1, -1, -1):
+            if score + bounds[i] <= threshold:
+                break
+            docids = lists[i][2]
+            cursors[i] = bisect.bisect_left(docids, docid, cursors[i])
+            if cursors[i] < len(docids) and docids[cursors[i]] == docid:
+                score += lists[i][1] * lists[i][3][cursors[i]] / norm
+        else:
+            entry = (score, -docid)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+            if len(heap) == k:
+                threshold = heap[0][0]
+
+    return [(-negdocid, score / elenQ) for score, negdocid in sorted(heap, reverse=True)], scored
+# return the figures of the whole collection stored by the index writer as a dictionary name -> value
+# (documents, averagelength, and k1, b, impactscale when the index holds BM25 impacts). An index
+# written before the CollectionStatistics table existed has none
+def collectionstatistics(cur):
+    cur.execute("select count(*) from sqlite_master where type = 'table' and name = 'CollectionStatistics'")
+    if cur.fetchone()[0] == 0:
+        return {}
+    cur.execute("select Name, value from CollectionStatistics")
+    return dict(cur.fetchall())
+# prepare the BM25 scorer of searchbm25(): the tuple (k1, b, average length, document lengths,
+# impact scale). When the index holds impacts computed with the same k1 and b the impacts are used,
+# and the lengths are not needed (None). Otherwise the scale is None and the lengths of every
+# document are read, so that the weights can be computed from the term frequencies
+def bm25scorer(cur, k1=bm25.defaultk1, b=bm25.defaultb):
+    statistics = collectionstatistics(cur)
+    if statistics.get('k1') == k1 and statistics.get('b') == b and 'impactscale' in statistics:
+        return (k1, b, statistics['averagelength'], None, statistics['impactscale'])
+    cur.execute("select DocId, length from DocumentStatistics")
+    lengths = dict(cur.fetchall())
+    averagelength = statistics.get('averagelength')
+    if averagelength is None:
+        averagelength = float(sum(lengths.values())) / len(lengths) if lengths else 0.0
+    return (k1, b, averagelength, lengths, None)
+# return the BM25 impacts of several terms, read with one query, as a dictionary TermId -> list
+# of (DocId, impact) sorted by DocId
+def termimpactlists(cur, termIds):
+    lists = {}
+    for batch, params in batches(termIds):
+        cur.execute("select TermId, impacts from PostingImpact where TermId in (%s)" % params, batch)
+        for termId, blob in cur.fetchall():
+            lists[termId] = decodepostings(blob)
+    return lists
+#
+# Term at a time BM25 (see bm25.py), scorer is the tuple returned by bm25scorer(). With the impacts
+# of the index the score of a document is a sum of integers: no log and no division are computed
+# for the query, the k best totals are only multiplied by the scale of the impacts at the end.
+# Without impacts the weights are computed from the term frequencies and the document lengths. A
+# term repeated in the query counts as many times. Only the documents of restrict are kept when it
+# is given. searchbm25() returns the k best (docid, score) pairs and the number of candidate documents
+#
+def searchbm25(cur, line, k, documents, compressed, scorer, dictionary=None, restrict=None):
+    k1, b, averagelength, lengths, scale = scorer
+    querytf, found = querytermids(cur, line, dictionary)
+
+    accumulators = {}
+    if scale is not None:
+        lists = termimpactlists(cur, found.values())
+        for term, tf in querytf.items():
+            for docid, impact in lists.get(found.get(term), []):
+                accumulators[docid] = accumulators.get(docid, 0) + tf * impact
+    else:
+        lists = termpostingslists(cur, found.values(), compressed)
+        for term, tf in querytf.items():
+            rows = lists.get(found.get(term), [])
+            if len(rows) == 0:
+                continue
+            idf = tf * bm25.idf(documents, rows[0][2])
+            for row in rows:
+                docid = row[0]
+                accumulators[docid] = accumulators.get(docid, 0.0) + idf * bm25.termweight(row[3], lengths.get(docid, 0), averagelength, k1, b)
+
+    if restrict is not None:
+        accumulators = dict((docid, score) for docid, score in accumulators.items() if docid in restrict)
+    results = topk(accumulators.items(), k)
+    if scale is not None:
+        results = [(docid, score * scale) for docid, score in results]
+    return results, len(accumulators)
+# check whether the index holds the positions of the terms (PostingPositions table)
+def positionalindex(cur):
+    cur.execute("select count(*) from sqlite_master where type = 'table' and name = 'PostingPositions'")
+    return cur.fetchone()[0] == 1
+# the positions where a phrase starts in a document: the positions of its first term are merged
+# with the positions of every next term shifted back by its offset in the phrase, and only the
+# positions found in both lists are kept. lists are the sorted positions of the terms
+def phrasestarts(lists, offsets):
+    starts = [position - offsets[0] for position in lists[0]]
+    for positions, offset in zip(lists[1:], offsets[1:]):
+        kept = []
+        i = j = 0
+        while i < len(starts) and j < len(positions):
+            start = positions[j] - offset
+            if starts[i] == start:
+                kept.append(start)
+                i += 1
+                j += 1
+            elif starts[i] < start:
+                i += 1
+            else:
+                j += 1
+        starts = kept
+        if not starts:
+            break
+    return starts
+# check whether two sorted position lists hold positions at most k apart, by merging them: only the
+# smaller of the two current positions can still be close to a later position of the other list
+def nearby(first, second, k):
+    i = j = 0
+    while i < len(first) and j < len(second):
+        if abs(first[i] - second[j]) <= k:
+            return True
+        if first[i] < second[j]:
+            i += 1
+        else:
+            j += 1
+    return False
+#
+# Return the set of the documents that satisfy every phrase and proximity constraint of a query (see
+# parsequery()). The documents holding all of the terms of the constraints are found first from the
+# (TermId, DocId) index of PostingPositions, then only the positions of the terms in those documents
+# are read and decoded, and the constraints are checked by merging the position lists
+#
+def phrasedocuments(cur, constraints, dictionary=None):
+    terms = set()
+    for constraint in constraints:
+        if constraint[0] == 'phrase':
+            terms.update(term for term, _ in constraint[1])
+        else:
+            terms.update(constraint[1:3])
+    found = lookuptermids(cur, terms, dictionary)
+    if len(found) < len(terms):
+        return set()
+
+    candidates = None
+    for termId in found.values():
+        cur.execute("select DocId from PostingPositions where TermId = ?", (termId,))
+        docids = set(row[0] for row in cur.fetchall())
+        candidates = docids if candidates is None else candidates & docids
+        if not candidates:
+            return set()
+
+    positions = {}
+    termIds = list(found.values())
+    for batch, params in batches(sorted(candidates), 999 - len(termIds)):
+        cur.execute("select TermId, DocId, positions from PostingPositions where TermId in (%s) and DocId in (%s)" % (','.join('?' * len(termIds)), params), termIds + batch)
+        for termId, docid, blob in cur.fetchall():
+            positions[termId, docid] = decodepositions(blob)
+
+    matches = set()
+    for docid in candidates:
+        for constraint in constraints:
+            if constraint[0] == 'phrase':
+                lists = [positions[found[term], docid] for term, _ in constraint[1]]
+                if not phrasestarts(lists, [offset for _, offset in constraint[1]]):
+                    break
+            elif not nearby(positions[found[constraint[1]], docid], positions[found[constraint[2]], docid], constraint[3]):
+                break
+        else:
+            matches.add(docid)
+    return matches
+# check whether the compressed posting lists have skip pointers (skips column of PostingList)
+def skippedindex(cur):
+    cur.execute("pragma table_info(PostingList)")
+    return 'skips' in [row[1] for row in cur.fetchall()]
+#
+# Evaluate a Boolean query (see booleanquery.py). The posting lists of its terms are read with one
+# query: with the compressed format the cursors jump over the blobs with their skip pointers, else
+# they gallop over the DocIds read from the Posting table. Returns the sorted DocIds of the matching
+# documents and the words of the query that are not negated, which rank the documents
+#
+def booleandocuments(cur, line, compressed, dictionary=None):
+    tree = booleanquery.parse(line, queryterms)
+    found = lookuptermids(cur, booleanquery.terms(tree), dictionary)
+
+    lists = {}
+    skips = "skips" if compressed and skippedindex(cur) else "null"
+    for batch, params in batches(found.values()):
+        if compressed:
+            cur.execute("select TermId, docfreq, postings, %s from PostingList where TermId in (%s)" % (skips, params), batch)
+            for termId, docfreq, blob, skips in cur.fetchall():
+                lists[termId] = (docfreq, blob, skips)
+            continue
+        cur.execute("select TermId, DocId from Posting where TermId in (%s) order by TermId, DocId" % params, batch)
+        for termId, group in itertools.groupby(cur.fetchall(), key=lambda row: row[0]):
+            lists[termId] = [row[1] for row in group]
+
+    # every operand gets its own cursor, a term can be found twice in a query
+    def postings(term):
+        data = lists.get(found.get(term))
+        if data is None:
+            return None
+        if compressed:
+            return PostingCursor(data[1], data[2], data[0])
+        return booleanquery.ListCursor(data)
+    def universe():
+        cur.execute("select DocId from DocumentDictionary order by DocId")
+        return [row[0] for row in cur.fetchall()]
+    return booleanquery.evaluate(tree, postings, universe), ' '.join(booleanquery.words(tree))
+#
+# Answer a query: the documents are ranked by search(), or by searchmaxscore() with pruning, or by
+# searchbm25() when a BM25 scorer is given (see bm25scorer()), and when the query has phrases or NEAR
+# operators only the documents that satisfy them are ranked. An index built without positions
+# answers such a query as if it had none. With boolean the query is a Boolean query instead (see
+# booleandocuments()): only the documents that satisfy it are ranked, and the ones that none of
+# its words score come last with a score of 0. Returns the k best (docid, score) pairs and the
+# number of candidate documents
+#
+def rank(cur, line, k, documents, compressed, dictionary=None, norms=None, pruning=False, scorer=None, boolean=False):
+    restrict = None
+    if boolean:
+        matches, text = booleandocuments(cur, line, compressed, dictionary)
+        restrict = set(matches)
+    else:
+        text, constraints = parsequery(line)
+        if constraints and positionalindex(cur):
+            restrict = phrasedocuments(cur, constraints, dictionary)
+    if restrict is not None and not restrict:
+        return [], 0
+
+    if scorer is not None:
+        results, candidates = searchbm25(cur, text, k, documents, compressed, scorer, dictionary, restrict)
+    elif pruning:
+        if norms is None:
+            norms = documentnorms(cur)
+        results, candidates = searchmaxscore(cur, text, k, documents, compressed, norms, dictionary, restrict)
+    else:
+        results, candidates = search(cur, text, k, documents, compressed, dictionary, norms, restrict)
+
+    # the documents that match the query but got no score (all of their terms have idf 0, or the
+    # query has no terms outside a NOT) are ranked last with a score of 0
+    if restrict is not None:
+        if not boolean:
+            matches = sorted(restrict)
+        if len(results) < k:
+            ranked = set(docid for docid, _ in results)
+            results = results + [(docid, 0.0) for docid in matches if docid not in ranked][:k - len(results)]
+        candidates = len(matches)
+    return results, candidates
+# return the names of the given documents as a dictionary docid -> DocumentName
+def documentnames(cur, docids):
+    names = {}
+    for batch, params in batches(docids):
+        cur.execute("select DocId, DocumentName from DocumentDictionary where DocId in (%s)" % params, batch)
+        names.update(cur.fetchall())
+    return names
+# read a file of queries, one per line, as a list of (query id, query). A line is either
+# "id<tab>query" or just the query, which is then numbered by its line number
+def readqueries(filename):
+    queries = []
+    with open(filename, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            if line.strip() == '':
+                continue
+            if '\t' in line:
+                qid, line = line.split('\t', 1)
+            else:
+                qid = str(number)
+            queries.append((qid.strip(), line))
+    return queries
+#
+# Evaluate a list of (query id, query) against the index of the database file. Every worker runs
+# this on its share of the queries with its own connection to the index, which sqlite lets any
+# number of readers share. The results of the queries seen before are taken from a query cache of
+# cachesize queries (0 disables it). The documents are ranked with BM25 when parameters, the tuple
+# (k1, b), are given, and the queries are Boolean queries with boolean. Returns the list of
+# (query id, [(DocumentName, score)], seconds) of every query and the (hits, misses) of the cache
+#
+def searchqueries(database, queries, k, pruning, cachesize=0, parameters=None, boolean=False):
+    con = sqlite3.connect(database)
+    cur = con.cursor()
+    cur.execute("select count(*) from DocumentDictionary")
+    documents = cur.fetchone()[0]
+    compressed = compressedindex(cur)
+    norms = documentnorms(cur) if pruning else None
+    scorer = bm25scorer(cur, *parameters) if parameters is not None else None
+    dictionary = mappeddictionary(cur, database)
+    cache = QueryCache(cachesize)
+    cache.validate(indexgeneration(cur))
+
+    answers = []
+    for qid, line in queries:
+        t = time.perf_counter()
+        key = querykey(line, k, pruning, 'bm25' if scorer is not None else 'cosine', boolean)
+        ranked = cache.get(key) if cachesize > 0 else None
+        if ranked is None:
+            results, candidates = rank(cur, line, k, documents, compressed, dictionary, norms, pruning, scorer, boolean)
+            names = documentnames(cur, [docid for docid, _ in results])
+            ranked = [(names[docid], score) for docid, score in results]
+            cache.put(key, ranked)
+        answers.append((qid, ranked, time.perf_counter() - t))
+    con.close()
+    return answers, (cache.hits, cache.misses)
+# nearest rank percentile p (0 - 100) of a sorted list of values
+def percentile(values, p):
+    if len(values) == 0:
+        return 0.0
+    return values[max(0, int(math.ceil(p / 100.0 * len(values))) - 1)]
+#
+# Batch mode: the queries of a file are split into shards that a pool of jobs worker processes
+# evaluate concurrently (jobs 1 runs them in this process). The ranked results are written in the
+# TREC run format, one line per document: query id, Q0, document, rank, score and run tag. The
+# throughput and the latency percentiles of the queries are printed at the end. Every worker keeps
+# a cache of the results of the last cachesize queries it evaluated. parameters are the (k1, b) of
+# BM25, None ranks with the cosine similarity, boolean evaluates Boolean queries
+#
+def batchsearch(database, queryfile, runfile, k, pruning, jobs, cachesize=0, parameters=None, boolean=False):
+    queries = readqueries(queryfile)
+    tag = 'bm25' if parameters is not None else 'maxscore' if pruning else 'cosine'
+
+    t = time.perf_counter()
+    if jobs == 1:
+        answers, (hits, misses) = searchqueries(database, queries, k, pruning, cachesize, parameters, boolean)
+    else:
+        # a few shards per worker so that a slow shard does not keep the others idle
+        workers = jobs if jobs > 0 else os.cpu_count()
+        size = max(1, int(math.ceil(len(queries) / (workers * 4.0))))
+        shards = [queries[i:i + size] for i in range(0, len(queries), size)]
+        answers = []
+        hits = misses = 0
+        for shard, counts in Parallel(n_jobs=jobs)(delayed(searchqueries)(database, shard, k, pruning, cachesize, parameters, boolean) for shard in shards):
+            answers.extend(shard)
+            hits += counts[0]
+            misses += counts[1]
+    elapsed = time.perf_counter() - t
+
+    with open(runfile, 'w', encoding='utf-8') as run:
+        for qid, results, _ in answers:
+            for rank, (name, score) in enumerate(results, 1):
+                run.write('%s Q0 %s %d %.6f %s\n' % (qid, name, rank, score, tag))
+
+    latencies = sorted(seconds for _, _, seconds in answers)
+    print('Queries %i in %.3f s, %.1f queries/s' % (len(answers), elapsed, len(answers) / elapsed if elapsed > 0 else 0.0))
+    print('Latency ms: p50 %.2f p90 %.2f p95 %.2f p99 %.2f max %.2f' % tuple(1000 * percentile(latencies, p) for p in (50, 90, 95, 99, 100)))
+    if cachesize > 0:
+        print('Query cache: %i hits, %i misses, hit rate %.1f%%' % (hits, misses, 100.0 * hits / max(1, hits + misses)))
+    print('Run written to %s' % runfile)
 """
 ================================================================================================
 >>> main
@@ -50,6 +667,39 @@ interpreter will find this 'main' routine and execute it first.
 ================================================================================================
 """
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search the inverted index of cacm.db')
+    parser.add_argument('--pruning', action='store_true', help='skip the documents that cannot make the top k (MaxScore)')
+    parser.add_argument('--batch', metavar='QUERIES', help='evaluate every query of the file QUERIES ("id<tab>query" or "query" per line)')
+    parser.add_argument('--run', default='run.txt', help='file that receives the TREC run of --batch (default run.txt)')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes of --batch, -1 uses every core')
+    parser.add_argument('-k', type=int, default=20, help='number of documents returned per query (default 20)')
+    parser.add_argument('--cache', type=int, default=10000, help='number of query results cached by every worker of --batch, 0 disables the cache')
+    parser.add_argument('--scorer', choices=['cosine', 'bm25'], default='cosine', help='ranking function (default cosine)')
+    parser.add_argument('--k1', type=float, default=bm25.defaultk1, help='BM25 k1 (default %(default)s)')
+    parser.add_argument('--b', type=float, default=bm25.defaultb, help='BM25 b (default %(default)s)')
+    parser.add_argument('--boolean', action='store_true', help='Boolean queries: AND, OR, NOT and parentheses')
+    args = parser.parse_args()
+    if args.pruning and args.scorer != 'cosine':
+        parser.error('--pruning only applies to the cosine scorer')
+    # the BM25 parameters, None for the cosine similarity
+    parameters = (args.k1, args.b) if args.scorer == 'bm25' else None
+    con = sqlite3.connect("cacm.db")
+    if not currentindex(con.cursor()):
+        parser.error(staleindex % "cacm.db")
+    con.close()
+
+    #
+    # Batch mode: the queries of a file are evaluated by a pool of workers and written as a
+    # TREC run instead of answering a single query typed by the user
+    #
+    if args.batch:
+        con = sqlite3.connect("cacm.db")
+        if args.pruning and not boundedindex(con.cursor()):
+            parser.error('--pruning needs the TermStatistics of an index built by the current indexer')
+        con.close()
+        batchsearch("cacm.db", args.batch, args.run, args.k, args.pruning, args.jobs, args.cache, parameters, args.boolean)
+        sys.exit(0)
+
     #
     # Create a sqlite database to hold the inverted index. The isolation_level statment turns
     # on autocommit which means that changes made in the database are committed automatically
@@ -60,7 +710,10 @@ if __name__ == '__main__':
     #
     #
     #
-    line = input('Enter the search terms, each separated by a space: ')
+    if args.boolean:
+        line = input('Enter a Boolean query (AND, OR, NOT and parentheses): ')
+    else:
+        line = input('Enter the search terms, each separated by a space: ')
     #
     # Capture the start time of the search so that we can determine the total running
     # time required to process the search
@@ -68,102 +721,47 @@ if __name__ == '__main__':
     t2 = time.localtime()
     print('Start Time: %.2d:%.2d:%.2d' % (t2.tm_hour, t2.tm_min, t2.tm_sec))
     #
-    # This routine splits the contents of the line into tokens
-    l = splitchars(line)
-    #
     # Get the total number of documents in the collection
     #
     q = "select count(*) from DocumentDictionary"
     cur.execute(q)
     row = cur.fetchone()
     documents = row[0]
-    
-    # Initialize maxterms variable. This will be used to determine the maximum number of search
-    # terms that exists in any one document.
-    #
-    maxterms = float(0)
-    # process the tokens (search terms) entered by the user
-    for elmt in l:
-        # This statement removes the newline character if found
-        elmt = elmt.replace('\n','')
-        
-        # This statement converts all letters to lower case
-        lowerElmt = elmt.lower().strip()
-        
-        #
-        # Execute query to determine if the term exists in the dictionary
-        #
-        q = "select Term, TermId from TermDictionary where Term = '%s'" % (lowerElmt)
-        print(q)
-        cur.execute(q)
-        row = cur.fetchone()
-
-        #
-        # If the term exists in the dictionary retrieve all documents for the term and store in a list
-        #
-        if len(row) > 0:
-            termId = row[1]
-            q = "select distinct DocId, tfidf, docfreq, termfreq, TermId from Posting where TermId = '%s' order by DocId" % (termId)
-            cur.execute(q)
-            for row in cur:
-                i_term = row[4]
-                i_docid = row[0]
-                if not ( i_docid in docs.keys()):
-                    docs[i_docid] = Docs()
-                    docs[i_docid].terms = {}
-                if not ( i_term in docs[i_docid].terms.keys()):
-                    docs[i_docid].terms[i_docid] = Term()
-                    docs[i_docid].terms[i_docid].docfreq = row[2]
-                    docs[i_docid].terms[i_docid].termfreq = row[3]
-                    docs[i_docid].terms[i_docid].idf = 0.0
-                    docs[i_docid].terms[i_docid].tfidf = row[1]
-
-    resultslist = docs
-    if len(resultslist) == 0:
-        print ('There are no documents containing any of your query terms.')
-    
+    compressed = compressedindex(cur)
+    if args.pruning and not boundedindex(cur):
+        parser.error('--pruning needs the TermStatistics of an index built by the current indexer')
+    #
+    # The terms are looked up in the term dictionary file of the index when it is up to date
+    #
+    dictionary = mappeddictionary(cur, "cacm.db")
+
     #
     # Calculate tfidf values for both the query and each document
     # Using the tfidf (or weight) value, accumulate the vectors and calculate
-    # the cosine similarity between the query and each document
+    # the cosine similarity between the query and each document, then keep
+    # the top k (20 by default) most relevant documents
     #
-    
-    #
-    # Calculate the denominator which is the euclidean length of the query
-    # multipled by the euclidean lenght of the document
+    # With --pruning the documents that cannot make the top k are skipped. A "quoted phrase" or
+    # a NEAR/k operator only keeps the documents where the terms appear together
     #
-    
+    # With --scorer bm25 the documents are ranked with BM25 instead, from the impacts stored in
+    # the index when it has them
     #
-    # This search engine will match on any number of terms and the cosine similarity of a
-    # docment matches on 1 term that appears in a document in the collection tends to score highly
-    # the float(no_terms/maxtersm) portion of the equation is designed to give a higher weight
-    # to documents that match on more than 1 term in queries that have multiple terms.
-    # The remainder of the equation calculates the cosine similarity
+    scorer = bm25scorer(cur, *parameters) if parameters is not None else None
+    # With --boolean only the documents that satisfy the Boolean query are ranked
     #
+    results, candidates = rank(cur, line, args.k, documents, compressed, dictionary, pruning=args.pruning, scorer=scorer, boolean=args.boolean)
+    if candidates == 0:
+        print ('There are no documents containing any of your query terms.')
 
-    #
-    # Sort the results found in order of decreasing cosine similarity. Becuase we cannot use a float
-    # value as an index to a list, I multipled the cosine similarity value by 10,000 and converted
-    # to an integer. For example if the cosine similarity was calculated to be .98970 multiplying
-    # it by 10,000 would produce 9897.0 and converting to an integer would result in 9897 which can be
-    # used as an index that we can then sort in reverse order. To display the cosine similarity
-    # correctly in the results list we simply convert it back to a float value and divide by 10,000
-    #
-    keylist = resultslist.keys()
-    
-    # sort in descending order
-    sorted(keylist, reverse=True)
-    i = 0
-    
-    # print out the top 20 most relevant documents (or as many as were found)
-    for key in keylist:
-        i+= 1
-        if i > 20:
-            continue
-        q = "select DocumentName from DocumentDictionary where DocId = '%d'" % (key)
-        cur.execute(q)
-        row = cur.fetchone()
-        print ("Document: %s Has cosine similarity of %f" % (row[0], float(key)/10000))
+    # print out the top k most relevant documents (or as many as were found), their names are
+    # read with a single query
+    names = documentnames(cur, [docid for docid, _ in results])
+    for docid, score in results:
+        if scorer is not None:
+            print ("Document: %s Has BM25 score of %f" % (names[docid], score))
+        else:
+            print ("Document: %s Has cosine similarity of %f" % (names[docid], score))
     con.close()
     
     #
@@ -171,4 +769,4 @@ if __name__ == '__main__':
     #
     t2 = time.localtime()
     print ('End Time: %.2d:%.2d:%.2d' % (t2.tm_hour, t2.tm_min, t2.tm_sec))
-    print ('Total candidate documents:', len(docs))
\ No newline at end of file
+    print ('Total candidate documents:', candidates)
\ No newline at end of file
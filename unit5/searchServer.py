@@ -0,0 +1,279 @@
+"""
+==================================================================================================
+
+Search server for the inverted index of the search engine (searchEngine.py).
+
+searchEngine.py opens the database, counts the documents and looks up the
+terms of every query cold, then exits. This server does that work once: it
+loads the collection statistics, the term dictionary (the term dictionary file
+mapped in memory, else the TermDictionary table) and the document norms when
+it starts, keeps a pool of sqlite connections open, and answers queries over
+HTTP with JSON results. Every request is served by its own thread.
+
+The results of the most recent queries are kept in a query cache (see
+querycache.py). When the indexer or the crawler commits a new generation of
+the index, the server loads the statistics again and empties the cache.
+
+    GET /search?q=<query>[&k=20][&pruning=1][&scorer=bm25][&boolean=1]
+
+        {"query": "...", "k": 20, "pruning": false, "scorer": "cosine", "boolean": false, "cached": false, "candidates": 113, "ms": 0.8,
+         "results": [{"rank": 1, "docid": 80, "document": "cacm/CACM-0080.html", "score": 0.199}, ...]}
+
+    GET /stats
+
+        {"documents": 570, "terms": 2472, "generation": 3, "queries": 12, "connections": 4,
+         "cache": {"size": 10, "hits": 2, "misses": 10, "evictions": 0, "expirations": 0, "invalidations": 0, "hitrate": 0.17}}
+
+Usage:
+
+    python searchServer.py [--index cacm.db] [--host 127.0.0.1] [--port 8080] [--connections 4]
+                           [--cache 10000] [--ttl seconds] [--k1 1.2] [--b 0.75]
+    curl 'http://127.0.0.1:8080/search?q=computer+algorithm&k=5'
+    curl 'http://127.0.0.1:8080/search?q=%22binary+search%22+tree+NEAR/5+balanced'
+==================================================================================================
+"""
+
+import argparse
+import json
+import queue
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import bm25
+import searchEngine
+from querycache import QueryCache
+
+# close a mapped term dictionary (MappedDictionary), the dictionary of the TermDictionary table has
+# nothing to close
+def closedictionary(dictionary):
+    if hasattr(dictionary, 'close'):
+        dictionary.close()
+
+#
+# The state shared by the requests: the statistics of the collection, the term dictionary, the
+# document norms, the BM25 scorer, and a pool of connections to the index. sqlite connections
+# cannot be used by two threads at the same time, so a request takes a connection from the pool
+# and gives it back
+#
+class SearchIndex:
+
+    def __init__(self, database, connections=4, cachesize=10000, ttl=None, k1=bm25.defaultk1, b=bm25.defaultb):
+        self.database = database
+        self.parameters = (k1, b)
+        self.pool = queue.Queue()
+        for _ in range(connections):
+            # the connection is handed from thread to thread, but only one thread uses it at a time
+            self.pool.put(sqlite3.connect(database, check_same_thread=False))
+        self.connections = connections
+        self.queries = 0
+        self.lock = threading.Lock()
+        self.cache = QueryCache(cachesize, ttl)
+        self.generation = None
+        self.state = None
+        # the number of requests using each generation, and the dictionaries of the generations
+        # replaced while requests still used them, closed by the last of these requests
+        self.readers = {}
+        self.retired = {}
+
+        con = self.pool.get()
+        try:
+            cur = con.cursor()
+            self.state = self.loadstate(cur, searchEngine.indexgeneration(cur))
+            self.generation = self.state[0]
+            self.cache.validate(self.generation)
+        finally:
+            con.rollback()
+            self.pool.put(con)
+
+    def loadstate(self, cur, generation):
+        """loadstate(cur, generation) reads the state of the generation of the
+        index that the read transaction of cur sees.
+        """
+        cur.execute("select count(*) from DocumentDictionary")
+        documents = cur.fetchone()[0]
+        # the mapped term dictionary file shares its pages with the other processes that use it
+        dictionary = searchEngine.mappeddictionary(cur, self.database)
+        if dictionary is None:
+            dictionary = searchEngine.termdictionary(cur)
+        return (generation, documents, searchEngine.compressedindex(cur), searchEngine.boundedindex(cur),
+                dictionary, searchEngine.documentnorms(cur), searchEngine.bm25scorer(cur, *self.parameters))
+
+    def acquire(self, cur):
+        """acquire(cur) returns the state of the generation of the index that
+        the read transaction of cur sees, and counts the request as a reader of
+        that generation until release(). A newer generation than the one loaded
+        is loaded, and empties the query cache. Returns None when the
+        transaction sees an older generation than the one loaded: the state is
+        never put back to an older generation.
+        """
+        generation = searchEngine.indexgeneration(cur)
+        with self.lock:
+            if generation > self.generation:
+                # the requests in flight keep the state they started with, a new one is swapped in whole
+                previous = self.state
+                self.state = self.loadstate(cur, generation)
+                self.cache.validate(generation)
+                self.generation = generation
+                # the mapped dictionary of the previous generation is closed once no request uses it
+                if self.readers.get(previous[0]):
+                    self.retired[previous[0]] = previous[4]
+                else:
+                    closedictionary(previous[4])
+            if generation != self.generation:
+                return None
+            self.readers[generation] = self.readers.get(generation, 0) + 1
+            return self.state
+
+    def release(self, state):
+        with self.lock:
+            generation = state[0]
+            self.readers[generation] -= 1
+            if not self.readers[generation]:
+                del self.readers[generation]
+                if generation in self.retired:
+                    closedictionary(self.retired.pop(generation))
+
+    def search(self, line, k=20, pruning=False, scorer='cosine', boolean=False):
+        """search(line, k, pruning, scorer, boolean) returns the JSON answer of a query as a dictionary."""
+        t = time.perf_counter()
+        con = self.pool.get()
+        state = None
+        private = False
+        try:
+            cur = con.cursor()
+            # a read transaction, so that the whole query sees a single generation of the index, and
+            # the state (term dictionary, norms) of that same generation
+            cur.execute("begin")
+            state = self.acquire(cur)
+            if state is None:
+                # the transaction started before the commit of the generation loaded: a new one sees it
+                con.rollback()
+                cur.execute("begin")
+                state = self.acquire(cur)
+            if state is None:
+                # the database went back to an older generation (the file was replaced): the request
+                # reads a state of its own, and neither reads nor fills the cache
+                state = self.loadstate(cur, searchEngine.indexgeneration(cur))
+                private = True
+            generation, documents, compressed, bounded, dictionary, norms, bm25scorer = state
+            pruning = pruning and bounded and scorer == 'cosine'
+            key = searchEngine.querykey(line, k, pruning, scorer, boolean)
+            answer = None if private else self.cache.get(key)
+            cached = answer is not None
+            if not cached:
+                results, candidates = searchEngine.rank(cur, line, k, documents, compressed, dictionary, norms, pruning,
+                                                        bm25scorer if scorer == 'bm25' else None, boolean)
+                names = searchEngine.documentnames(cur, [docid for docid, _ in results])
+                answer = (candidates, [{"rank": rank, "docid": docid, "document": names[docid], "score": score} for rank, (docid, score) in enumerate(results, 1)])
+                if not private:
+                    self.cache.put(key, answer, generation)
+        finally:
+            if private:
+                closedictionary(state[4])
+            elif state is not None:
+                self.release(state)
+            con.rollback()
+            self.pool.put(con)
+        with self.lock:
+            self.queries += 1
+        return {
+            "query": line,
+            "k": k,
+            "pruning": pruning,
+            "scorer": scorer,
+            "boolean": boolean,
+            "cached": cached,
+            "candidates": answer[0],
+            "ms": 1000 * (time.perf_counter() - t),
+            "results": answer[1],
+        }
+
+    def stats(self):
+        cache = self.cache
+        generation, documents, compressed, bounded, dictionary, norms, bm25scorer = self.state
+        return {
+            "documents": documents,
+            "terms": len(dictionary),
+            "generation": generation,
+            "queries": self.queries,
+            "connections": self.connections,
+            "cache": {"size": len(cache.cache), "hits": cache.hits, "misses": cache.misses, "evictions": cache.evictions,
+                      "expirations": cache.expirations, "invalidations": cache.invalidations, "hitrate": cache.hitrate()},
+        }
+
+    def close(self):
+        for _ in range(self.connections):
+            self.pool.get().close()
+        closedictionary(self.state[4])
+
+class SearchHandler(BaseHTTPRequestHandler):
+
+    # set by serve()
+    index = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == '/search':
+            line = params.get('q', [''])[0]
+            try:
+                k = int(params.get('k', ['20'])[0])
+            except ValueError:
+                return self.reply(400, {"error": "k must be an integer"})
+            if k < 1:
+                return self.reply(400, {"error": "k must be at least 1"})
+            pruning = params.get('pruning', ['0'])[0] not in ('', '0', 'false')
+            scorer = params.get('scorer', ['cosine'])[0]
+            if scorer not in ('cosine', 'bm25'):
+                return self.reply(400, {"error": "scorer must be cosine or bm25"})
+            boolean = params.get('boolean', ['0'])[0] not in ('', '0', 'false')
+            return self.reply(200, self.index.search(line, k, pruning, scorer, boolean))
+        if url.path == '/stats':
+            return self.reply(200, self.index.stats())
+        return self.reply(404, {"error": "unknown path %s" % url.path})
+
+    def reply(self, status, answer):
+        body = json.dumps(answer).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # one line per request is too much for a server answering thousands of queries
+        pass
+
+def serve(database, host='127.0.0.1', port=8080, connections=4, cachesize=10000, ttl=None, k1=bm25.defaultk1, b=bm25.defaultb):
+    index = SearchIndex(database, connections, cachesize, ttl, k1, b)
+    SearchHandler.index = index
+    server = ThreadingHTTPServer((host, port), SearchHandler)
+    server.daemon_threads = True
+    stats = index.stats()
+    print('Serving %s (%i documents, %i terms) on http://%s:%i/' % (database, stats["documents"], stats["terms"], host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    index.close()
+    print(index.cache.stats())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the queries of the inverted index over HTTP with JSON results')
+    parser.add_argument('--index', default='cacm.db', help='database holding the inverted index (default cacm.db)')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on (default 8080)')
+    parser.add_argument('--connections', type=int, default=4, help='number of sqlite connections in the pool (default 4)')
+    parser.add_argument('--cache', type=int, default=10000, help='number of query results kept in the cache, 0 disables the cache (default 10000)')
+    parser.add_argument('--ttl', type=float, default=None, help='seconds a cached result is kept (default: until it is evicted)')
+    parser.add_argument('--k1', type=float, default=bm25.defaultk1, help='BM25 k1 of scorer=bm25 (default %(default)s)')
+    parser.add_argument('--b', type=float, default=bm25.defaultb, help='BM25 b of scorer=bm25 (default %(default)s)')
+    args = parser.parse_args()
+    con = sqlite3.connect(args.index)
+    if not searchEngine.currentindex(con.cursor()):
+        parser.error(searchEngine.staleindex % args.index)
+    con.close()
+    serve(args.index, args.host, args.port, args.connections, args.cache, args.ttl, args.k1, args.b)
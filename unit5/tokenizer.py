@@ -0,0 +1,100 @@
+"""
+==================================================================================================
+
+Streaming tokenization pipeline shared by the indexer (unit 4), the search
+engine (unit 5) and the web crawler (unit 7).
+
+    read -> tokenize -> filter -> stem -> (term, docid)
+
+positionalterms() also gives the position of every term, for a positional index.
+
+Every stage is a generator, so a document is streamed line by line and only the
+current line is held in memory. The words are extracted with a single regular
+expression pass over the lower cased line, and all the filters (minimum length,
+stop words, numbers) are applied in the same loop as the stemming, instead of
+replace/strip/split followed by one pass per check.
+
+Usage:
+
+    counts = TokenCounts()
+    stream = terms(readlines('cacm/CACM-0001.html'), enStopwords, 3, stemword, counts)
+    for term, docid in postings(1, stream):
+        ...
+==================================================================================================
+"""
+
+import io
+import re
+
+# stop words of the indexer and the search engine
+enStopwords = {'and', 'ours', 'as', 'am', "mightn't", 'about', 'why', 'most', "you've", 'doing', 'under', 'didn', 'weren', "she's", 'yourselves', "mustn't", 'just', 'won', 'such', 'hadn', 'are', "you'd", 'mustn', "weren't", 'our', 'if', "don't", 'm', 'so', 'here', 'then', 'shan', 'during', 'it', 'were', 'the', 'with', "wasn't", 'yourself', 'off', 'been', 'or', 'for', 'own', 'too', 'nor', 'be', 'y', 'my', "you'll", 'from', 't', 'will', 'll', 'above', 'i', 'o', 'other', 'in', 'how', 'than', 'they', 'has', 'further', 'she', 'having', 'each', 'is', 'me', 'was', 'you', 're', 'until', 'on', 'we', 'by', 'between', 's', 'which', "haven't", 'at', 'ourselves', 'no', 'theirs', "shan't", 'out', 'his', 'this', 'of', 'ma', 'her', "didn't", 'their', 'can', "should've", 'couldn', 'myself', 'more', "that'll", 'there', 'them', 'your', 'ain', "needn't", 'against', 'a', 'wouldn', 'through', 'now', 'him', "isn't", 'whom', 'being', 'did', 'once', "hasn't", 'don', 'herself', 'only', 've', 'all', 'into', 'not', 'while', 'to', 'isn', 'when', "shouldn't", 'very', 'shouldn', 'because', 'needn', 'mightn', 'those', "wouldn't", 'both', 'an', 'below', 'again', "aren't", 'doesn', 'have', 'but', 'do', "won't", 'its', 'themselves', 'that', 'these', 'haven', 'before', 'does', 'hers', 'where', "couldn't", "hadn't", 'he', 'd', 'over', 'up', "doesn't", 'who', 'hasn', 'down', 'any', 'aren', "it's", "you're", 'same', 'himself', 'what', 'few', 'wasn', 'after', 'had', 'should', 'yours', 'some', 'itself'}
+
+# a token is a run of word characters, anything else separates tokens
+words = re.compile(r'\w+')
+
+#
+# Counters of one pass of the pipeline: every token read, the stop words
+# dropped and the terms produced
+#
+class TokenCounts():
+
+    def __init__(self):
+        self.tokens = 0
+        self.stopwords = 0
+        self.terms = 0
+
+# read: stream the lines of a file
+def readlines(filename, encoding='windows-1252'):
+    with io.open(filename, 'r', encoding=encoding) as unicode_file:
+        for line in unicode_file:
+            yield line
+
+# tokenize: stream the lower cased tokens of the lines
+def tokenize(lines):
+    findall = words.findall
+    for line in lines:
+        for token in findall(line.lower()):
+            yield token
+
+# tokenize, filter and stem in a single pass. A token is kept when it is at
+# least minlength characters long, is not a stop word and is not a number.
+# stem is called with the token and returns its stem, None keeps the token.
+def terms(lines, stopwords=enStopwords, minlength=3, stem=None, counts=None):
+    if counts is None:
+        counts = TokenCounts()
+    findall = words.findall
+    for line in lines:
+        for token in findall(line.lower()):
+            counts.tokens += 1
+            if token in stopwords:
+                counts.stopwords += 1
+                continue
+            if len(token) < minlength or token.isdigit():
+                continue
+            counts.terms += 1
+            yield stem(token) if stem is not None else token
+
+# the same as terms(), but every term comes with its position in the lines: the number of
+# tokens before it, stop words and dropped tokens included, so that the words of a phrase
+# keep their distance when a stop word is removed from between them
+def positionalterms(lines, stopwords=enStopwords, minlength=3, stem=None, counts=None):
+    if counts is None:
+        counts = TokenCounts()
+    findall = words.findall
+    position = -1
+    for line in lines:
+        for token in findall(line.lower()):
+            position += 1
+            counts.tokens += 1
+            if token in stopwords:
+                counts.stopwords += 1
+                continue
+            if len(token) < minlength or token.isdigit():
+                continue
+            counts.terms += 1
+            yield (stem(token) if stem is not None else token), position
+
+# pair every term of a document with its docid
+def postings(docid, terms):
+    for term in terms:
+        yield term, docid
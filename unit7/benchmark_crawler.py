@@ -0,0 +1,141 @@
+"""
+Crawl benchmark of the fetch engine of webCrawler.py against a local synthetic site.
+
+A local HTTP/1.1 server (keep-alive) serves a synthetic site of pages that each
+hold a few paragraphs of text and links to other pages. Every answer is delayed
+by a fixed latency to stand for the network round trip. Some pages fail with a
+503 the first time they are requested, to exercise the retries, and one page
+never answers in time, to exercise the timeout.
+
+The same pages are then fetched three ways:
+  - one at a time with urllib.request.urlopen(), the former fetch loop,
+  - concurrently with Fetcher (fetcher.py),
+  - by the crawl of webCrawler.py with Fetcher, indexed into an in-memory database.
+
+Usage: python benchmark_crawler.py [pages] [latency in ms] [concurrency]
+"""
+
+import sys
+import time
+import random
+import asyncio
+import sqlite3
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import webCrawler
+from fetcher import Fetcher, FetchError
+from indexwriter import IndexWriter
+
+words = ('algorithm', 'compiler', 'matrix', 'sorting', 'language', 'program', 'storage', 'retrieval', 'network',
+         'parallel', 'recursive', 'numerical', 'system', 'function', 'table', 'search', 'binary', 'graph')
+
+# the synthetic site: page n links to links other pages, every twentieth page fails once with a
+# 503, and the page /slow never answers in time
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    pages = 1000
+    links = 8
+    latency = 0.02
+    failed = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        if self.path == '/slow':
+            time.sleep(60)
+        try:
+            n = int(self.path.strip('/').split('.')[0] or '0')
+        except ValueError:
+            n = -1
+        if not (0 <= n < self.pages):
+            return self.answer(404, b'not found')
+        with self.lock:
+            first = n % 20 == 7 and n not in self.failed
+            self.failed.add(n)
+        if first:
+            return self.answer(503, b'busy')
+        rnd = random.Random(n)
+        paragraphs = ''.join('<p>%s</p>' % ' '.join(rnd.choice(words) for _ in range(40)) for _ in range(3))
+        links = ''.join('<a href="/%d.html">page %d</a> ' % (m, m) for m in (rnd.randrange(self.pages) for _ in range(self.links)))
+        self.answer(200, ('<html><body>%s%s<a href="/slow">slow</a></body></html>' % (paragraphs, links)).encode('utf-8'))
+
+    def answer(self, status, body):
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up on the page (timeout)
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+def sequential(base, urls):
+    fetched = 0
+    for url in urls:
+        try:
+            urllib.request.urlopen(base + url, timeout=2).read()
+            fetched += 1
+        except Exception:
+            pass
+    return fetched
+
+async def concurrent(base, urls, concurrency):
+    fetcher = Fetcher(concurrency, concurrency, timeout=2, retries=2, backoff=0.05)
+    async def one(url):
+        try:
+            return (await fetcher.fetch(base + url)).status == 200
+        except FetchError:
+            return False
+    fetched = sum(await asyncio.gather(*[one(url) for url in urls]))
+    await fetcher.close()
+    return fetched, fetcher
+
+def report(name, fetched, seconds):
+    print('%-12s %6i pages in %7.2f s %8.1f pages/s' % (name, fetched, seconds, fetched / seconds))
+
+if __name__ == '__main__':
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    SiteHandler.pages = pages
+    SiteHandler.latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20.0) / 1000
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SiteHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = 'http://127.0.0.1:%d' % server.server_address[1]
+    print('Site of %i pages on %s, latency %.0f ms' % (pages, base, 1000 * SiteHandler.latency))
+
+    # the sequential fetch is slow: a sample of the pages is enough for its rate
+    sample = ['/%d.html' % n for n in range(0, pages, 10)]
+    t = time.perf_counter()
+    report('urlopen', sequential(base, sample), time.perf_counter() - t)
+
+    SiteHandler.failed = set()
+    urls = ['/%d.html' % n for n in range(pages)]
+    t = time.perf_counter()
+    fetched, fetcher = asyncio.run(concurrent(base, urls, concurrency))
+    report('fetcher', fetched, time.perf_counter() - t)
+    print(fetcher.stats())
+
+    # the page that never answers is given up after the timeout of every attempt
+    t = time.perf_counter()
+    fetched, fetcher = asyncio.run(concurrent(base, ['/slow'], concurrency))
+    print('/slow given up after %.2f s (%i attempts of 2 s)' % (time.perf_counter() - t, fetcher.retried + 1))
+
+    SiteHandler.failed = set()
+    con = sqlite3.connect(':memory:')
+    writer = IndexWriter(con)
+    writer.create()
+    fetcher = Fetcher(concurrency, concurrency, timeout=2, retries=2, backoff=0.05)
+    t = time.perf_counter()
+    crawled = asyncio.run(webCrawler.crawl(base + '/0.html', pages // 2, fetcher, {}, writer))
+    report('crawl+index', crawled, time.perf_counter() - t)
+    print(fetcher.stats())
+    writer.close()
+    con.close()
+    server.shutdown()
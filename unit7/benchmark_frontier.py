@@ -0,0 +1,76 @@
+"""
+Benchmark of the crawl frontier (frontier.py) against the former list of crawled URLs.
+
+A crawl extracts many more links than it has pages, and most of them point to
+pages already seen. The links of a synthetic crawl (links per page, drawn from
+a site of pages URLs with some spelling variants) are offered one by one to:
+  - a Python list searched with `in`, the former `crawled` list of webCrawler.py
+    (only on a sample, it is quadratic),
+  - a set of the URL strings,
+  - Frontier with its exact VisitedSet of 64 bits hashes,
+  - Frontier with a BloomFilter,
+and the time per link and the memory of the structure are reported. Frontier
+also canonicalizes the links, so it finds the duplicates the others miss.
+
+Usage: python benchmark_frontier.py [pages] [links per page]
+"""
+
+import sys
+import time
+import random
+import asyncio
+import tracemalloc
+from frontier import Frontier, canonicalize
+
+def links(pages, perpage):
+    rnd = random.Random(1)
+    variants = ('http://www.example.com/p/%d.html', 'http://WWW.Example.com:80/p/%d.html',
+                'http://www.example.com/p/./%d.html#top', 'http://www.example.com/q/../p/%d.html')
+    site = pages * 4
+    return [rnd.choice(variants) % rnd.randrange(site) for _ in range(pages * perpage)]
+
+def crawledlist(urls):
+    crawled = []
+    for url in urls:
+        if url not in crawled:
+            crawled.append(url)
+    return crawled
+
+def crawledset(urls):
+    crawled = set()
+    for url in urls:
+        if url not in crawled:
+            crawled.add(url)
+    return crawled
+
+async def frontier(urls, bloom):
+    canonicalize.cache_clear()
+    tocrawl = Frontier('fifo', bloom)
+    for url in urls:
+        tocrawl.offer(url)
+    return tocrawl
+
+# the time is measured first, tracemalloc slows down the run it traces
+def measure(name, function, urls):
+    t = time.perf_counter()
+    function(urls)
+    seconds = time.perf_counter() - t
+    tracemalloc.start()
+    result = function(urls)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print('%-22s %9i links %8.2f s %8.2f us/link %9.1f MB' % (name, len(urls), seconds, 1e6 * seconds / len(urls), memory / 1e6))
+    return result
+
+if __name__ == '__main__':
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    perpage = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    urls = links(pages, perpage)
+    print('%i links of a crawl of %i pages' % (len(urls), pages))
+
+    measure('list (sample)', crawledlist, urls[:20000])
+    measure('set of URLs', crawledset, urls)
+    exact = measure('Frontier', lambda urls: asyncio.run(frontier(urls, 0)), urls)
+    bloom = measure('Frontier + Bloom', lambda urls: asyncio.run(frontier(urls, 4 * pages)), urls)
+    print(exact.stats())
+    print(bloom.stats())
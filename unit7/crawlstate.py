@@ -0,0 +1,147 @@
+"""
+==================================================================================================
+
+Checkpoints of a crawl of the web crawler (unit 7), so that a crawl that
+crashed or was interrupted resumes where it stopped instead of from zero.
+
+The state of a crawl lives in memory until the index is written at the end:
+the frontier (the URLs waiting, the URLs seen), the documents crawled and the
+partial inverted index. CrawlCheckpoint saves it every so often in a sqlite
+file next to the index (webcrawler.db keeps only the finished index):
+
+    CrawlState      the settings and counters of the crawl, Name -> value
+    CrawlDocument   the DocId, URL and fingerprint of every page indexed
+    CrawlDuplicate  the URL of every near-duplicate page, with the DocId of its original
+    CrawlTerm       the TermId of every term
+    CrawlPostings   the postings (and positions) of the terms, in chunks
+    CrawlFrontier   the URLs waiting to be crawled, with the pages in flight
+    CrawlVisited    the set of the URLs seen (see frontier.py), as a blob
+    CrawlHost       the number of URLs offered per host
+
+A crawl only appends: the DocIds only grow and a page is indexed in full
+before the next one, so a checkpoint only adds the documents, the terms and the
+postings of the pages indexed since the previous checkpoint (one chunk per
+term that got new postings). The frontier and the visited set are written
+again in full. A checkpoint is a single transaction: when the crawl dies in the
+middle of one, the previous checkpoint is still there whole.
+
+Usage:
+
+    checkpoint = CrawlCheckpoint('webcrawler-checkpoint.db')
+    checkpoint.create({'start': url, 'limit': 1000})
+    checkpoint.save(state, documents, terms, postings, frontier.snapshot(inflight), duplicates)
+    ...
+    state, documents, terms, postings, snapshot, duplicates = CrawlCheckpoint('webcrawler-checkpoint.db').load()
+==================================================================================================
+"""
+
+import os
+import sqlite3
+
+# the 64 bits fingerprints are kept in the signed integers of sqlite in two's complement
+def signed(fingerprint):
+    return fingerprint - (1 << 64) if fingerprint is not None and fingerprint >= 1 << 63 else fingerprint
+
+def unsigned(fingerprint):
+    return fingerprint & ((1 << 64) - 1) if fingerprint is not None else None
+
+class CrawlCheckpoint:
+
+    tables = [
+        ("CrawlState", "create table CrawlState (Name text primary key, value)"),
+        ("CrawlDocument", "create table CrawlDocument (DocId integer primary key, DocumentName text, fingerprint int)"),
+        ("CrawlDuplicate", "create table CrawlDuplicate (DocumentName text, DocId int)"),
+        ("CrawlTerm", "create table CrawlTerm (Term text primary key, TermId int)"),
+        ("CrawlPostings", "create table CrawlPostings (Term text, postings blob, positions blob)"),
+        ("CrawlFrontier", "create table CrawlFrontier (Sequence integer primary key, Priority int, Url text)"),
+        ("CrawlVisited", "create table CrawlVisited (Name text primary key, data blob)"),
+        ("CrawlHost", "create table CrawlHost (Host text primary key, count int)"),
+    ]
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.con = None
+        self.saves = 0
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def connect(self):
+        if self.con is None:
+            self.con = sqlite3.connect(self.filename)
+            self.con.execute("pragma synchronous = normal")
+        return self.con
+
+    def create(self, settings):
+        """create(settings) starts a new checkpoint file, with the settings of
+        the crawl (a dictionary of names and values) in CrawlState.
+        """
+        con = self.connect()
+        with con:
+            for name, statement in CrawlCheckpoint.tables:
+                con.execute("drop table if exists %s" % name)
+                con.execute(statement)
+            con.executemany("insert into CrawlState values (?, ?)", settings.items())
+
+    def save(self, state, documents, terms, postings, snapshot, duplicates=()):
+        """save(state, documents, terms, postings, snapshot, duplicates) writes a
+        checkpoint in one transaction. state is a dictionary of the counters of
+        the crawl, documents the (DocId, URL, fingerprint or None) of the pages
+        indexed since the previous checkpoint, terms the (term, TermId) of the
+        new terms, postings the (term, postings, positions) chunks of the new
+        postings as bytes, snapshot the state of the frontier
+        (Frontier.snapshot()) and duplicates the (URL, DocId) of the new
+        near-duplicate pages.
+        """
+        con = self.connect()
+        with con:
+            con.executemany("insert or replace into CrawlState values (?, ?)", state.items())
+            con.executemany("insert into CrawlDocument values (?, ?, ?)",
+                            ((docid, url, signed(fingerprint)) for docid, url, fingerprint in documents))
+            con.executemany("insert into CrawlDuplicate values (?, ?)", duplicates)
+            con.executemany("insert into CrawlTerm values (?, ?)", terms)
+            con.executemany("insert into CrawlPostings values (?, ?, ?)", postings)
+            con.execute("delete from CrawlFrontier")
+            con.executemany("insert into CrawlFrontier values (?, ?, ?)",
+                            ((sequence, priority, url) for priority, sequence, url in snapshot['queue']))
+            con.execute("delete from CrawlHost")
+            con.executemany("insert into CrawlHost values (?, ?)", snapshot['hosts'].items())
+            con.executemany("insert or replace into CrawlState values (?, ?)",
+                            [('frontier.' + name, snapshot[name]) for name in ('order', 'sequence', 'offered', 'duplicates', 'visited')])
+            con.execute("insert or replace into CrawlVisited values ('visited', ?)", (snapshot['data'],))
+        self.saves += 1
+
+    def load(self):
+        """load() returns (state, documents, terms, postings, snapshot,
+        duplicates) of the last checkpoint: state has the settings and the
+        counters, documents, terms and duplicates are lists of (DocId, URL,
+        fingerprint), (term, TermId) and (URL, DocId), postings is a list of
+        (term, postings, positions) in the order they were saved and snapshot
+        is the state of the frontier for Frontier.restore().
+        """
+        con = self.connect()
+        state = dict(con.execute("select Name, value from CrawlState"))
+        if 'frontier.order' not in state:
+            raise ValueError('%s holds no checkpoint' % self.filename)
+        documents = [(docid, url, unsigned(fingerprint)) for docid, url, fingerprint in
+                     con.execute("select DocId, DocumentName, fingerprint from CrawlDocument order by DocId")]
+        duplicates = con.execute("select DocumentName, DocId from CrawlDuplicate").fetchall()
+        terms = con.execute("select Term, TermId from CrawlTerm").fetchall()
+        postings = con.execute("select Term, postings, positions from CrawlPostings order by rowid").fetchall()
+        snapshot = {name: state.pop('frontier.' + name) for name in ('order', 'sequence', 'offered', 'duplicates', 'visited')}
+        snapshot['queue'] = [(priority, sequence, url) for sequence, priority, url in
+                             con.execute("select Sequence, Priority, Url from CrawlFrontier order by Sequence")]
+        snapshot['hosts'] = dict(con.execute("select Host, count from CrawlHost"))
+        snapshot['data'] = con.execute("select data from CrawlVisited where Name = 'visited'").fetchone()[0]
+        return state, documents, terms, postings, snapshot, duplicates
+
+    def close(self):
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+
+    def remove(self):
+        """remove() deletes the checkpoint file, once the index of the crawl is written."""
+        self.close()
+        if self.exists():
+            os.remove(self.filename)
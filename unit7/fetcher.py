@@ -0,0 +1,272 @@
+"""
+==================================================================================================
+
+Concurrent fetch engine of the web crawler (unit 7), built on asyncio.
+
+urllib.request.urlopen() fetches one page at a time, opens a new connection for
+every page and waits forever for a server that does not answer, so the crawl
+goes at the pace of a single round trip. Fetcher instead runs many requests at
+the same time in one thread:
+
+  - at most concurrency requests are in flight, and at most perhost to the
+    same host, so that a large site does not get hammered,
+  - the connections are HTTP/1.1 keep-alive connections kept in a pool per
+    host and reused by the next requests to the host,
+  - every attempt is bounded by a timeout, that only starts once the request
+    has its slots (the time waiting for them is not a failure of the host),
+  - a failed attempt (connection error, timeout, 429 or 5xx status) is retried
+    up to retries times, after a backoff that doubles every time (with jitter),
+  - redirects are followed.
+
+Only the standard library is used: the requests are written and the responses
+parsed (Content-Length, chunked or read until close) over asyncio streams.
+
+Usage:
+
+    async def main():
+        fetcher = Fetcher(concurrency=64, perhost=8, timeout=10)
+        try:
+            response = await fetcher.fetch('http://localhost:8765/')
+            print(response.status, len(response.body))
+        except FetchError as e:
+            print(e)
+        await fetcher.close()
+        print(fetcher.stats())
+
+    asyncio.run(main())
+==================================================================================================
+"""
+
+import asyncio
+import random
+import ssl
+from urllib.parse import urlsplit, urljoin
+
+# statuses worth another attempt, and statuses that redirect
+retrystatuses = (429, 500, 502, 503, 504)
+redirectstatuses = (301, 302, 303, 307, 308)
+
+class FetchError(Exception):
+    """A page that could not be fetched, after the retries."""
+
+class Response:
+
+    def __init__(self, url, status, headers, body):
+        """url is the final URL of the page (after the redirects), headers a
+        dictionary with lower case names and body the bytes of the page.
+        """
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+class Fetcher:
+
+    def __init__(self, concurrency=64, perhost=8, timeout=10.0, retries=2, backoff=0.5, redirects=5,
+                 maxsize=8 * 1024 * 1024, useragent='webCrawler/1.0'):
+        """concurrency and perhost limit the requests in flight in total and per
+        host, timeout is the limit of an attempt in seconds (connect, send and
+        read), retries the number of attempts after the first one, backoff the
+        wait in seconds before the first retry, redirects the number of
+        redirects followed and maxsize the largest page accepted in bytes.
+        """
+        self.concurrency = concurrency
+        self.perhost = perhost
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.redirects = redirects
+        self.maxsize = maxsize
+        self.useragent = useragent
+        self.slots = None
+        # (scheme, host, port) -> semaphore of the host, and its idle keep-alive connections
+        self.hostslots = {}
+        self.idle = {}
+        self.sslcontext = None
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.opened = 0
+        self.reused = 0
+        self.received = 0
+
+    async def fetch(self, url):
+        """fetch(url) returns the Response of url, following the redirects. It
+        raises FetchError when the page cannot be fetched.
+        """
+        for _ in range(self.redirects + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https') or not parts.hostname:
+                raise FetchError('%s: not an http URL' % url)
+            response = await self.attempts(url)
+            location = response.headers.get('location')
+            if response.status not in redirectstatuses or location is None:
+                return response
+            url = urljoin(url, location)
+        raise FetchError('%s: too many redirects' % url)
+
+    async def attempts(self, url):
+        """attempts(url) requests url until it gets an answer worth keeping or
+        runs out of retries.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = await self.request(url)
+                if response.status not in retrystatuses or attempt >= self.retries:
+                    return response
+            except (OSError, EOFError, ValueError, asyncio.TimeoutError) as e:
+                if attempt >= self.retries:
+                    self.failures += 1
+                    raise FetchError('%s: %s' % (url, str(e) or type(e).__name__))
+            attempt += 1
+            self.retried += 1
+            await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+    async def request(self, url):
+        """request(url) sends one GET request once there is a slot for it for
+        its host and then in total, and reads the answer within the timeout.
+        """
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, parts.hostname, port)
+        host = parts.hostname if parts.port is None else '%s:%d' % (parts.hostname, port)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        message = ('GET %s HTTP/1.1\r\nHost: %s\r\nUser-Agent: %s\r\nAccept: */*\r\nConnection: keep-alive\r\n\r\n'
+                   % (path, host, self.useragent)).encode('iso-8859-1')
+
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.concurrency)
+        if key not in self.hostslots:
+            self.hostslots[key] = asyncio.Semaphore(self.perhost)
+        # the slot of the host first: a request waiting for a busy host must not hold a global slot
+        # that requests to the other hosts could use
+        async with self.hostslots[key], self.slots:
+            self.requests += 1
+            status, headers, body = await asyncio.wait_for(self.exchange(key, message), self.timeout)
+        self.received += len(body)
+        return Response(url, status, headers, body)
+
+    async def exchange(self, key, message):
+        """exchange(key, message) sends a request over a pooled connection of
+        the host and returns (status, headers, body) of the answer.
+        """
+        reader, writer, reused = await self.connection(key)
+        try:
+            try:
+                writer.write(message)
+                await writer.drain()
+                status, headers, body, keepalive = await self.readresponse(reader)
+            except (OSError, EOFError):
+                if not reused:
+                    raise
+                # the server closed the idle connection in the meantime: once more on a new one
+                writer.close()
+                reader, writer, reused = await self.connection(key, False)
+                writer.write(message)
+                await writer.drain()
+                status, headers, body, keepalive = await self.readresponse(reader)
+        except BaseException:
+            # includes the cancellation of a timeout: the connection is in an unknown state
+            writer.close()
+            raise
+        if keepalive:
+            self.idle.setdefault(key, []).append((reader, writer))
+        else:
+            writer.close()
+        return status, headers, body
+
+    async def connection(self, key, pooled=True):
+        """connection(key) returns (reader, writer, reused): an idle connection
+        of the pool of the host when there is one, else a new connection.
+        """
+        idle = self.idle.get(key)
+        while pooled and idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                self.reused += 1
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = key
+        context = None
+        if scheme == 'https':
+            if self.sslcontext is None:
+                self.sslcontext = ssl.create_default_context()
+            context = self.sslcontext
+        reader, writer = await asyncio.open_connection(host, port, ssl=context)
+        self.opened += 1
+        return reader, writer, False
+
+    async def readresponse(self, reader):
+        """readresponse(reader) reads a response and returns (status, headers,
+        body, whether the connection can be used again).
+        """
+        line = await reader.readline()
+        if not line:
+            raise EOFError('connection closed by the server')
+        fields = line.decode('iso-8859-1').split(None, 2)
+        if len(fields) < 2 or not fields[0].startswith('HTTP/'):
+            raise ValueError('bad status line %r' % line[:80])
+        version = fields[0]
+        status = int(fields[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('iso-8859-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keepalive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if status in (204, 304) or 100 <= status < 200:
+            body = b''
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            body = await self.readchunks(reader)
+        elif 'content-length' in headers:
+            length = int(headers['content-length'])
+            if length > self.maxsize:
+                raise ValueError('page of %d bytes' % length)
+            body = await reader.readexactly(length)
+        else:
+            # the end of the body is the end of the connection
+            body = await self.readtoclose(reader)
+            keepalive = False
+        return status, headers, body, keepalive
+
+    async def readchunks(self, reader):
+        """readchunks(reader) reads a body sent with the chunked transfer encoding."""
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                # the trailer ends with an empty line
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return bytes(body)
+            body += await reader.readexactly(size)
+            await reader.readline()
+            if len(body) > self.maxsize:
+                raise ValueError('page of more than %d bytes' % self.maxsize)
+
+    async def readtoclose(self, reader):
+        """readtoclose(reader) reads a body that ends when the server closes the connection."""
+        body = bytearray()
+        while True:
+            data = await reader.read(64 * 1024)
+            if not data:
+                return bytes(body)
+            body += data
+            if len(body) > self.maxsize:
+                raise ValueError('page of more than %d bytes' % self.maxsize)
+
+    async def close(self):
+        """close() closes the idle connections of the pool."""
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle = {}
+
+    def stats(self):
+        return "Fetcher: %i requests, %i retries, %i failures, %i connections opened, %i reused, %i bytes" % (
+            self.requests, self.retried, self.failures, self.opened, self.reused, self.received)
@@ -0,0 +1,278 @@
+"""
+==================================================================================================
+
+Crawl frontier of the web crawler (unit 7): the URLs still to crawl and the
+URLs already seen.
+
+The same page is reached through many spellings of its URL (HTTP://Host:80/a/./b
+and http://host/a/b#top), so every URL is first brought to a canonical form by
+canonicalize(): the scheme and the host in lower case, no default port, no
+fragment, no dot segments in the path, an empty path as /, and the percent
+escapes in upper case with the unreserved characters decoded.
+
+The URLs seen are remembered by VisitedSet, a set of 64 bits hashes of the
+canonical URLs instead of the URLs themselves, so a test or an insertion costs
+O(1) whatever the size of the crawl. For the very large crawls a BloomFilter
+holds them in a fixed number of bits instead, at the price of a small rate of
+URLs wrongly taken as seen (and so never crawled).
+
+Frontier is an asyncio queue that the workers of the crawl take the URLs from.
+offer() canonicalizes a URL and enqueues it only when it was never seen, so a
+URL is in the queue at most once. The order is first in first out (breadth
+first), or with order='priority' the smallest priority first. By default the
+priority of a URL is the number of URLs of its host offered before it, which
+interleaves the hosts so that the per host limit of the fetcher does not leave
+the workers waiting on the one host that has the most links.
+
+Usage:
+
+    frontier = Frontier(order='fifo', bloom=0)
+    frontier.offer('http://Example.com:80/a/../b#top')   # queued as http://example.com/b
+    frontier.offer('http://example.com/b')               # already seen: None
+    url = await frontier.get()
+    ...
+    frontier.task_done()
+==================================================================================================
+"""
+
+import asyncio
+import collections
+import functools
+import hashlib
+import heapq
+import math
+import re
+import struct
+from array import array
+from urllib.parse import urlsplit, urljoin
+
+defaultports = {'http': 80, 'https': 443}
+
+# a percent escape, and the characters that never need one (RFC 3986 unreserved)
+escapes = re.compile(r'%([0-9a-fA-F]{2})')
+unreserved = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+
+def urlhash(url):
+    """urlhash(url) returns a 64 bits hash of url."""
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+# an escape of an unreserved character is the character itself, the others are in upper case
+def normalizeescape(match):
+    c = chr(int(match.group(1), 16))
+    return c if c in unreserved else '%' + match.group(1).upper()
+
+# remove the . and .. segments of a path (RFC 3986, 5.2.4)
+def removedotsegments(path):
+    if '.' not in path:
+        return path
+    output = []
+    segments = path.split('/')
+    for i, segment in enumerate(segments):
+        if segment == '.':
+            if i == len(segments) - 1:
+                output.append('')
+        elif segment == '..':
+            if len(output) > 1:
+                output.pop()
+            if i == len(segments) - 1:
+                output.append('')
+        else:
+            output.append(segment)
+    result = '/'.join(output)
+    return result if result.startswith('/') else '/' + result
+
+# the same links are found on page after page (menus, headers): their canonical forms are cached
+@functools.lru_cache(maxsize=65536)
+def canonicalize(url, base=None):
+    """canonicalize(url, base) returns the canonical form of url, resolved
+    against the URL base of the page it was found on when it is relative, or
+    None when it is not an http or https URL.
+    """
+    url = url.strip()
+    if base is not None:
+        url = urljoin(base, url)
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    host = parts.hostname
+    if scheme not in defaultports or not host:
+        return None
+    host = host.rstrip('.')
+    if ':' in host:
+        host = '[' + host + ']'
+    if port is not None and port != defaultports[scheme]:
+        host += ':%d' % port
+    path = removedotsegments(escapes.sub(normalizeescape, parts.path)) or '/'
+    query = escapes.sub(normalizeescape, parts.query)
+    return '%s://%s%s%s' % (scheme, host, path, '?' + query if query else '')
+
+class VisitedSet:
+
+    def __init__(self):
+        """The URLs seen, kept as their 64 bits hashes."""
+        self.hashes = set()
+
+    def add(self, url):
+        """add(url) records url and returns True when it was not seen before."""
+        h = urlhash(url)
+        if h in self.hashes:
+            return False
+        self.hashes.add(h)
+        return True
+
+    def __contains__(self, url):
+        return urlhash(url) in self.hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def dump(self):
+        """dump() returns the hashes as bytes, for a checkpoint of the crawl."""
+        return array('Q', self.hashes).tobytes()
+
+    @classmethod
+    def load(cls, data):
+        visited = cls()
+        hashes = array('Q')
+        hashes.frombytes(data)
+        visited.hashes = set(hashes)
+        return visited
+
+class BloomFilter:
+
+    def __init__(self, capacity, errorrate=0.001):
+        """A Bloom filter sized for capacity URLs with a rate errorrate of false
+        positives: m bits and k hash functions, with m = -n ln(p) / ln(2)^2 and
+        k = m / n ln(2).
+        """
+        self.bits = max(64, int(math.ceil(-capacity * math.log(errorrate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    # the k bit positions of url, by double hashing two 64 bits halves of one digest
+    def positions(self, url):
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, url):
+        """add(url) records url and returns True when it was not (as far as the filter can tell) seen before."""
+        array = self.array
+        new = False
+        for p in self.positions(url):
+            mask = 1 << (p & 7)
+            if not array[p >> 3] & mask:
+                array[p >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, url):
+        array = self.array
+        return all(array[p >> 3] & (1 << (p & 7)) for p in self.positions(url))
+
+    def __len__(self):
+        return self.count
+
+    # a dump is the number of bits, of hash functions and of URLs, then the bits
+    header = struct.Struct('<QII')
+
+    def dump(self):
+        """dump() returns the filter as bytes, for a checkpoint of the crawl."""
+        return BloomFilter.header.pack(self.bits, self.hashes, self.count) + bytes(self.array)
+
+    @classmethod
+    def load(cls, data):
+        bloom = cls.__new__(cls)
+        bloom.bits, bloom.hashes, bloom.count = BloomFilter.header.unpack_from(data)
+        bloom.array = bytearray(data[BloomFilter.header.size:])
+        return bloom
+
+class Frontier(asyncio.Queue):
+
+    def __init__(self, order='fifo', bloom=0):
+        """order is 'fifo' or 'priority'. bloom is the number of URLs the crawl
+        may see, to remember them in a BloomFilter, or 0 to remember them
+        exactly in a VisitedSet.
+        """
+        if order not in ('fifo', 'priority'):
+            raise ValueError('order must be fifo or priority, not %r' % order)
+        self.order = order
+        self.visited = BloomFilter(bloom) if bloom else VisitedSet()
+        # the number of URLs offered per host, the default priority
+        self.hosts = collections.Counter()
+        self.sequence = 0
+        self.offered = 0
+        self.duplicates = 0
+        super().__init__()
+
+    # the storage of asyncio.Queue, as in asyncio.PriorityQueue: (priority, sequence, url) in a
+    # deque, or in a heap where the sequence keeps the URLs of a priority in order
+    def _init(self, maxsize):
+        self._queue = collections.deque() if self.order == 'fifo' else []
+
+    def _put(self, item):
+        if self.order == 'fifo':
+            self._queue.append(item)
+        else:
+            heapq.heappush(self._queue, item)
+
+    def _get(self):
+        if self.order == 'fifo':
+            return self._queue.popleft()[2]
+        return heapq.heappop(self._queue)[2]
+
+    def offer(self, url, base=None, priority=None):
+        """offer(url, base, priority) canonicalizes url (relative to base) and
+        queues it when it was never offered before. It returns the canonical URL
+        queued, or None when url is not an http URL or was already seen.
+        """
+        self.offered += 1
+        url = canonicalize(url, base)
+        if url is None:
+            return None
+        if not self.visited.add(url):
+            self.duplicates += 1
+            return None
+        host = url.split('/', 3)[2]
+        if priority is None:
+            priority = self.hosts[host]
+        self.hosts[host] += 1
+        self.sequence += 1
+        self.put_nowait((priority, self.sequence, url))
+        return url
+
+    def snapshot(self, inflight=()):
+        """snapshot(inflight) returns the state of the frontier as a dictionary,
+        for a checkpoint of the crawl (see crawlstate.py). inflight are the
+        URLs taken from the frontier whose pages are not indexed yet: they are
+        put back at the head of the queue, with sequences below the ones of the
+        queue (which can be the negative ones of a previous snapshot).
+        """
+        inflight = list(inflight)
+        lowest = min((item[1] for item in self._queue), default=1)
+        queue = [(0, lowest - len(inflight) + i, url) for i, url in enumerate(inflight)]
+        queue.extend(self._queue)
+        return {'order': self.order, 'sequence': self.sequence, 'offered': self.offered, 'duplicates': self.duplicates,
+                'visited': 'bloom' if isinstance(self.visited, BloomFilter) else 'set', 'data': self.visited.dump(),
+                'hosts': dict(self.hosts), 'queue': queue}
+
+    def restore(self, snapshot):
+        """restore(snapshot) puts the frontier back in the state of a snapshot()."""
+        self.visited = (BloomFilter if snapshot['visited'] == 'bloom' else VisitedSet).load(snapshot['data'])
+        self.hosts = collections.Counter(snapshot['hosts'])
+        self.sequence = snapshot['sequence']
+        self.offered = snapshot['offered']
+        self.duplicates = snapshot['duplicates']
+        for item in snapshot['queue']:
+            self.put_nowait(tuple(item))
+
+    def stats(self):
+        return "Frontier: %i URLs offered, %i queued, %i duplicates, %i hosts, %i waiting" % (
+            self.offered, len(self.visited), self.duplicates, len(self.hosts), self.qsize())
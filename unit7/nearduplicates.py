@@ -0,0 +1,122 @@
+"""
+==================================================================================================
+
+Near-duplicate detection of the pages of the web crawler (unit 7), with SimHash
+fingerprints and LSH banding.
+
+Mirrors, printer friendly versions and URLs that only differ by a session ID
+are the same page, or nearly, under many URLs. The crawler fingerprints the
+token stream of every page before it is indexed, and a page whose fingerprint
+is close to the one of a page already indexed is not indexed again.
+
+simhash() returns the 64 bits SimHash of a page (Charikar): every shingle of
+shinglesize consecutive tokens is hashed to 64 bits, and bit j of the
+fingerprint is set when the shingles whose hash has bit j set weigh more than
+half of all the shingles. Two pages that share most of their shingles get
+fingerprints that differ in a few bits only, and the number of bits that differ
+(the Hamming distance) grows as the pages differ more. A page of fewer than
+minshingles distinct shingles (a hub of links, a page laid out without <p>)
+has no fingerprint: a few shingles say nothing of the page, and all the pages
+without text would get the same fingerprint.
+
+SimHashIndex finds the fingerprints within distance bits of a new one without
+comparing it to all of them (Manku et al.): the 64 bits are split in distance +
+1 bands, and two fingerprints at most distance bits apart are equal on at least
+one band. Each band has a dictionary from its value to the fingerprints, and
+only the fingerprints that share a band with the new one are compared.
+
+The weight of the bits is counted for all of the bits at once: the hash of a
+shingle is spread over an integer that has a field of 32 bits per bit of the
+hash (with a table per byte), so adding up the shingles of a page is one large
+integer addition per shingle instead of 64.
+
+Usage:
+
+    fingerprints = SimHashIndex(distance=3)
+    fingerprint = simhash(tokenizer.tokenize([text]))   # None for a page of too little text
+    if fingerprint is not None:
+        original = fingerprints.find(fingerprint)       # the docid of a near-duplicate, or None
+        if original is None:
+            fingerprints.add(fingerprint, docid)
+==================================================================================================
+"""
+
+import collections
+import hashlib
+
+shinglesize = 2
+minshingles = 10
+defaultdistance = 3
+
+# spread[i][b] puts bit j of the byte b, byte i of a hash, in the field 8 * i + j of an integer
+# of 32 bits fields
+field = 32
+fieldmask = (1 << field) - 1
+spread = [[sum(1 << ((8 * i + j) * field) for j in range(8) if b >> j & 1) for b in range(256)] for i in range(8)]
+s0, s1, s2, s3, s4, s5, s6, s7 = spread
+
+def simhash(tokens, size=shinglesize, minimum=minshingles):
+    """simhash(tokens, size, minimum) returns the 64 bits SimHash of the
+    shingles of size consecutive tokens of a stream, or None when the stream
+    has fewer than minimum distinct shingles.
+    """
+    tokens = list(tokens)
+    shingles = collections.Counter(map(' '.join, zip(*[tokens[i:] for i in range(size)])))
+    if len(shingles) < max(minimum, 1):
+        return None
+    blake2b = hashlib.blake2b
+    counts = 0
+    for shingle, weight in shingles.items():
+        b0, b1, b2, b3, b4, b5, b6, b7 = blake2b(shingle.encode('utf-8'), digest_size=8).digest()
+        spreaded = s0[b0] | s1[b1] | s2[b2] | s3[b3] | s4[b4] | s5[b5] | s6[b6] | s7[b7]
+        counts += spreaded if weight == 1 else spreaded * weight
+    total = sum(shingles.values())
+    fingerprint = 0
+    for j in range(64):
+        if 2 * ((counts >> (j * field)) & fieldmask) > total:
+            fingerprint |= 1 << j
+    return fingerprint
+
+def distance(a, b):
+    """distance(a, b) returns the Hamming distance of two fingerprints."""
+    return bin(a ^ b).count('1')
+
+class SimHashIndex:
+
+    def __init__(self, distance=defaultdistance):
+        """distance is the largest number of bits two fingerprints of
+        near-duplicate pages differ in.
+        """
+        self.distance = distance
+        bounds = [64 * i // (distance + 1) for i in range(distance + 2)]
+        # (shift, mask) of every band, and band -> value of the band -> [(fingerprint, docid)]
+        self.bands = [(low, (1 << (high - low)) - 1) for low, high in zip(bounds, bounds[1:])]
+        self.tables = [{} for _ in self.bands]
+        self.count = 0
+        self.compared = 0
+
+    def add(self, fingerprint, docid):
+        """add(fingerprint, docid) records the fingerprint of the document docid."""
+        for (shift, mask), table in zip(self.bands, self.tables):
+            table.setdefault((fingerprint >> shift) & mask, []).append((fingerprint, docid))
+        self.count += 1
+
+    def find(self, fingerprint):
+        """find(fingerprint) returns the docid of a document whose fingerprint is
+        at most distance bits from fingerprint, the closest one, or None.
+        """
+        best = None
+        seen = set()
+        for (shift, mask), table in zip(self.bands, self.tables):
+            for other, docid in table.get((fingerprint >> shift) & mask, ()):
+                if docid in seen:
+                    continue
+                seen.add(docid)
+                self.compared += 1
+                d = distance(fingerprint, other)
+                if d <= self.distance and (best is None or d < best[0]):
+                    best = (d, docid)
+        return best[1] if best is not None else None
+
+    def __len__(self):
+        return self.count
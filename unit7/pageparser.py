@@ -0,0 +1,133 @@
+"""
+==================================================================================================
+
+Single pass extraction of the text and the links of a web page for the web
+crawler (unit 7), on the event model of html.parser from the standard library.
+
+The crawler indexes the text of the paragraphs (<p>) of a page and follows the
+href of its tags. PageParser gets both from the same pass over the page: the
+text of a paragraph is collected as its character data events arrive, and a
+link as soon as its start tag is seen, so the time is linear in the size of
+the page. Nothing is kept but the pieces of text and the links, joined at the
+end. The text of <script> and <style> is never text of the page, and a <p> is
+closed by the end of the paragraph, by the next <p> or by a block that cannot
+be inside a paragraph (<div>, <ul>, <table>, ...), as a browser does.
+
+The bytes of the page are decoded with the charset of its byte order mark, else
+of the Content-Type header, else of a <meta> tag in the head of the page, else
+as UTF-8, and as windows-1252 when they are not valid UTF-8. They are decoded
+and fed to the parser in chunks, with an incremental decoder.
+
+Usage:
+
+    text, links = extract(response.body, response.headers.get('content-type'))
+==================================================================================================
+"""
+
+import codecs
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+# the blocks that close an open paragraph, the elements that separate words in a paragraph
+# and the elements whose content is not text
+closesparagraph = frozenset(('address', 'article', 'aside', 'blockquote', 'div', 'dl', 'fieldset', 'footer', 'form',
+                             'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'main', 'nav', 'ol', 'p', 'pre',
+                             'section', 'table', 'ul', 'body', 'html'))
+separators = frozenset(('br', 'img', 'li', 'td', 'th', 'tr', 'dd', 'dt', 'wbr'))
+nottext = frozenset(('script', 'style', 'template', 'noscript'))
+
+# a charset in a Content-Type header, and in a <meta> tag
+headercharset = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.I)
+metacharset = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.I)
+boms = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+class PageParser(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pieces = []          # the text of the paragraphs, piece by piece
+        self.links = []           # the href of the tags, as written in the page
+        self.base = None          # the href of <base>, that the links are relative to
+        self.inparagraph = False
+        self.skipping = 0         # the depth of the script and style elements open
+
+    def handle_starttag(self, tag, attrs):
+        for name, value in attrs:
+            if name == 'href' and value:
+                if tag == 'base':
+                    self.base = value.strip()
+                else:
+                    self.links.append(value.strip())
+        if tag in nottext:
+            self.skipping += 1
+        elif tag in closesparagraph:
+            self.endparagraph()
+            self.inparagraph = tag == 'p'
+        elif tag in separators and self.inparagraph:
+            self.pieces.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag in nottext:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in closesparagraph:
+            self.endparagraph()
+
+    def handle_data(self, data):
+        if self.inparagraph and not self.skipping:
+            self.pieces.append(data)
+
+    def endparagraph(self):
+        if self.inparagraph:
+            self.inparagraph = False
+            self.pieces.append(' ')
+
+    def text(self):
+        """text() returns the text of the paragraphs, with the white space collapsed."""
+        return ' '.join(''.join(self.pieces).split())
+
+def charset(body, contenttype=None):
+    """charset(body, contenttype) returns the name of the codec of the bytes of
+    a page, from its Content-Type header, its byte order mark or its <meta>
+    tag, or None when none of them names a known codec.
+    """
+    for bom, name in boms:
+        if body.startswith(bom):
+            return name
+    candidates = []
+    if contenttype:
+        match = headercharset.search(contenttype)
+        if match:
+            candidates.append(match.group(1))
+    match = metacharset.search(body, 0, 2048)
+    if match:
+        candidates.append(match.group(1).decode('ascii', 'replace'))
+    for name in candidates:
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            continue
+    return None
+
+def extract(body, contenttype=None, chunksize=64 * 1024):
+    """extract(body, contenttype, chunksize) returns (text, links) of a page
+    given as bytes: the text of its paragraphs and the href of its tags, as
+    written in the page but resolved against its <base> when it has one.
+    """
+    encoding = charset(body, contenttype)
+    if encoding is None:
+        try:
+            body.decode('utf-8')
+            encoding = 'utf-8'
+        except UnicodeDecodeError:
+            encoding = 'windows-1252'
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    parser = PageParser()
+    for start in range(0, len(body), chunksize):
+        parser.feed(decoder.decode(body[start:start + chunksize]))
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    links = parser.links
+    if parser.base is not None:
+        links = [urljoin(parser.base, link) for link in links]
+    return parser.text(), links
@@ -342,3 +342,193 @@ class PorterStemmer:
         self.step4()
         self.step5()
         return self.b[self.k0:self.k+1]
+
+    def stem_many(self, words):
+        """stem_many(words) stems a whole batch of words and returns the list
+        of their stems, the same as calling stem(w, 0, len(w) - 1) on each
+        word. Every distinct word of the batch is only stemmed once, with the
+        faster stemword() below.
+        """
+        stems = {}
+        result = []
+        for w in words:
+            s = stems.get(w)
+            if s is None:
+                s = stems[w] = stemword(w)
+            result.append(s)
+        return result
+
+"""
+==================================================================================================
+
+Faster implementation of the same algorithm, used by stem_many().
+
+The class above keeps the word in instance attributes and cons() calls itself
+recursively for every 'y', so m() and vowelinstem() rescan the word character
+by character with method calls. stemword() instead works on local variables:
+
+  - the word is translated once into a pattern of 'c' (consonant) and 'v'
+    (vowel) characters, and only translated again when a suffix is replaced
+    (truncating the word leaves the pattern of the prefix unchanged),
+  - m() becomes pattern.count('vc') and vowelinstem() a find() of 'v', both
+    running in C over the pattern,
+  - the suffix rules of steps 2, 3 and 4 are tables keyed by the same letter
+    the class switches on, tried in the same order.
+
+The points of DEPARTURE of the class are kept, so both give the same output.
+==================================================================================================
+"""
+
+# step 2 and step 4 are keyed by the penultimate letter, step 3 by the last one
+step2rules = {
+    'a': (("ational", "ate"), ("tional", "tion")),
+    'c': (("enci", "ence"), ("anci", "ance")),
+    'e': (("izer", "ize"),),
+    'l': (("bli", "ble"), ("alli", "al"), ("entli", "ent"), ("eli", "e"), ("ousli", "ous")),
+    'o': (("ization", "ize"), ("ation", "ate"), ("ator", "ate")),
+    's': (("alism", "al"), ("iveness", "ive"), ("fulness", "ful"), ("ousness", "ous")),
+    't': (("aliti", "al"), ("iviti", "ive"), ("biliti", "ble")),
+    'g': (("logi", "log"),),
+}
+step3rules = {
+    'e': (("icate", "ic"), ("ative", ""), ("alize", "al")),
+    'i': (("iciti", "ic"),),
+    'l': (("ical", "ic"), ("ful", "")),
+    's': (("ness", ""),),
+}
+step4rules = {
+    'a': ("al",),
+    'c': ("ance", "ence"),
+    'e': ("er",),
+    'i': ("ic",),
+    'l': ("able", "ible"),
+    'n': ("ant", "ement", "ment", "ent"),
+    'o': ("ion", "ou"),
+    's': ("ism",),
+    't': ("ate", "iti"),
+    'u': ("ous",),
+    'v': ("ive",),
+    'z': ("ize",),
+}
+
+class ConsonantTable(dict):
+    """Translation table of str.translate(): a, e, i, o and u are vowels, y is
+    decided afterwards from the letter before it, anything else is a consonant.
+    """
+    def __missing__(self, key):
+        return 'c'
+
+consonanttable = ConsonantTable((i, 'c') for i in range(256))
+for ch in 'aeiou':
+    consonanttable[ord(ch)] = 'v'
+consonanttable[ord('y')] = 'y'
+
+def cvpattern(b):
+    """cvpattern(b) returns a string with 'c' for every consonant of b and 'v'
+    for every vowel, following cons(): y is a consonant at the start of the word
+    or after a vowel, and a vowel after a consonant.
+    """
+    pattern = b.translate(consonanttable)
+    if 'y' in pattern:
+        if pattern[0] == 'y':
+            pattern = 'c' + pattern[1:]
+        # every pass decides at least the first y left, the one after it may be another y
+        while 'y' in pattern:
+            pattern = pattern.replace('cy', 'cv').replace('vy', 'vc')
+    return pattern
+
+def stemword(b):
+    """stemword(b) returns the stem of the whole word b, the same as
+    PorterStemmer().stem(b, 0, len(b) - 1).
+    """
+    k = len(b) - 1
+    if k <= 1:
+        return b # --DEPARTURE--, see stem()
+    cv = cvpattern(b)
+
+    # step1ab
+    if b[k] == 's':
+        if b.endswith("sses", 0, k + 1):
+            k -= 2
+        elif b.endswith("ies", 0, k + 1):
+            b = b[:k - 2] + "i"
+            k -= 2
+            cv = cvpattern(b)
+        elif b[k - 1] != 's':
+            k -= 1
+    last = b[k]
+    if last == 'd' and b.endswith("eed", 0, k + 1):
+        if cv.count('vc', 0, k - 2) > 0:
+            k -= 1
+    else:
+        j = -1
+        if last == 'd':
+            if b.endswith("ed", 0, k + 1):
+                j = k - 2
+        elif last == 'g':
+            if b.endswith("ing", 0, k + 1):
+                j = k - 3
+        if j >= 0 and cv.find('v', 0, j + 1) >= 0:
+            k = j
+            if b.endswith("at", 0, k + 1) or b.endswith("bl", 0, k + 1) or b.endswith("iz", 0, k + 1):
+                b = b[:k + 1] + "e"
+                k += 1
+                cv = cvpattern(b)
+            elif k >= 1 and b[k] == b[k - 1] and cv[k] == 'c':
+                if b[k] != 'l' and b[k] != 's' and b[k] != 'z':
+                    k -= 1
+            elif cv.count('vc', 0, k + 1) == 1 and k >= 2 and cv.startswith('cvc', k - 2) and b[k] not in "wxy":
+                b = b[:k + 1] + "e"
+                k += 1
+                cv = cvpattern(b)
+
+    # step1c
+    if b[k] == 'y' and cv.find('v', 0, k) >= 0:
+        b = b[:k] + "i"
+        cv = cvpattern(b)
+
+    # step2
+    rules = step2rules.get(b[k - 1])
+    if rules:
+        for suffix, replacement in rules:
+            if b.endswith(suffix, 0, k + 1):
+                j = k - len(suffix)
+                if cv.count('vc', 0, j + 1) > 0:
+                    b = b[:j + 1] + replacement
+                    k = j + len(replacement)
+                    cv = cvpattern(b)
+                break
+
+    # step3
+    rules = step3rules.get(b[k])
+    if rules:
+        for suffix, replacement in rules:
+            if b.endswith(suffix, 0, k + 1):
+                j = k - len(suffix)
+                if cv.count('vc', 0, j + 1) > 0:
+                    b = b[:j + 1] + replacement
+                    k = j + len(replacement)
+                    cv = cvpattern(b)
+                break
+
+    # step4
+    rules = step4rules.get(b[k - 1])
+    if rules:
+        for suffix in rules:
+            if b.endswith(suffix, 0, k + 1):
+                j = k - len(suffix)
+                if suffix == "ion" and (j < 0 or (b[j] != 's' and b[j] != 't')):
+                    continue
+                if cv.count('vc', 0, j + 1) > 1:
+                    k = j
+                break
+
+    # step5
+    j = k
+    if b[k] == 'e':
+        a = cv.count('vc', 0, k + 1)
+        if a > 1 or (a == 1 and not (k >= 3 and cv.startswith('cvc', k - 3) and b[k - 1] not in "wxy")):
+            k -= 1
+    if b[k] == 'l' and b[k - 1] == 'l' and cv.count('vc', 0, j + 1) > 1:
+        k -= 1
+    return b[:k + 1]
@@ -0,0 +1,67 @@
+"""
+==================================================================================================
+
+Memoized stemming in front of the PorterStemmer (porterstemmer.py).
+
+The vocabulary of natural language is Zipfian: a small number of words make up
+most of the tokens of a collection, so the stemmer keeps computing the same
+stems over and over. CachedStemmer remembers the stems of the most recently
+used words in a bounded cache with least recently used (LRU) eviction, and
+counts the hits, misses and evictions of the cache. Misses are stemmed with
+the faster stemword() of porterstemmer.py.
+
+Usage:
+
+    stemmer = CachedStemmer()
+    stemmer.stem('running', 0, 6)   # 'run', same call as PorterStemmer.stem
+    stemmer.stem('running')         # the whole word is stemmed by default
+    print(stemmer.stats())
+==================================================================================================
+"""
+
+from collections import OrderedDict
+from porterstemmer import PorterStemmer, stemword
+
+class CachedStemmer:
+
+    def __init__(self, capacity=100000):
+        """capacity is the maximum number of words kept in the cache."""
+        self.capacity = capacity
+        self.stemmer = PorterStemmer()
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stem(self, p, i=0, j=None):
+        """stem(p, i, j) returns the stem of p[i] ... p[j] inclusive, like
+        PorterStemmer.stem. Only whole words are cached.
+        """
+        if j is None:
+            j = len(p) - 1
+        if i != 0 or j != len(p) - 1:
+            return self.stemmer.stem(p, i, j)
+
+        cache = self.cache
+        stem = cache.get(p)
+        if stem is not None:
+            self.hits += 1
+            cache.move_to_end(p)
+            return stem
+
+        self.misses += 1
+        stem = stemword(p)
+        cache[p] = stem
+        if len(cache) > self.capacity:
+            cache.popitem(last=False)
+            self.evictions += 1
+        return stem
+
+    def hitrate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def stats(self):
+        return "Stem cache: %i hits, %i misses, %i evictions, hit rate %.1f%%" % (self.hits, self.misses, self.evictions, 100 * self.hitrate())
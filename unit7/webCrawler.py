@@ -6,30 +6,37 @@ PorterStemmer - this code implements a porter stemmer. We have integrated this c
 into the program and called the stem method.  This routine could have been implemented as a library and
 included into the program but for the sake of simplicity an clarity when debugging, I have simply included
 the source code into my web crawler script. 
-BeautifulSoup - this code which can be found in the resources section of this unit is a python module
-that allows text to be read from a html page. Essentially it returns the text of the html page with all of the HTML tags
-and other formatting removed making providing a simple string containing the contents of a web page
-that can be parsed and indexed by our indexer code.  This module can be downloaded from unit resources
-section which also has instructions for installing the module on your system. 
+pageparser - this module reads the text of the paragraphs and the links of a html page in a single pass
+with the html.parser of the standard library. Essentially it returns the text of the html page with all of
+the HTML tags and other formatting removed making providing a simple string containing the contents of a web page
+that can be parsed and indexed by our indexer code.
 
 
 """
 import sys, os, re
 #import urllib2
-from urllib.request import urlopen
 from urllib.parse import urlparse
-import urllib
-import urllib.request
 
 
 
+import argparse
+import asyncio
 import sqlite3
 import math
 import time
-from bs4 import BeautifulSoup, NavigableString
-from porterstemmer import PorterStemmer
-
-stopwords = ['the', 'of', 'and', 'to', 'in', 'you', 'it', 'with', 'that', 'or', 'was', 'he', 'is', 'for', 'this', 'his', 'as', 'not', 'at', 'by', 'all', 'they', 'but', 'be', 'on', 'from', 'had', 'her', 'work', 'are', 'any', 'she', 'if', 'said', 'so', 'which', 'have', 'do', 'we', 'no', 'my', 'were', 'them', 'their', 'him', 'one', 'will', 'me', 'there', 'who', 'up', 'other', 'an', 'its', 'when', 'what', 'can', 'may', 'into', 'out', 'must', 'your', 'then', 'would', 'could', 'more', 'now', 'has', 'like', 'down', 'where', 'been', 'through', 'did', 'away', 'these', 'such', 'set', 'back', 'some', 'than', 'way', 'made', 'our', 'after', 'well', 'should', 'get', 'even', 'am', 'go', 'saw', 'just', 'put', 'while', 'ever', 'off', 'here', 'also']
+from array import array
+from stemcache import CachedStemmer
+import tokenizer
+from indexwriter import IndexWriter
+from fetcher import Fetcher, FetchError
+from frontier import Frontier
+from crawlstate import CrawlCheckpoint
+from pageparser import extract
+from nearduplicates import SimHashIndex, simhash, defaultdistance
+import bm25
+from postingcodec import encodepostings, encodepositions
+
+stopwords = {'the', 'of', 'and', 'to', 'in', 'you', 'it', 'with', 'that', 'or', 'was', 'he', 'is', 'for', 'this', 'his', 'as', 'not', 'at', 'by', 'all', 'they', 'but', 'be', 'on', 'from', 'had', 'her', 'work', 'are', 'any', 'she', 'if', 'said', 'so', 'which', 'have', 'do', 'we', 'no', 'my', 'were', 'them', 'their', 'him', 'one', 'will', 'me', 'there', 'who', 'up', 'other', 'an', 'its', 'when', 'what', 'can', 'may', 'into', 'out', 'must', 'your', 'then', 'would', 'could', 'more', 'now', 'has', 'like', 'down', 'where', 'been', 'through', 'did', 'away', 'these', 'such', 'set', 'back', 'some', 'than', 'way', 'made', 'our', 'after', 'well', 'should', 'get', 'even', 'am', 'go', 'saw', 'just', 'put', 'while', 'ever', 'off', 'here', 'also'}
 # regular expression for: extract words, extract ID from path, check for hexa value
 chars = re.compile(r'\W+')
 pattid= re.compile(r'(\d{3})/(\d{3})/(\d{3})')
@@ -41,132 +48,88 @@ documents = 0
 terms = 0
 
 #
-# We will create a term object for each unique instance of a term
+# Create instance of the cached porterstemmer object, we will call the stemmer method in this
+# object to 'stem' the tokens extracted from the pages.  The stems of the words seen recently
+# are remembered so that the frequent words are only stemmed once
+#
+stemmer = CachedStemmer()
+
+#
+# With --positions the position of every occurrence of a term in the text of a page is kept
+# too, and written to PostingPositions for the phrase and proximity queries of the search engine
+#
+positional = False
+
+#
+# We will create a term object for each unique instance of a term.  Its postings are kept
+# in a growable array of unsigned ints holding docid, tf, docid, tf, ... and __slots__ keeps
+# the object itself small.  A page is indexed in full before the next one, so a posting is
+# either the last one of the array or a new one appended at the end.  The positions are
+# appended to a second array in the same order, the tf of a posting tells how many are its own
 #
 class Term():
-        termid = 0
-        termfreq = 0
-        docs = 0
-        docids = {}
+        __slots__ = ('termid', 'termfreq', 'docs', 'postings', 'positions')
+
+        def __init__(self):
+                self.termid = 0
+                self.termfreq = 0
+                self.docs = 0
+                self.postings = array('I')
+                self.positions = array('I') if positional else None
 
 # split on any chars
 def splitchars(line) :
         return chars.split(line)
 
-def stripTags(s): 
-    intag = False
-    s2 = ""    
-    for c in s:
-        if c == '<':
-            intag = True
-        elif c == '>':
-            intag = False
-        if intag != True:
-            s2 = s2+c      
-    return(s2)
-
-def printText(tags):
-        for tag in tags:
-                if tag.__class__ == NavigableString:
-                        print(tag)
-                else:
-                        printText(tag)
-        print("")
-
 
 # process the tokens of the source code
 def parsetoken(db, line):
         global documents
         global tokens
         global terms
-        #
-        # Create instance of the porterstemmer object we will call the stemmer method in this
-        # object to 'stem' the tokens extracted from the line.
-        #
-        p = PorterStemmer()
-
-        # this replaces any tab characters with a space character in the line
-        # read from the file
-        line = line.replace('\t',' ')
-        line = line.strip()
-        #line.encode('ascii', 'ignore')
 
         #
-        # This routine splits the contents of the line into tokens
-        l = splitchars(line)
-
-        # for each token in the line process 
-        for elmt in l:
-                # This statement removes the newline character if found 
-                elmt = elmt.replace('\n','')
-
-                # This statement converts all letters to lower case
-                lowerElmt = elmt.lower().strip()
-
-                #
-                # Increment the counter of the number of tokens processed.  This value will
-                # provide the total size of the corpus in terms of the number of terms in the
-                # entire collection
-                #
-                tokens += 1
-
-                # if the token is less than 2 characters in length we assume
-                # that it is not a valid term and ignore it
-                #
-                if len(lowerElmt) <2:
-                        continue
-
-                #
-                # if the token is in the stopwords list then do not include in the term
-                # dictionary and do not index the term.
-                #
-                if (lowerElmt in stopwords):
-                        continue
-
-                #
-                # This section of code will check to see if the term is a number and will not
-                # add a number to the index.  This is accomplished by attempting to convert
-                # the term into an integer and assigning it to a variable.  If the term is not
-                # a number meaning it contains non numeric characters this will fail and we can
-                # catch this error and continue processing the term.  If the term is a number
-                # it will not fail and we can then ignore the term (the continue statement will
-                # continue with the next item retrieved from the 'for' statement)
-                #
-                try:
-                    dummy = int(lowerElmt)               
-                except ValueError:
-                        # Value is not a number so we can index it
-                        stemword = lowerElmt 
-                else:
-                        # value is a number so we will NOT add it to the index
-                        continue
-
-                #
-                # In this following short section of the code we call the porter stemmer code
-                # that we have included in our indexer process.  This algorithm will stem the
-                # the tokens which will reduce the size of our data dictionary. 
-                #
-                lowerElmt = p.stem(stemword, 0,len(stemword)-1)
+        # The line goes through the tokenizer pipeline in a single pass: it is split into
+        # tokens converted to lower case, and the tokens of less than 2 characters, the
+        # stop words and the numbers are dropped.  The remaining tokens are stemmed with
+        # the porter stemmer which will reduce the size of our data dictionary.
+        #
+        counts = tokenizer.TokenCounts()
+        if positional:
+                stream = tokenizer.positionalterms((line,), stopwords, 2, stemmer.stem, counts)
+        else:
+                stream = ((term, None) for term in tokenizer.terms((line,), stopwords, 2, stemmer.stem, counts))
+        for lowerElmt, position in stream:
 
                 # if the term doesn't currently exist in the term dictionary
                 # then add the term 
-                if not (lowerElmt in db.keys()):
+                term = db.get(lowerElmt)
+                if term is None:
                         terms+=1
-                        db[lowerElmt] = Term()
-                        db[lowerElmt].termid = terms
-                        db[lowerElmt].docids = dict()
-                        db[lowerElmt].docs = 0
+                        term = db[lowerElmt] = Term()
+                        term.termid = terms
                   
                 # if the document is not currently in the postings
-                # list for the term then add it
+                # list for the term then add it, else increment the
+                # counter that tracks the term frequency
                 #
-                if not (documents in db[lowerElmt].docids.keys()):
-                        db[lowerElmt].docs += 1
-                        db[lowerElmt].docids[documents] = 0
-                        
-                # Increment the counter that tracks the term frequency 
-                db[lowerElmt].docids[documents] += 1
-        return l
+                pairs = term.postings
+                if pairs and pairs[-2] == documents:
+                        pairs[-1] += 1
+                else:
+                        pairs.append(documents)
+                        pairs.append(1)
+                        term.docs += 1
+                if positional:
+                        term.positions.append(position)
+
+        #
+        # Increment the counter of the number of tokens processed.  This value will
+        # provide the total size of the corpus in terms of the number of terms in the
+        # entire collection
+        #
+        tokens += counts.tokens
+        return counts
 
 #
 #  Create the inverted index tables.
@@ -175,34 +138,318 @@ def parsetoken(db, line):
 #  a integer assigned to each term by incrementing an integer
 #
 #  Insert a row into the posting table for each unique combination of Docid and termid
+#
+#  The rows are handed to the bulk index writer which inserts them in batches.  With the
+#  compressed format all of the postings of a term are written as a single blob instead
+#
+#  Insert a row into the DocumentStatistics table for each document with the norm of its
+#  tf-idf vector, its length and its number of unique terms
+#
+#  Insert a row into the PostingPositions table for each posting with its positions when
+#  the index is positional
 #        
-def writeindex(dbr):        
+def writeindex(writer, db):
+        # docid -> [sum of the squared tf-idf weights, length, unique terms]
+        statistics = {}
         for k in db.keys():
-                cur.execute('insert into TermDictionary values (?,?)', (k, db[k].termid))
+                writer.addterm(k, db[k].termid)
                 docfreq = db[k].docs
                 ratio = float(documents) / float(docfreq)
                 idf = math.log10(ratio)
 
-                for i in db[k].docids.keys():
-                        termfreq = db[k].docids[i]
+                for i, termfreq in zip(db[k].postings[0::2], db[k].postings[1::2]):
+                        if not (i in statistics):
+                                statistics[i] = [0.0, 0, 0]
+                        statistics[i][0] += (float(termfreq) * float(idf)) ** 2
+                        statistics[i][1] += termfreq
+                        statistics[i][2] += 1
+
+                if writer.positional:
+                        start = 0
+                        for i, termfreq in zip(db[k].postings[0::2], db[k].postings[1::2]):
+                                writer.addpositions(db[k].termid, i, encodepositions(db[k].positions[start:start + termfreq]))
+                                start += termfreq
+
+                if writer.compressed:
+                        if idf > 0:
+                                writer.addpostinglist(db[k].termid, docfreq, idf, encodepostings(zip(db[k].postings[0::2], db[k].postings[1::2])))
+                        continue
+
+                for i, termfreq in zip(db[k].postings[0::2], db[k].postings[1::2]):
                         tfidf = float(termfreq) * float(idf)
                         if tfidf > 0:
-                                cur.execute('insert into Posting values (?, ?, ?, ?, ?)', (db[k].termid, i, tfidf, docfreq, termfreq))
+                                writer.addposting(db[k].termid, i, tfidf, docfreq, termfreq)
 
+        for i in sorted(statistics):
+                writer.adddocumentstatistics(i, math.sqrt(statistics[i][0]), statistics[i][1], statistics[i][2])
 
+#
+#  The part of the index to add to a checkpoint of the crawl: the terms created since the
+#  previous checkpoint (their termid is larger than lastterms) and, for every term with postings
+#  of the documents indexed since (their docid is larger than lastdocuments), a chunk of these
+#  postings and of their positions as bytes
+#
+def checkpointindex(db, lastdocuments, lastterms):
+        newterms = []
+        chunks = []
+        for k, term in db.items():
+                if term.termid > lastterms:
+                        newterms.append((k, term.termid))
+                pairs = term.postings
+                if not pairs or pairs[-2] <= lastdocuments:
+                        continue
+                i = len(pairs)
+                while i > 0 and pairs[i - 2] > lastdocuments:
+                        i -= 2
+                positions = None
+                if positional:
+                        count = sum(pairs[i + 1::2])
+                        positions = term.positions[len(term.positions) - count:].tobytes()
+                chunks.append((k, pairs[i:].tobytes(), positions))
+        return newterms, chunks
 
+#
+#  Rebuild the in-memory index from the terms and the chunks of postings of a checkpoint
+#
+def restoreindex(db, newterms, chunks):
+        for k, termid in newterms:
+                term = db[k] = Term()
+                term.termid = termid
+        for k, pairs, positions in chunks:
+                term = db[k]
+                term.postings.frombytes(pairs)
+                term.docs = len(term.postings) // 2
+                if positional:
+                        term.positions.frombytes(positions)
 
-if __name__ == '__main__':
+#
+#  Crawl the starting web page and the links found in the pages until limit pages are indexed.
+#  The URLs to crawl are kept in the frontier (frontier.py), which a pool of worker tasks, one per
+#  request the fetcher runs at the same time, take the URLs from.  The frontier canonicalizes the
+#  URLs and queues a URL only once.  While a worker waits for its page the others fetch theirs,
+#  and every page is indexed as soon as it arrives.  The crawl ends when limit pages are indexed
+#  or when no URL is left to crawl
+#
+#  With a checkpoint (crawlstate.py) the state of the crawl is saved every interval pages, when
+#  the crawl ends and when it is interrupted.  resume is the (state, snapshot) of the checkpoint
+#  a crawl resumes from: the index and the documents are restored by the caller, the frontier
+#  and the counters of the crawl here
+#
+#  With fingerprints (a SimHashIndex of nearduplicates.py) a page that is a near-duplicate of a
+#  page already indexed is neither indexed nor counted, but its links are followed.  With
+#  duplicates='link' its URL is recorded in DocumentDuplicate with the DocId of the original
+#
+async def crawl(start, limit, fetcher, db, writer, order='fifo', bloom=0, checkpoint=None, interval=0, resume=None,
+                fingerprints=None, duplicates='skip'):
+        tocrawl = Frontier(order, bloom)    # contains the queue of url's that will be crawled, and the url's already seen
+        links_queue = 0                     # counts the number of links in the queue to limit the depth of the crawl
+        numberOfCrawls = 0                  # Track the number of crawls
+        numberOfDuplicates = 0              # Track the number of near-duplicate pages not indexed
+        if resume is not None:
+                state, snapshot = resume
+                tocrawl.restore(snapshot)
+                links_queue = state['links']
+                numberOfCrawls = state['crawls']
+                numberOfDuplicates = state['duplicates']
+                if numberOfCrawls >= limit:
+                        return numberOfCrawls
+        elif tocrawl.offer(start) is None:
+                print(f'Not an http URL: {start}')
+                return 0
+        finished = asyncio.Event()
+        inflight = set()                    # the url's taken from the queue whose pages are not indexed yet
+        pages = []                          # the pages indexed since the last checkpoint
+        duplicatepages = []                 # the near-duplicate pages linked since the last checkpoint
+        last = [documents, terms, numberOfCrawls]
 
-    #
-    # Get the starting URL to crawl
-    #
-    line = input("Enter URL to crawl (must be in the form http://www.domain.com): ")
-    inputNumberOfCrawls = int(input("Enter number of crawls: "))
+        #
+        # Save a checkpoint: the counters, the pages, terms and postings added since the last
+        # checkpoint, and the frontier with the url's in flight put back in the queue
+        #
+        def save():
+                newterms, chunks = checkpointindex(db, last[0], last[1])
+                state = {'documents': documents, 'terms': terms, 'tokens': tokens, 'crawls': numberOfCrawls, 'links': links_queue,
+                         'duplicates': numberOfDuplicates}
+                checkpoint.save(state, pages, newterms, chunks, tocrawl.snapshot(inflight), duplicatepages)
+                del pages[:]
+                del duplicatepages[:]
+                last[:] = [documents, terms, numberOfCrawls]
+
+        async def crawlpage(crawling):
+                global documents
+                nonlocal links_queue, numberOfCrawls, numberOfDuplicates
+
+                l = len(crawling)
+                ext = crawling[l-4:l]
+                if ext in ['.pdf', '.png', '.jpg', '.gif', '.asp']:
+                        return
+
+                #
+                # Parse the URL and fetch it.  The pages that cannot be fetched or do not
+                # answer with a success are skipped
+                #
+                url = urlparse(crawling)
+                try:
+                        response = await fetcher.fetch(crawling)
+                except FetchError:
+                        return
+                if not (200 <= response.status < 300) or numberOfCrawls >= limit:
+                        return
+
+                # the text of the paragraphs and the links of the page are extracted in a single pass
+                # (pageparser.py)
+                text, links = extract(response.body, response.headers.get('content-type'))
+
+                #
+                # Fingerprint the tokens of the page, and skip it when it is a near-duplicate of a
+                # page already indexed (a mirror, a printer friendly version, a session ID in the URL).
+                # A page with too little text to fingerprint (simhash() gives None) is always indexed
+                #
+                fingerprint = None
+                original = None
+                if fingerprints is not None:
+                        fingerprint = simhash(tokenizer.tokenize((text,)))
+                        if fingerprint is not None:
+                                original = fingerprints.find(fingerprint)
+                if original is not None:
+                        numberOfDuplicates += 1
+                        print(f'Near-duplicate of document {original}: {crawling}')
+                        if duplicates == 'link':
+                                writer.addduplicate(crawling, original)
+                                duplicatepages.append((crawling, original))
+                else:
+                        numberOfCrawls += 1
+                        print(f'Crawling to {url}')
+
+                        # pass the text to the parsetoken routine for indexing, its postings are recorded
+                        # under the DocId of the page
+                        documents += 1
+                        parsetoken(db, text)
+                        if fingerprint is not None:
+                                fingerprints.add(fingerprint, documents)
+                                writer.addsimhash(documents, fingerprint)
+
+                        #
+                        # For each unique instance of a document assign a document id (documents) and store in the documentdictionary
+                        #
+                        writer.adddocument(crawling, documents)
+                        pages.append((documents, crawling, fingerprint))
+                        if numberOfCrawls >= limit:
+                                finished.set()
+                                return
+
+                #
+                # Put the weblinks of the page in the stack to crawl through.  The links of a
+                # near-duplicate are followed too: a mirror can still lead to pages not seen yet
+                #
+
+                if links_queue < 500:
+                        for link in links:
+                                if tocrawl.offer(link, response.url) is not None:
+                                        links_queue += 1
+
+        # a worker also checks finished: asyncio.wait_for() can swallow the cancellation of a
+        # worker when its request completes at the same moment
+        async def worker():
+                while not finished.is_set():
+                        crawling = await tocrawl.get()
+                        inflight.add(crawling)
+                        try:
+                                await crawlpage(crawling)
+                        finally:
+                                inflight.discard(crawling)
+                                tocrawl.task_done()
+                        if checkpoint is not None and interval and numberOfCrawls - last[2] >= interval:
+                                save()
+
+        async def drained():
+                await tocrawl.join()
+                finished.set()
+
+        if checkpoint is not None and resume is None:
+                save()
+        tasks = [asyncio.create_task(worker()) for _ in range(fetcher.concurrency)]
+        tasks.append(asyncio.create_task(drained()))
+        try:
+                await finished.wait()
+        except asyncio.CancelledError:
+                # interrupted (Ctrl-C): the pages indexed so far are kept for --resume
+                if checkpoint is not None:
+                        save()
+                        print(f'Crawl interrupted after {numberOfCrawls} pages, checkpoint saved to {checkpoint.filename}')
+                raise
+        for task in tasks:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await fetcher.close()
+        inflight.clear()
+        if checkpoint is not None:
+                save()
+        print(tocrawl.stats())
+        if fingerprints is not None:
+                print(f'Near-duplicates: {numberOfDuplicates} pages not indexed, {fingerprints.compared} fingerprints compared')
+        return numberOfCrawls
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl a web site and build its inverted index into webcrawler.db')
+    parser.add_argument('--compressed', action='store_true', help='store each posting list as one compressed blob (PostingList table)')
+    parser.add_argument('--positions', action='store_true', help='also store the positions of the terms (PostingPositions table) for phrase and proximity queries')
+    parser.add_argument('--impacts', action='store_true', help='also store the quantized BM25 score of every posting (PostingImpact table)')
+    parser.add_argument('--k1', type=float, default=bm25.defaultk1, help='BM25 k1 of the impacts (default %(default)s)')
+    parser.add_argument('--b', type=float, default=bm25.defaultb, help='BM25 b of the impacts (default %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=32, help='number of pages fetched at the same time (default 32)')
+    parser.add_argument('--per-host', type=int, default=8, help='number of pages fetched at the same time from a host (default 8)')
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds before a request is abandoned (default 10)')
+    parser.add_argument('--retries', type=int, default=2, help='number of retries of a failed request (default 2)')
+    parser.add_argument('--order', choices=('fifo', 'priority'), default='fifo', help='order of the crawl: breadth first, or interleaving the hosts (default fifo)')
+    parser.add_argument('--bloom', type=int, default=0, metavar='URLS', help='remember the URLs seen in a Bloom filter sized for this many URLs instead of an exact set')
+    parser.add_argument('--duplicates', choices=('skip', 'link', 'index'), default='skip',
+                        help='near-duplicate pages: skip them, skip them but record their URL (DocumentDuplicate), or index them (default skip)')
+    parser.add_argument('--distance', type=int, default=defaultdistance, help='largest number of bits the SimHash fingerprints of near-duplicate pages differ in (default %(default)s)')
+    parser.add_argument('--checkpoint', default='webcrawler-checkpoint.db', metavar='FILE', help='file of the checkpoints of the crawl (default %(default)s)')
+    parser.add_argument('--checkpoint-every', type=int, default=1000, metavar='PAGES', help='save a checkpoint every this many pages, 0 for none (default %(default)s)')
+    parser.add_argument('--resume', action='store_true', help='resume the crawl of the last checkpoint instead of starting a new one')
+    args = parser.parse_args()
+    positional = args.positions
 
     # the database is a simple dictionnary 
     db = {}
 
+    #
+    # The crawl is checkpointed unless --checkpoint-every is 0.  A resumed crawl takes its start
+    # URL, its limit and its options from the checkpoint, and gets back the documents, the
+    # terms and the postings indexed so far
+    #
+    checkpoint = CrawlCheckpoint(args.checkpoint) if args.checkpoint_every > 0 or args.resume else None
+    resume = None
+    if args.resume:
+        if not checkpoint.exists():
+            parser.error(f'no checkpoint to resume from: {args.checkpoint}')
+        try:
+            state, documentrows, termrows, chunks, snapshot, duplicaterows = checkpoint.load()
+        except (ValueError, sqlite3.Error) as e:
+            parser.error(f'cannot resume from {args.checkpoint}: {e}')
+        line = state['start']
+        inputNumberOfCrawls = state['limit']
+        args.compressed, positional, args.impacts = bool(state['compressed']), bool(state['positions']), bool(state['impacts'])
+        args.k1, args.b, args.order, args.bloom = state['k1'], state['b'], snapshot['order'], state['bloom']
+        args.duplicates, args.distance = state['duplicatemode'], state['distance']
+        documents, terms, tokens = state['documents'], state['terms'], state['tokens']
+        restoreindex(db, termrows, chunks)
+        resume = (state, snapshot)
+        print(f'Resuming the crawl of {line} after {state["crawls"]} of {inputNumberOfCrawls} pages')
+    else:
+        #
+        # Get the starting URL to crawl
+        #
+        line = input("Enter URL to crawl (must be in the form http://www.domain.com): ")
+        inputNumberOfCrawls = int(input("Enter number of crawls: "))
+        if checkpoint is not None:
+            checkpoint.create({'start': line, 'limit': inputNumberOfCrawls, 'compressed': int(args.compressed), 'positions': int(positional),
+                               'impacts': int(args.impacts), 'k1': args.k1, 'b': args.b, 'bloom': args.bloom,
+                               'duplicatemode': args.duplicates, 'distance': args.distance})
+
     #
     # Capture the start time of the routine so that we can determine the total running
     # time required to process the corpus
@@ -211,122 +458,44 @@ if __name__ == '__main__':
     print('Start Time: %.2d:%.2d' % (t2.tm_hour, t2.tm_min))
     
     #
-    # Create a sqlite database to hold the inverted index.  The isolation_level statment turns
-    # on autocommit which means that changes made in the database are committed automatically
+    # Create a sqlite database to hold the inverted index.  The index writer loads the whole
+    # index in a single transaction with batched inserts
     #
     con = sqlite3.connect("webcrawler.db")
-    con.isolation_level = None
-    cur = con.cursor()
+    writer = IndexWriter(con, compressed=args.compressed, positional=positional, impacts=args.impacts, k1=args.k1, b=args.b,
+                         simhashes=args.duplicates != 'index')
 
     #
-    # In the following section three tables and their associated indexes will be created.
-    # Before we create the table or index we will attempt to drop any existing tables in
-    # case they exist
+    # The tables (DocumentDictionary, TermDictionary, Posting and DocumentStatistics) are dropped if they
+    # exist and created again.  Their indexes are only created once the rows are loaded
     #
-    # Document Dictionary Table 
-    cur.execute("drop table if exists DocumentDictionary")
-    cur.execute("drop index if exists idxDocumentDictionary")
-    cur.execute("create table if not exists DocumentDictionary (DocumentName text, DocId int)")
-    cur.execute("create index if not exists idxDocumentDictionary on DocumentDictionary (DocId)")
-
-    # Term Dictionary Table 
-    cur.execute("drop table if exists TermDictionary")
-    cur.execute("drop index if exists idxTermDictionary")
-    cur.execute("create table if not exists TermDictionary (Term text, TermId int)")
-    cur.execute("create index if not exists idxTermDictionary on TermDictionary (TermId)")
-        
-    # Postings Table
-    cur.execute("drop table if exists Posting")
-    cur.execute("drop index if exists idxPosting1")
-    cur.execute("drop index if exists idxPosting2")
-    cur.execute("create table if not exists Posting (TermId int, DocId int, tfidf real, docfreq int, termfreq int)")
-    cur.execute("create index if not exists idxPosting1 on Posting (TermId)")
-    cur.execute("create index if not exists idxPosting2 on Posting (Docid)")
-
+    writer.create()
     #
-    # Initialize variables  
+    # The fingerprints of the pages indexed so far, to find the near-duplicates of the pages to come
     #
-    crawled = ([])              # contains the list of pages that have already been crawled
-    tocrawl = [line]            # contains the queue of url's that will be crawled
-    links_queue = 0             # counts the number of links in the queue to limit the depth of the crawl
-    crawlcomplete = True        # Flat that will exit the while loop when the craw is finished
-    numberOfCrawls = 0          # Track the number of crawls
+    fingerprints = SimHashIndex(args.distance) if args.duplicates != 'index' else None
+    if resume is not None:
+        for docid, url, fingerprint in documentrows:
+            writer.adddocument(url, docid)
+            if fingerprints is not None and fingerprint is not None:
+                fingerprints.add(fingerprint, docid)
+                writer.addsimhash(docid, fingerprint)
+        for url, docid in duplicaterows:
+            writer.addduplicate(url, docid)
 
     #
-    # Crawl the starting web page and links in the web page up to the limit.
+    # Crawl the starting web page and links in the web page up to the limit.  The pages are
+    # fetched concurrently by the fetcher, which limits the requests per host, reuses the
+    # connections and retries the failed requests.  The frontier queues every canonical URL once
     #
-    #print(str(tocrawl)[1:-1])
-    while numberOfCrawls < inputNumberOfCrawls:
-        #
-        # Pop the top url off of the queue and process it. 
-        #
-        try:
-            crawling = tocrawl.pop()
-        except:
-            crawlcomplete = False
-            continue
-
-        l = len(crawling)
-        ext = crawling[l-4:l]
-        if ext in ['.pdf', '.png', '.jpg', '.gif', '.asp']:
-            crawled.append(crawling)
-            continue
-        
-        #
-        # Print the current length of the queue of URL's to crawl
-        #
-        print(f'current length of the queue of URLs to crawl -> {l}')
-
-        #
-        # Parse the URL and open it.
-        #
-        url = urlparse(crawling)
-        print(f'Crawling to {url}')
-        try:
-            response = urllib.request.urlopen(crawling).read()   
-            numberOfCrawls += 1         
-        except:
-            continue
-        
-        #
-        # Use BeautifulSoup modules to format web page as text that can
-        # be parsed and indexed
-        #
-        soup = BeautifulSoup(response,'html.parser')
-        paragraphs = soup.findAll("p")
-        tok=""
-        for para in paragraphs:
-            tok=tok + para.get_text(' ', strip=True)
-            allP = soup.findAll("p", text=re.compile("."))
-            for p in allP:
-                tok += u' '.join(p.stripped_strings)
-        
-        # pass the text extracted from the web page to the parsetoken routine for indexing
-        parsetoken(db, tok)
-        documents += 1
-
-        #
-        # For each unique instance of a document assign a document id (documents) and store in the documentdictionary
-        #
-        cur.execute("insert into DocumentDictionary values (?, ?)", (documents, crawling))
-               
-        #
-        # Find all of the weblinks on the page put them in the stack to crawl through
-        #
-        if links_queue < 500:
-            links = re.findall(r'''href=["'](.[^"']+)["']''', response.decode('iso-8859-1'), re.I)
-            for link in (links.pop(0) for _ in range(len(links))):
-                if link.startswith('/'):
-                    link = 'http://' + url[1] + link
-                elif link.startswith('#'):
-                    link = 'http://' + url[1] + url[2] + link
-                elif not link.startswith('http'):
-                    link = 'http://' + url[1] + '/' + link
-                if link not in crawled:
-                    links_queue += 1
-                    tocrawl.append(link)
-
-        crawled.append(crawling)
+    fetcher = Fetcher(args.concurrency, args.per_host, args.timeout, args.retries)
+    try:
+        asyncio.run(crawl(line, inputNumberOfCrawls, fetcher, db, writer, args.order, args.bloom, checkpoint, args.checkpoint_every, resume,
+                          fingerprints, args.duplicates))
+    except KeyboardInterrupt:
+        con.close()
+        sys.exit(1)
+    print(fetcher.stats())
 
     #
     # Display the time that the indexing process is complete, and the process of writing
@@ -337,14 +506,18 @@ if __name__ == '__main__':
     #
     # Write the inverted index to disk
     #
-    writeindex(db)
+    writeindex(writer, db)
 
     #
-    # Commit and close the database 
+    # Build the indexes, commit and close the database 
     #
-    con.commit()
+    writer.close()
     con.close()
 
+    # the index is complete: the checkpoints of the crawl are not needed anymore
+    if checkpoint is not None:
+        checkpoint.remove()
+
     #
     # Print processing statistics
     # Documents - every document opened and read by the indexer
@@ -353,5 +526,6 @@ if __name__ == '__main__':
     print("Documents %i" % documents)
     print("Terms %i" % terms)
     print("Tokens %i" % tokens)
+    print(stemmer.stats())
     t2 = time.localtime()   
     print('End Time: %.2d:%.2d' % (t2.tm_hour, t2.tm_min))
\ No newline at end of file